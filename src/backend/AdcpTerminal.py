@@ -7,6 +7,7 @@ import logging
 from obsub import event
 from threading import Lock
 from rti_python.Utilities.config import RtiConfig
+from Snapshot import Snapshot
 
 
 class AdcpTerminalVM:
@@ -33,6 +34,12 @@ class AdcpTerminalVM:
 
         self.serialTextBrowser = ""
 
+        # Increased each time the terminal text, the connection or the comm settings change
+        self.version = 0
+
+        # Terminal data of the latest version
+        self.snapshot = Snapshot(-1)
+
         self.thread_lock = Lock()
 
     def comm_port_list(self):
@@ -50,26 +57,59 @@ class AdcpTerminalVM:
         """
         return adcp_serial.get_baud_rates()
 
-    def get_data(self):
-
-        # Lock the object
-        self.thread_lock.acquire()
-
-        is_connected = False
-        if self.adcp:
-            is_connected = True
+    def set_changed(self):
+        """
+        Increase the version after the terminal text, the connection or
+        the comm settings change, so the next get_snapshot() creates a
+        new snapshot.  Call this after the change.
+        :return:
+        """
+        self.version += 1
 
-        term_data = {
-            "isConnected": is_connected,
-            "termData": self.serialTextBrowser,
-            "baud": self.rti_config.config['Comm']['Baud'],
-            "commPort": self.rti_config.config['Comm']['Port']
-        }
+    def get_version(self):
+        """
+        Get the version of the terminal data.
+        :return: Version number.
+        """
+        return self.version
 
-        # Release lock
-        self.thread_lock.release()
+    def get_snapshot(self):
+        """
+        Get the snapshot of the terminal data.  A new snapshot is only
+        created when the version changed.
+        :return: Snapshot.
+        """
+        snapshot = self.snapshot
+        if snapshot.version != self.version:
+            # Lock the object
+            with self.thread_lock:
+                # Read the version first, so a change made while the data
+                # is read is in the next snapshot
+                version = self.version
+                if self.snapshot.version != version:
+                    is_connected = False
+                    if self.adcp:
+                        is_connected = True
+
+                    self.snapshot = Snapshot(version, {
+                        "isConnected": is_connected,
+                        "termData": self.serialTextBrowser,
+                        "baud": self.rti_config.config['Comm']['Baud'],
+                        "commPort": self.rti_config.config['Comm']['Port']
+                    })
+                snapshot = self.snapshot
+
+        return snapshot
+
+    def get_data(self, is_packed: bool = False):
+        """
+        Get the terminal data.
+        :param is_packed: Get the data encoded with msgpack.
+        :return: Terminal data.
+        """
+        term_data = self.get_snapshot().get_payload(None, lambda data: data, is_packed)
 
-        logging.info(term_data)
+        logging.debug(term_data)
 
         return term_data
 
@@ -85,19 +125,24 @@ class AdcpTerminalVM:
         self.rti_config.config['Comm']['Port'] = port
         self.rti_config.config['Comm']['Baud'] = str(baud)
         self.rti_config.write()
+        self.set_changed()
 
         try:
             self.adcp = adcp_serial.AdcpSerialPort(port, baud)
+            self.set_changed()
         except ValueError as ve:
             self.serialTextBrowser += "Error opening serial port. " + str(ve)
+            self.set_changed()
             logging.error("Error opening serial port. " + str(ve))
             return
         except serial.SerialException as se:
             self.serialTextBrowser += "Error opening serial port. " + str(se)
+            self.set_changed()
             logging.error("Error opening serial port. " + str(se))
             return
         except Exception as e:
             self.serialTextBrowser += "Error opening serial port. " + str(e)
+            self.set_changed()
             logging.error("Error opening serial port. " + str(e))
             return
 
@@ -118,6 +163,7 @@ class AdcpTerminalVM:
             self.adcp = None
 
         self.serialTextBrowser += "Serial Disconnect."
+        self.set_changed()
         logging.info("Serial Disconnect")
 
     def serial_break(self):
@@ -127,6 +173,7 @@ class AdcpTerminalVM:
         """
         # Clear the display
         self.serialTextBrowser = ""
+        self.set_changed()
 
         # Send a BREAK
         if self.adcp:
@@ -159,6 +206,7 @@ class AdcpTerminalVM:
         """
         if self.adcp:
             self.serialTextBrowser = ""
+            self.set_changed()
             self.adcp.stop_pinging()
             logging.info("Stop Pinging")
 
@@ -223,6 +271,7 @@ class AdcpTerminalVM:
 
     def clear_console(self):
         self.serialTextBrowser = ""
+        self.set_changed()
 
     def clear_bulk_cmd(self):
         self.bulkCmdMlainTextEdit = ""
@@ -271,6 +320,9 @@ def thread_worker(vm):
                 if len(vm.serialTextBrowser) > 5000:
                     vm.serialTextBrowser = vm.serialTextBrowser[-5000]
 
+                # Display the new text
+                vm.set_changed()
+
                 # Record data if turned on
                 vm.record_data(data)
 
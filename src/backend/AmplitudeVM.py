@@ -1,18 +1,35 @@
 from threading import Lock
 import logging
+import numpy as np
 from rti_python.Ensemble.Ensemble import Ensemble
+from EnsembleValues import EnsembleValues
+from RingBuffer import RingBuffer
+from Snapshot import Snapshot
+from PlotPayload import PlotPayload
 
 
 class AmplitudeVM:
+    """
+    Amplitude profile of the latest ensemble.
 
-    def __init__(self):
+    The profile can be averaged over the last N ensembles.  A running
+    sum and count of the good values is kept, so adding an ensemble only
+    adds the new profile and removes the oldest one.
+    """
+
+    MAX_BEAMS = 4
+
+    def __init__(self, avg_count: int = 1):
+        """
+        Initialize the profile.
+        :param avg_count: Number of ensembles to average.  1 for the latest ensemble only.
+        """
         self.NumBeams = 4
         self.NumBins = 0
-        self.BinData = []
-        self.Beam0Data = []
-        self.Beam1Data = []
-        self.Beam2Data = []
-        self.Beam3Data = []
+        self.avg_count = max(1, avg_count)
+        self.history = self.create_history(0)                                      # Last N profiles, bad values are NaN
+        self.amp_sum = np.zeros((0, AmplitudeVM.MAX_BEAMS))                         # Sum of the good values
+        self.amp_good = np.zeros((0, AmplitudeVM.MAX_BEAMS), dtype=np.int64)        # Number of good values
         self.IsVertAvail = False
         self.VertData = []
         self.IsUpward = False
@@ -20,6 +37,10 @@ class AmplitudeVM:
         self.MaxBinDepth = 0.0
         self.thread_lock = Lock()
 
+        # Latest structure for get_data(), published at the end of each batch
+        self.snapshot = Snapshot(0)
+        self.publish_snapshot()
+
     def set_ens(self, ens: Ensemble):
         """
         Get the data out of the ensemble and populate
@@ -32,8 +53,34 @@ class AmplitudeVM:
         :return:
         """
         # Lock the object
-        self.thread_lock.acquire()
+        with self.thread_lock:
+            self.process_ens(ens)
+            self.publish_snapshot()
 
+    def set_ens_batch(self, ens_list):
+        """
+        Set a batch of ensembles.  The lock is only taken once
+        for the batch.  Only the ensembles that are in the
+        average are used.
+        :param ens_list: List of ensembles.
+        :return:
+        """
+        if not ens_list:
+            return
+
+        # Lock the object
+        with self.thread_lock:
+            for ens in ens_list[-self.avg_count:]:
+                self.process_ens(ens)
+            self.publish_snapshot()
+
+    def process_ens(self, ens: Ensemble):
+        """
+        Get the data out of the ensemble and populate
+        the structure.  The lock must be held.
+        :param ens: Latest ensemble.
+        :return:
+        """
         # Get the number of beams
         if ens.IsEnsembleData:
             self.NumBeams = ens.EnsembleData.NumBeams
@@ -47,88 +94,151 @@ class AmplitudeVM:
             # Set the number of bins
             self.NumBins = ens.EnsembleData.NumBins
 
-            # Clear the current array
-            self.BinData.clear()
-            self.Beam0Data.clear()
-            self.Beam1Data.clear()
-            self.Beam2Data.clear()
-            self.Beam3Data.clear()
-
-            # Set the new bin data
-            for bin_num in range(ens.EnsembleData.NumBins):
-                self.BinData.append(bin_num)
-                # Init the beam data
-                self.Beam0Data.append(0)
-                self.Beam1Data.append(0)
-                self.Beam2Data.append(0)
-                self.Beam3Data.append(0)
+            # The old profiles can not be averaged with the new bins
+            self.clear_average()
 
         # Get Min and max bin depth
         self.MinBinDepth = Ensemble.get_bin_depth(ens.AncillaryData.FirstBinRange, ens.AncillaryData.BinSize, 0)
         self.MaxBinDepth = Ensemble.get_bin_depth(ens.AncillaryData.FirstBinRange, ens.AncillaryData.BinSize, ens.EnsembleData.NumBins)
 
         # Set Data
-        for bin_num in range(ens.EnsembleData.NumBins):
-            # Beam 0
-            if self.NumBeams > 0:
-                if not Ensemble.is_bad_velocity(ens.Amplitude.Amplitude[bin_num][0]):
-                    self.Beam0Data[bin_num] = ens.Amplitude.Amplitude[bin_num][0]
-                else:
-                    self.Beam0Data[bin_num] = 0.0
-            # Beam 1
-            if self.NumBeams > 1:
-                if not Ensemble.is_bad_velocity(ens.Amplitude.Amplitude[bin_num][1]):
-                    self.Beam1Data[bin_num] = ens.Amplitude.Amplitude[bin_num][1]
-                else:
-                    self.Beam1Data[bin_num] = 0.0
-            # Beam 2
-            if self.NumBeams > 2:
-                if not Ensemble.is_bad_velocity(ens.Amplitude.Amplitude[bin_num][2]):
-                    self.Beam2Data[bin_num] = ens.Amplitude.Amplitude[bin_num][2]
-                else:
-                    self.Beam2Data[bin_num] = 0.0
-            # Beam 3
-            if self.NumBeams > 3:
-                if not Ensemble.is_bad_velocity(ens.Amplitude.Amplitude[bin_num][3]):
-                    self.Beam3Data[bin_num] = ens.Amplitude.Amplitude[bin_num][3]
-                else:
-                    self.Beam3Data[bin_num] = 0.0
-
-        # Release the lock
-        self.thread_lock.release()
-
-    def get_data(self):
+        values = np.full((self.NumBins, AmplitudeVM.MAX_BEAMS), np.nan)
+        if ens.IsAmplitude:
+            EnsembleValues.copy_bins(values[:, :min(self.NumBeams, AmplitudeVM.MAX_BEAMS)], ens.Amplitude.Amplitude)
+            values[EnsembleValues.is_bad(values)] = np.nan
+
+        self.add_profile(values)
+
+    def add_profile(self, values):
+        """
+        Add the profile to the running sum.  If the average
+        is full, the oldest profile is removed.  The lock must be held.
+        :param values: Numpy array of bins x beams.  Bad values are NaN.
+        :return:
+        """
+        is_good = ~np.isnan(values)
+
+        if len(self.history) == self.avg_count:
+            oldest = self.history.view()[0]
+            is_old_good = ~np.isnan(oldest)
+            self.amp_sum -= np.where(is_old_good, oldest, 0.0)
+            self.amp_good -= is_old_good
+
+        self.history.append(values)
+        self.amp_sum += np.where(is_good, values, 0.0)
+        self.amp_good += is_good
+
+    def get_profile(self):
+        """
+        Get the average of the good values for each bin and beam.
+        If there are no good values, the value is 0.0.  The lock must be held.
+        :return: Numpy array of bins x beams.
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.amp_good > 0, self.amp_sum / self.amp_good, 0.0)
+
+    def set_avg_count(self, avg_count: int):
+        """
+        Set the number of ensembles to average.  The
+        average starts over with the next ensemble.
+        :param avg_count: Number of ensembles to average.  1 for the latest ensemble only.
+        :return:
+        """
+        # Lock the object
+        with self.thread_lock:
+            self.avg_count = max(1, avg_count)
+            self.clear_average()
+            self.publish_snapshot()
+
+    def clear_average(self):
+        """
+        Clear the profiles in the average.  The lock must be held.
+        :return:
+        """
+        self.history = self.create_history(self.NumBins)
+        self.amp_sum = np.zeros((self.NumBins, AmplitudeVM.MAX_BEAMS))
+        self.amp_good = np.zeros((self.NumBins, AmplitudeVM.MAX_BEAMS), dtype=np.int64)
+
+    def create_history(self, num_bins: int):
+        """
+        Create the buffer of the profiles in the average.
+        :param num_bins: Number of bins.
+        :return: RingBuffer of bins x beams.
+        """
+        return RingBuffer(self.avg_count, np.float64, (num_bins, AmplitudeVM.MAX_BEAMS))
+
+    def get_version(self):
+        """
+        Get the version of the data.  The version increases at the
+        end of each batch and when the options change.
+        :return: Version number.
+        """
+        return self.snapshot.version
+
+    def get_data(self, fmt: str = PlotPayload.FORMAT_LIST, is_packed: bool = False):
         """
         Populate the structure.
 
-        Lock and unlock when getting the data to ensure
-        when new data is received, it is not being used with
-        old data.
+        The structure is built from the latest snapshot, so the lock is
+        not needed.  The structure is reused until the next snapshot.
+        :param fmt: Format of the values, list or binary.  See PlotPayload.
+        :param is_packed: Get the structure encoded with msgpack.
         :return: Structure with all the latest ensemble data
         """
+        fmt = PlotPayload.check_format(fmt)
+        amp_data = self.snapshot.get_payload(fmt, lambda data: AmplitudeVM.get_amp_data(data, fmt), is_packed)
 
-        # Lock the object
-        self.thread_lock.acquire()
+        logging.debug(amp_data)
+
+        return amp_data
 
-        # Populate the structure
-        amp_data = {
+    def publish_snapshot(self):
+        """
+        Publish the profile for get_data().  The lock must be held.
+        :return:
+        """
+        self.snapshot = self.snapshot.next({
             "numBeams": self.NumBeams,
             "numBins": self.NumBins,
-            "binData": self.BinData,
-            "beam0Data": self.Beam0Data,
-            "beam1Data": self.Beam1Data,
-            "beam2Data": self.Beam2Data,
-            "beam3Data": self.Beam3Data,
+            "profile": self.get_profile().T.copy(),
+            "avgCount": self.avg_count,
+            "numAvg": len(self.history),
             "isUpward": self.IsUpward,
             "minBinDepth": self.MinBinDepth,
             "maxBinDepth": self.MaxBinDepth,
             "isVertAvail": self.IsVertAvail,
-            "vertData": self.VertData,
-        }
+            "vertData": np.array(self.VertData, dtype=np.float64),
+        })
 
-        # Release the lock
-        self.thread_lock.release()
-
-        logging.debug(amp_data)
-
-        return amp_data
+    @staticmethod
+    def get_amp_data(data, fmt: str = PlotPayload.FORMAT_LIST):
+        """
+        Populate the structure from the snapshot data.
+        :param data: Snapshot data.
+        :param fmt: Format of the values, list or binary.
+        :return: Structure with the data.
+        """
+        profile = data["profile"]
+        if fmt == PlotPayload.FORMAT_BINARY:
+            beams = [PlotPayload.to_binary(beam, PlotPayload.FLOAT32) for beam in profile]
+            vert_data = PlotPayload.to_binary(data["vertData"], PlotPayload.FLOAT32)
+        else:
+            beams = profile.tolist()
+            vert_data = data["vertData"].tolist()
+
+        return {
+            "numBeams": data["numBeams"],
+            "numBins": data["numBins"],
+            "binData": list(range(data["numBins"])),
+            "beam0Data": beams[0],
+            "beam1Data": beams[1],
+            "beam2Data": beams[2],
+            "beam3Data": beams[3],
+            "avgCount": data["avgCount"],
+            "numAvg": data["numAvg"],
+            "isUpward": data["isUpward"],
+            "minBinDepth": data["minBinDepth"],
+            "maxBinDepth": data["maxBinDepth"],
+            "isVertAvail": data["isVertAvail"],
+            "vertData": vert_data,
+        }
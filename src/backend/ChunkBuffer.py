@@ -0,0 +1,188 @@
+import copy
+import numpy as np
+
+
+class ChunkBuffer:
+    """
+    Fixed size buffer of the latest rows, stored in chunks of
+    preallocated numpy arrays.
+
+    Rows are only added after the last row written.  A row is never
+    written again, so the rows already in the buffer do not change
+    while rows are added.  A full chunk is made read only.  snapshot()
+    shares the chunks instead of copying the rows.
+
+    The oldest chunk is removed once all of its rows are older than the
+    capacity, so the buffer holds at most the capacity plus one chunk
+    of rows.  get() is a numpy view if the rows are in one chunk,
+    otherwise the chunks are copied into one array.
+
+    The rows can be a structured dtype with a column per value, or
+    a shape for each row like the bins of an ensemble.
+    """
+
+    # Number of rows in each chunk
+    DEFAULT_CHUNK_SIZE = 256
+
+    def __init__(self, capacity: int, dtype, shape=(), chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Create the buffer.
+        :param capacity: Maximum number of rows.
+        :param dtype: Numpy dtype of a row.
+        :param shape: Shape of each row.
+        :param chunk_size: Number of rows in each chunk.
+        """
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.capacity = max(1, int(capacity))
+        self.chunk_size = max(1, int(chunk_size))
+        self.chunks = []                    # Full chunks from the oldest to the latest
+        self.latest_chunk = self.create_chunk()
+        self.latest_count = 0               # Number of rows in the latest chunk
+        self.start = 0                      # First row of the buffer in the oldest chunk
+        self.count = 0                      # Number of rows in the buffer
+        self.total = 0                      # Number of rows ever written
+
+    def create_chunk(self):
+        """
+        Create the array for a chunk of rows.
+        :return: Numpy array.
+        """
+        return np.empty((self.chunk_size,) + self.shape, dtype=self.dtype)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, row):
+        """
+        Add a row.  The oldest row is removed if the buffer is full.
+        :param row: Row to add.
+        :return:
+        """
+        self.latest_chunk[self.latest_count] = row
+        self.latest_count += 1
+        if self.latest_count == self.chunk_size:
+            self.close_chunk()
+
+        self.count += 1
+        self.total += 1
+        self.remove_old()
+
+    def extend(self, rows):
+        """
+        Add the rows in order.  The oldest rows are removed if the buffer is full.
+        :param rows: Numpy array of rows.
+        :return:
+        """
+        num_rows = len(rows)
+
+        # Only the latest rows will fit
+        index = max(0, num_rows - self.capacity)
+        while index < num_rows:
+            num_copy = min(self.chunk_size - self.latest_count, num_rows - index)
+            self.latest_chunk[self.latest_count:self.latest_count + num_copy] = rows[index:index + num_copy]
+            self.latest_count += num_copy
+            if self.latest_count == self.chunk_size:
+                self.close_chunk()
+
+            self.count += num_copy
+            self.remove_old()
+            index += num_copy
+
+        self.total += num_rows
+
+    def close_chunk(self):
+        """
+        Make the full latest chunk read only and start a new chunk.
+        :return:
+        """
+        self.latest_chunk.flags.writeable = False
+        self.chunks.append(self.latest_chunk)
+        self.latest_chunk = self.create_chunk()
+        self.latest_count = 0
+
+    def remove_old(self):
+        """
+        Remove the rows older than the capacity and the chunks
+        that only have removed rows.
+        :return:
+        """
+        if self.count > self.capacity:
+            self.start += self.count - self.capacity
+            self.count = self.capacity
+
+        while self.chunks and self.start >= self.chunk_size:
+            self.chunks.pop(0)
+            self.start -= self.chunk_size
+
+    def get(self, start: int = 0, stop: int = None):
+        """
+        Get the rows from the oldest to the latest.  The indexes are
+        like a slice, so negative indexes count from the latest row.
+        The rows are read only.
+        :param start: First row.
+        :param stop: End row (exclusive).  None for the latest row.
+        :return: Numpy array of the rows.
+        """
+        start, stop, _ = slice(start, stop).indices(self.count)
+        if stop <= start:
+            return np.empty((0,) + self.shape, dtype=self.dtype)
+
+        pieces = self.chunks + [self.latest_chunk[:self.latest_count]]
+        first = self.start + start
+        last = self.start + stop
+        first_chunk = first // self.chunk_size
+        last_chunk = (last - 1) // self.chunk_size
+
+        if first_chunk == last_chunk:
+            offset = first_chunk * self.chunk_size
+            rows = pieces[first_chunk][first - offset:last - offset]
+        else:
+            rows = np.concatenate([pieces[index][max(0, first - index * self.chunk_size):last - index * self.chunk_size]
+                                   for index in range(first_chunk, last_chunk + 1)])
+        rows.flags.writeable = False
+        return rows
+
+    def snapshot(self):
+        """
+        Get a read only copy of the buffer that shares the rows with the
+        buffer.  Only the list of chunks is copied, so the copy is cheap
+        and can be read without the lock while rows are added to the buffer.
+        :return: ChunkBuffer.  Rows can not be added to it.
+        """
+        snapshot = copy.copy(self)
+        snapshot.chunks = list(self.chunks)
+        snapshot.latest_chunk = self.latest_chunk[:self.latest_count]
+        snapshot.latest_chunk.flags.writeable = False
+        return snapshot
+
+    def resize(self, capacity: int):
+        """
+        Change the maximum number of rows.  The latest rows are kept.
+        :param capacity: Maximum number of rows.
+        :return:
+        """
+        capacity = max(1, int(capacity))
+        if capacity == self.capacity:
+            return
+
+        rows = self.get(-capacity)
+        total = self.total
+
+        self.clear()
+        self.capacity = capacity
+        self.extend(rows)
+        self.total = total
+
+    def clear(self):
+        """
+        Remove all the rows.  A new chunk is used, so the rows
+        already read do not change.
+        :return:
+        """
+        self.chunks = []
+        self.latest_chunk = self.create_chunk()
+        self.latest_count = 0
+        self.start = 0
+        self.count = 0
+        self.total = 0
@@ -0,0 +1,234 @@
+import numpy as np
+
+
+class ContourPyramid:
+    """
+    Level of detail pyramid of the bin values of a contour type.
+
+    Level 1 combines every 2 ensembles, level 2 every 4 ensembles,
+    level 3 every 8 ensembles and so on.  Each level keeps the sum,
+    the number of good values and the max of the combined ensembles.
+    When a column is complete in one level, it is combined with the
+    column waiting in the next level, so adding an ensemble is
+    amortized O(1).
+
+    The mean is only divided out when a level is read.  Averaging the
+    means of 2 columns would weight each value by how many good values
+    were next to it, so a bin with bad values in some ensembles would
+    be biased at the coarse levels.
+
+    Each level holds as many columns as are needed to cover the
+    ensembles displayed, so a zoomed out view can be answered from a
+    coarse level without going through every ensemble.  Together the
+    levels hold about as many columns as there are ensembles displayed.
+    """
+
+    def __init__(self, max_ens: int, num_bins: int, ens_dtype):
+        """
+        Create the levels.
+        :param max_ens: Number of ensembles displayed.
+        :param num_bins: Number of bins.
+        :param ens_dtype: Numpy dtype of the values for each ensemble.  The first field is the time.
+        """
+        self.ens_dtype = np.dtype(ens_dtype)
+        self.levels = []
+        level_ens = max_ens // 2
+        while level_ens >= 1:
+            self.levels.append(ContourLevel(level_ens, num_bins, self.ens_dtype))
+            level_ens //= 2
+
+        # Column waiting to be combined in each level
+        self.pending = [None] * len(self.levels)
+
+        # Number of ensembles added
+        self.total = 0
+
+    def append(self, values, ens_row):
+        """
+        Add an ensemble.
+        :param values: Numpy array of the value of each bin.
+        :param ens_row: Values of the ensemble as a tuple in the ens_dtype order.
+        :return:
+        """
+        self.total += 1
+        column = self.create_column(values, ens_row)
+
+        for index, level in enumerate(self.levels):
+            if self.pending[index] is None:
+                self.pending[index] = column
+                return
+
+            column = ContourPyramid.combine(self.pending[index], column)
+            self.pending[index] = None
+            level.append(column)
+
+    def extend(self, values, ens_rows):
+        """
+        Add the ensembles in order.
+        :param values: Numpy array of ensembles x bins.
+        :param ens_rows: Numpy array of ensembles in the ens_dtype.
+        :return:
+        """
+        for index in range(len(values)):
+            self.append(values[index], ens_rows[index].item())
+
+    def get_level(self, level: int):
+        """
+        Get a level of the pyramid.
+        :param level: 1 for every 2 ensembles, 2 for every 4 ensembles and so on.
+        :return: ContourLevel.
+        """
+        return self.levels[level - 1]
+
+    @staticmethod
+    def get_num_levels(max_ens: int):
+        """
+        Get the number of levels of a pyramid.
+        :param max_ens: Number of ensembles displayed.
+        :return: Number of levels.
+        """
+        return max(0, int(max_ens).bit_length() - 1)
+
+    def get_tail_size(self, level: int):
+        """
+        Get the number of the latest ensembles that are not yet in a complete column of the level.
+        :param level: 1 for every 2 ensembles, 2 for every 4 ensembles and so on.
+        :return: Number of ensembles.
+        """
+        return self.total % (2 ** level)
+
+    def create_column(self, values, ens_row):
+        """
+        Create the column of one ensemble.  NaN values are not counted.
+        :param values: Numpy array of the value of each bin.
+        :param ens_row: Values of the ensemble as a tuple in the ens_dtype order.
+        :return: Column of (sum, count, max, ens sum, ens count).
+        """
+        ens = np.array([ens_row], dtype=self.ens_dtype)
+        names = self.ens_dtype.names[1:]
+        ens_count = np.array([not np.isnan(ens[name][0]) for name in names], dtype=np.int32)
+        for name in names:
+            ens[name] = np.nan_to_num(ens[name], nan=0.0)
+
+        is_good = ~np.isnan(values)
+        return (np.where(is_good, values, 0.0).astype(np.float32),
+                is_good.astype(np.int32),
+                values.astype(np.float32),
+                ens,
+                ens_count)
+
+    @staticmethod
+    def combine(first, second):
+        """
+        Combine 2 columns.  The sums and the counts are added.
+        The time of the first column is used.
+        :param first: Older column of (sum, count, max, ens sum, ens count).
+        :param second: Newer column of (sum, count, max, ens sum, ens count).
+        :return: Combined column of (sum, count, max, ens sum, ens count).
+        """
+        ens = first[3].copy()
+        for name in ens.dtype.names[1:]:
+            ens[name] = first[3][name] + second[3][name]
+
+        return (first[0] + second[0],
+                first[1] + second[1],
+                np.fmax(first[2], second[2]),
+                ens,
+                first[4] + second[4])
+
+
+class ContourLevel:
+    """
+    One level of the ContourPyramid.  Each column is the sum, the
+    number of good values and the max of the ensembles combined.
+
+    The columns are kept in preallocated arrays.  The oldest column
+    is written over when the level is full, and the columns are
+    found with their index modulo the capacity.
+    """
+
+    def __init__(self, max_columns: int, num_bins: int, ens_dtype):
+        """
+        Create the arrays of the level.
+        :param max_columns: Number of columns kept.
+        :param num_bins: Number of bins.
+        :param ens_dtype: Numpy dtype of the values for each ensemble.
+        """
+        self.capacity = max(1, int(max_columns))
+        self.sum = np.empty((self.capacity, num_bins), dtype=np.float32)
+        self.count = np.empty((self.capacity, num_bins), dtype=np.int32)
+        self.max = np.empty((self.capacity, num_bins), dtype=np.float32)
+        self.ens_sum = np.empty(self.capacity, dtype=ens_dtype)
+        self.ens_count = np.empty((self.capacity, len(ens_dtype.names) - 1), dtype=np.int32)
+        self.head = 0                       # Next slot to write
+        self.num_columns = 0                # Number of columns in the level
+
+    def __len__(self):
+        return self.num_columns
+
+    def append(self, column):
+        """
+        Add a column.  The oldest column is removed if the level is full.
+        :param column: Column of (sum, count, max, ens sum, ens count).
+        :return:
+        """
+        self.sum[self.head] = column[0]
+        self.count[self.head] = column[1]
+        self.max[self.head] = column[2]
+        self.ens_sum[self.head] = column[3][0]
+        self.ens_count[self.head] = column[4]
+
+        self.head = (self.head + 1) % self.capacity
+        self.num_columns = min(self.num_columns + 1, self.capacity)
+
+    def get_slots(self, start: int, stop: int):
+        """
+        Get the slots of the columns from the oldest to the latest.
+        :param start: First column.
+        :param stop: End column (exclusive).  None for the latest column.
+        :return: Numpy array of slots.
+        """
+        start, stop, _ = slice(start, stop).indices(self.num_columns)
+        return (self.head - self.num_columns + np.arange(start, max(start, stop))) % self.capacity
+
+    def get_times(self):
+        """
+        Get the time of each column.  The time of the first ensemble combined is used.
+        :return: Numpy array of times.
+        """
+        return self.ens_sum['time'][self.get_slots(0, None)]
+
+    def get_mean(self, start: int, stop: int):
+        """
+        Get the mean of the columns.
+        :param start: First column.
+        :param stop: End column (exclusive).
+        :return: Numpy array of columns x bins.  NaN if no value was good.
+        """
+        slots = self.get_slots(start, stop)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (self.sum[slots] / self.count[slots]).astype(np.float32)
+
+    def get_max(self, start: int, stop: int):
+        """
+        Get the max of the columns.
+        :param start: First column.
+        :param stop: End column (exclusive).
+        :return: Numpy array of columns x bins.  NaN if no value was good.
+        """
+        return self.max[self.get_slots(start, stop)]
+
+    def get_ens(self, start: int, stop: int):
+        """
+        Get the mean of the ensemble values of the columns.
+        :param start: First column.
+        :param stop: End column (exclusive).
+        :return: Numpy array of the ensemble values.  NaN if no value was good.
+        """
+        slots = self.get_slots(start, stop)
+        ens = self.ens_sum[slots]
+        count = self.ens_count[slots]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for index, name in enumerate(ens.dtype.names[1:]):
+                ens[name] = ens[name] / count[:, index]
+        return ens
@@ -1,25 +1,96 @@
 from threading import Lock
 import logging
+import math
+import numpy as np
 from rti_python.Ensemble.Ensemble import Ensemble
+from EnsembleValues import EnsembleValues
+from ChunkBuffer import ChunkBuffer
+from SequenceTracker import SequenceTracker
+from Downsample import Downsample
+from ContourPyramid import ContourPyramid
+from Snapshot import Snapshot
+from PlotPayload import PlotPayload
 
 
 class ContourVM:
 
-    def __init__(self):
+    # Default number of ensembles to display
+    DEFAULT_MAX_ENS = 4096
+
+    # Values for each ensemble
+    # Time is the ensemble time in microseconds since the epoch
+    # Missing values are NaN
+    DTYPE = np.dtype([('time', np.int64),
+                      ('bt_range', np.float64),
+                      ('bt_range_to_bin', np.float64),
+                      ('last_bin_range', np.float64)])
+
+    # Values stored for each bin
+    # Bad velocities and beams not in the ensemble are NaN
+    COL_MAG = 0
+    COL_DIR = 1
+    COL_BEAM = 2                        # Beam velocity beam 0 - 3
+    COL_AMP = 6                         # Amplitude beam 0 - 3
+    COL_CORR = 10                       # Correlation beam 0 - 3
+    COL_AMP_VERT = 14                   # Amplitude of the vertical beam
+    NUM_COLUMNS = 15
+
+    # Columns used for each contour type
+    # If more than one column is used, the average of the good values is displayed
+    PRODUCTS = {
+        "mag": [COL_MAG],
+        "dir": [COL_DIR],
+        "beam0": [COL_BEAM],
+        "beam1": [COL_BEAM + 1],
+        "beam2": [COL_BEAM + 2],
+        "beam3": [COL_BEAM + 3],
+        "amp": [COL_AMP, COL_AMP + 1, COL_AMP + 2, COL_AMP + 3],
+        "ampBeam0": [COL_AMP],
+        "ampBeam1": [COL_AMP + 1],
+        "ampBeam2": [COL_AMP + 2],
+        "ampBeam3": [COL_AMP + 3],
+        "ampVert": [COL_AMP_VERT],
+        "corr": [COL_CORR, COL_CORR + 1, COL_CORR + 2, COL_CORR + 3],
+    }
+
+    # Contour type used if the type is not known
+    DEFAULT_TYPE = "mag"
+
+    # The bin values are stored as float32 to save memory.  Round the
+    # values sent to the view, so float32 error like 0.20000000298 is not shown
+    DECIMALS = 6
+
+    def __init__(self, max_ens: int = DEFAULT_MAX_ENS):
+        """
+        Initialize the values.
+        :param max_ens: Number of the latest ensembles to display.
+        """
         self.NumBins = 0
         self.NumBeams = 4
-        self.magData = []   # Array of bins, each entry contains an array holding one row (bin) of data
-        self.x_dt = []
-        self.y_bin = []
-        self.bt_range = []
-        self.bt_range_to_bin = []
-        self.last_bin_range = []            # Used to no the end of the plotting area for the shaded area
         self.IsUpward = False
         self.MinBinDepth = 0.0
         self.MaxBinDepth = 0.0
+        self.max_ens = max_ens
+
+        # Latest ensembles.  The values for all the contour types are stored,
+        # so the contour type can be changed without playing the data again
+        self.bin_data = self.create_bin_data(0)                     # Values of each bin for each ensemble
+        self.ens_data = ChunkBuffer(max_ens, ContourVM.DTYPE)       # Time and Bottom Track of each ensemble
+
+        # Combined ensembles to zoom out quickly.  A pyramid is only
+        # created for the contour types displayed with get_range()
+        self.pyramids = {}
+
+        # Sequence number of the latest ensemble, so the view can ask
+        # for only the ensembles added since its last request
+        self.sequence = SequenceTracker()
 
         self.thread_lock = Lock()
 
+        # Data for get_data().  A new version is published at the end of each batch
+        self.snapshot = Snapshot(0)
+        self.publish_snapshot()
+
     def set_ens(self, ens: Ensemble):
         """
         Get the data out of the ensemble and populate
@@ -32,8 +103,30 @@ class ContourVM:
         :return:
         """
         # Lock the object
-        self.thread_lock.acquire()
+        with self.thread_lock:
+            self.process_ens(ens)
+            self.publish_snapshot()
+
+    def set_ens_batch(self, ens_list):
+        """
+        Set a batch of ensembles.  The lock is only taken once
+        for the batch.
+        :param ens_list: List of ensembles.
+        :return:
+        """
+        # Lock the object
+        with self.thread_lock:
+            for ens in ens_list:
+                self.process_ens(ens)
+            self.publish_snapshot()
 
+    def process_ens(self, ens: Ensemble):
+        """
+        Get the data out of the ensemble and populate
+        the structure.  The lock must be held.
+        :param ens: Latest ensemble.
+        :return:
+        """
         # Get the number of beams
         if ens.IsEnsembleData:
             self.NumBeams = ens.EnsembleData.NumBeams
@@ -42,103 +135,408 @@ class ContourVM:
         if ens.IsAncillaryData:
             self.IsUpward = ens.AncillaryData.is_upward_facing()
 
-        # Create the Bin array
-        if self.NumBins != ens.EnsembleData.NumBins:
-            # Set the number of bins
-            self.NumBins = ens.EnsembleData.NumBins
-
-            # Set the new bin data
-            for bin_num in range(ens.EnsembleData.NumBins):
-                self.y_bin.append(bin_num)                          # Set the bin number to mark the axis
-                self.magData.append([])                             # Create an array for each bin
+        # Make room for more bins
+        num_bins = ens.EnsembleData.NumBins
+        if self.NumBins < num_bins:
+            self.set_num_bins(num_bins)
 
             # Get Min and max bin depth
             self.MinBinDepth = Ensemble.get_bin_depth(ens.AncillaryData.FirstBinRange, ens.AncillaryData.BinSize, 0)
-            self.MaxBinDepth = Ensemble.get_bin_depth(ens.AncillaryData.FirstBinRange, ens.AncillaryData.BinSize, ens.EnsembleData.NumBins)
+            self.MaxBinDepth = Ensemble.get_bin_depth(ens.AncillaryData.FirstBinRange, ens.AncillaryData.BinSize, num_bins)
 
-        # Populate the velocity data and date and time
-        if ens.IsEarthVelocity:
-            for bin_num in range(ens.EnsembleData.NumBins):
-                # Get the data
-                bin_mag = ens.EarthVelocity.Magnitude[bin_num]
-
-                if Ensemble.is_bad_velocity(bin_mag):
-                    # Set it to the array
-                    self.magData[bin_num].append(None)      # Bad Velocity
-                else:
-                    self.magData[bin_num].append(bin_mag)
+        # Populate the values of all the contour types
+        # Ensembles with fewer bins are padded with NaN
+        values = self.get_bin_values(ens, num_bins)
 
         # Bottom Track value
+        bt_range = math.nan
+        bt_range_to_bin = math.nan
         if ens.IsBottomTrack:
             bt_depth = ens.BottomTrack.avg_range()
-            if bt_depth == 0.0:
-                self.bt_range.append(None)                  # Bad Range
-                self.bt_range_to_bin.append(None)
-            else:
-                self.bt_range.append(bt_depth)
+            if bt_depth != 0.0:
+                bt_range = bt_depth
 
                 # Convert the range to a bin number
-                range_to_bin = round(bt_depth - ens.AncillaryData.FirstBinRange) / ens.AncillaryData.BinSize
-                self.bt_range_to_bin.append(range_to_bin)
+                bt_range_to_bin = round(bt_depth - ens.AncillaryData.FirstBinRange) / ens.AncillaryData.BinSize
 
         # Last bin range to know the bottom of the plot area for the shaded area
-        last_bin_range = ens.AncillaryData.FirstBinRange + (ens.AncillaryData.BinSize * ens.EnsembleData.NumBins)
-        self.last_bin_range.append(last_bin_range)
+        last_bin_range = ens.AncillaryData.FirstBinRange + (ens.AncillaryData.BinSize * num_bins)
 
         # Populate the date and time with the latest dt
-        self.x_dt.append(ens.EnsembleData.datetime().isoformat())
+        time = EnsembleValues.to_microseconds(ens.EnsembleData.datetime())
 
-        # Release the lock
-        self.thread_lock.release()
+        ens_row = (time, bt_range, bt_range_to_bin, last_bin_range)
 
-    def get_data(self, contour_type: str):
+        self.bin_data.append(values)
+        self.ens_data.append(ens_row)
+        for contour_type, pyramid in self.pyramids.items():
+            pyramid.append(ContourVM.get_product(values[np.newaxis], contour_type)[0], ens_row)
+        self.sequence.add()
+
+    def get_bin_values(self, ens: Ensemble, num_bins: int):
         """
-        Populate the structure.
+        Get the values of all the contour types for each bin.
+        :param ens: Ensemble.
+        :param num_bins: Number of bins in the ensemble.
+        :return: Numpy array of bins x NUM_COLUMNS.
+        """
+        values = np.full((self.NumBins, ContourVM.NUM_COLUMNS), Ensemble.BadVelocity, dtype=np.float32)
+        bins = values[:num_bins]
 
-        Lock and unlock when getting the data to ensure
-        when new data is received, it is not being used with
-        old data.
-        :return: Structure with all the latest ensemble data
+        if ens.IsEarthVelocity:
+            EnsembleValues.copy_bins(bins[:, ContourVM.COL_MAG:ContourVM.COL_MAG + 1], ens.EarthVelocity.Magnitude)
+            EnsembleValues.copy_bins(bins[:, ContourVM.COL_DIR:ContourVM.COL_DIR + 1], ens.EarthVelocity.Direction)
+
+        if ens.IsBeamVelocity:
+            EnsembleValues.copy_bins(bins[:, ContourVM.COL_BEAM:ContourVM.COL_BEAM + 4], ens.BeamVelocity.Velocities)
+
+        if ens.IsAmplitude:
+            if ens.EnsembleData.NumBeams == 1:
+                # Vertical beam
+                EnsembleValues.copy_bins(bins[:, ContourVM.COL_AMP_VERT:ContourVM.COL_AMP_VERT + 1], ens.Amplitude.Amplitude)
+            else:
+                EnsembleValues.copy_bins(bins[:, ContourVM.COL_AMP:ContourVM.COL_AMP + 4], ens.Amplitude.Amplitude)
+
+        if ens.IsCorrelation:
+            EnsembleValues.copy_bins(bins[:, ContourVM.COL_CORR:ContourVM.COL_CORR + 4], ens.Correlation.Correlation)
+
+        # Bad Velocity and missing values
+        values[EnsembleValues.is_bad(values)] = np.nan
+
+        return values
+
+    def create_bin_data(self, num_bins: int):
         """
+        Create the buffer for the bin values.
+        :param num_bins: Number of bins.
+        :return: ChunkBuffer of ensembles x bins x NUM_COLUMNS.
+        """
+        return ChunkBuffer(self.max_ens, np.float32, (num_bins, ContourVM.NUM_COLUMNS))
 
+    def get_pyramid(self, contour_type: str):
+        """
+        Get the pyramid of the contour type.  The pyramid is created from
+        the ensembles displayed the first time the contour type is used.
+        The lock must be held.
+        :param contour_type: Contour type.
+        :return: ContourPyramid.
+        """
+        pyramid = self.pyramids.get(contour_type)
+        if pyramid is None:
+            pyramid = ContourPyramid(self.max_ens, self.NumBins, ContourVM.DTYPE)
+            pyramid.extend(ContourVM.get_product(self.bin_data.get(), contour_type), self.ens_data.get())
+            self.pyramids[contour_type] = pyramid
+        return pyramid
+
+    def set_num_bins(self, num_bins: int):
+        """
+        Set a new number of bins.  The ensembles already displayed
+        are kept and padded with NaN for the new bins.  The views
+        must get all the data again.  The lock must be held.
+        :param num_bins: Number of bins.
+        :return:
+        """
+        bin_data = self.bin_data.get()
+        self.bin_data = self.create_bin_data(num_bins)
+        if len(bin_data) > 0:
+            padded = np.full((len(bin_data), num_bins, ContourVM.NUM_COLUMNS), np.nan, dtype=np.float32)
+            padded[:, :self.NumBins] = bin_data
+            self.bin_data.extend(padded)
+
+        self.NumBins = num_bins
+        self.pyramids = {}
+
+        self.sequence.reset()
+
+    def set_max_ens(self, max_ens: int):
+        """
+        Set the number of the latest ensembles to display.
+        The latest ensembles are kept.
+        :param max_ens: Number of ensembles.
+        :return:
+        """
         # Lock the object
-        self.thread_lock.acquire()
+        with self.thread_lock:
+            if max_ens and max_ens > 0 and max_ens != self.max_ens:
+                self.max_ens = max_ens
+                self.bin_data.resize(max_ens)
+                self.ens_data.resize(max_ens)
+                self.pyramids = {}
+
+                # The views must get all the data again
+                self.sequence.reset()
+                self.publish_snapshot()
+
+    def publish_snapshot(self):
+        """
+        Publish the bin values and the ensemble values for get_data().
+        The snapshot shares the rows with the buffers, so nothing is
+        copied.  The lock must be held.
+        :return:
+        """
+        self.snapshot = self.snapshot.next((self.bin_data.snapshot(),
+                                            self.ens_data.snapshot(),
+                                            self.get_info()))
 
-        # Populate the structure
-        contour_data = {
+    def get_info(self):
+        """
+        Get the values that describe the ensembles.  The lock must be held.
+        :return: Dictionary of the values.
+        """
+        return {
             "numBeams": self.NumBeams,
             "numBins": self.NumBins,
-            "contourData": self.magData,
-            "X_dt": self.x_dt,
-            "Y_bin": self.y_bin,
-            "btRange": self.bt_range,
-            "btRangeToBin": self.bt_range_to_bin,
-            "lastBinRange": self.last_bin_range,
             "isUpward": self.IsUpward,
             "minBinDepth": self.MinBinDepth,
             "maxBinDepth": self.MaxBinDepth,
+            "maxEns": self.max_ens,
         }
 
-        # Release the lock
-        self.thread_lock.release()
+    def get_version(self):
+        """
+        Get the version of the data.  The version increases at the
+        end of each batch and when the options change.
+        :return: Version number.
+        """
+        return self.snapshot.version
+
+    def get_data(self, contour_type: str, max_points: int = 0, method: str = Downsample.METHOD_MEAN, fmt: str = PlotPayload.FORMAT_LIST, is_packed: bool = False):
+        """
+        Populate the structure.
+
+        The structure is built from the latest snapshot, so the lock is
+        not needed and new data can be added while the structure is built.
+        The structure is reused until the next snapshot.
+        :param contour_type: Contour type.
+        :param max_points: Maximum number of ensembles.  The ensembles are combined in buckets.  0 for all the ensembles.
+        :param method: How to combine the ensembles in a bucket: mean, min or max.
+        :param fmt: Format of the values, list or binary.  See PlotPayload.
+        :param is_packed: Get the structure encoded with msgpack.
+        :return: Structure with all the latest ensemble data
+        """
+        snapshot = self.snapshot
+        contour_type = ContourVM.check_type(contour_type)
+        fmt = PlotPayload.check_format(fmt)
+
+        if max_points and 0 < max_points < len(snapshot.data[1]):
+            if method not in Downsample.METHODS:
+                method = Downsample.METHOD_MEAN
+            contour_data = snapshot.get_payload((contour_type, max_points, method, fmt),
+                                                lambda data: ContourVM.get_downsampled_data(data, contour_type, max_points, method, fmt),
+                                                is_packed)
+        else:
+            contour_data = snapshot.get_payload((contour_type, 0, None, fmt),
+                                                lambda data: ContourVM.get_contour_structure(contour_type,
+                                                                                             ContourVM.get_product(data[0].get(), contour_type),
+                                                                                             data[1].get(),
+                                                                                             data[2],
+                                                                                             fmt),
+                                                is_packed)
 
         logging.debug(contour_data)
 
         return contour_data
 
-    def reset(self):
+    def get_data_since(self, contour_type: str, since_seq: int):
+        """
+        Get only the ensembles added after the sequence number.
+        See SequenceTracker for how the view uses the sequence number.
+        :param contour_type: Contour type.
+        :param since_seq: Sequence number from the last request.  0 for all the data.
+        :return: Structure with the new ensembles, the latest sequence number "seq" and "isReset".
+        """
+
         # Lock the object
-        self.thread_lock.acquire()
-
-        self.magData.clear()
-        self.x_dt.clear()
-        self.y_bin.clear()
-        self.bt_range.clear()
-        self.bt_range_to_bin.clear()
-        self.last_bin_range.clear()
-        self.NumBins = 0
+        with self.thread_lock:
+            start, is_reset = self.sequence.get_start(since_seq, len(self.ens_data))
+
+            contour_data = self.get_contour_data(contour_type, start)
+            contour_data["seq"] = self.sequence.seq
+            contour_data["isReset"] = is_reset
+
+        logging.debug(contour_data)
 
-        # Release the lock
-        self.thread_lock.release()
+        return contour_data
 
+    def get_contour_data(self, contour_type: str, start: int):
+        """
+        Populate the structure with the ensembles from the start index.
+        The lock must be held.
+        :param contour_type: Contour type.
+        :param start: Index of the first ensemble in the display window.
+        :return: Structure with the data.
+        """
+        contour_type = ContourVM.check_type(contour_type)
+        contour = ContourVM.get_product(self.bin_data.get(start), contour_type)
 
+        return ContourVM.get_contour_structure(contour_type, contour, self.ens_data.get(start), self.get_info())
+
+    @staticmethod
+    def get_contour_structure(contour_type: str, contour, ens_data, info, fmt: str = PlotPayload.FORMAT_LIST):
+        """
+        Populate the structure.
+        :param contour_type: Contour type.
+        :param contour: Numpy array of ensembles x bins of the contour type.
+        :param ens_data: Numpy array of the DTYPE values of each ensemble.
+        :param info: Values that describe the ensembles from get_info().
+        :param fmt: Format of the values, list or binary.
+        :return: Structure with the data.
+        """
+        return {
+            "contourType": contour_type,
+            "numBeams": info["numBeams"],
+            "numBins": info["numBins"],
+            "contourData": PlotPayload.to_values(contour.T, fmt, PlotPayload.FLOAT32),     # Array of bins, each entry contains one row (bin) of data
+            "X_dt": PlotPayload.to_times(ens_data['time'], fmt),
+            "Y_bin": list(range(info["numBins"])),
+            "btRange": PlotPayload.to_values(ens_data['bt_range'], fmt),
+            "btRangeToBin": PlotPayload.to_values(ens_data['bt_range_to_bin'], fmt),
+            "lastBinRange": PlotPayload.to_values(ens_data['last_bin_range'], fmt),
+            "isUpward": info["isUpward"],
+            "minBinDepth": info["minBinDepth"],
+            "maxBinDepth": info["maxBinDepth"],
+            "maxEns": info["maxEns"],
+        }
+
+    @staticmethod
+    def get_downsampled_data(data, contour_type: str, max_points: int, method: str, fmt: str = PlotPayload.FORMAT_LIST):
+        """
+        Populate the structure with at most max_points ensembles.  The
+        ensembles are combined in buckets of the same size.  The time of a
+        bucket is the time of its first ensemble.
+        :param data: Snapshot data of the bin values and the ensemble values ChunkBuffers and the info.
+        :param contour_type: Contour type.
+        :param max_points: Maximum number of ensembles.
+        :param method: How to combine the ensembles in a bucket: mean, min or max.
+        :param fmt: Format of the values, list or binary.
+        :return: Structure with the data.
+        """
+        bin_data, ens_data, info = data[0].get(), data[1].get(), data[2]
+        starts = Downsample.bucket_starts(len(ens_data), max_points)
+        contour = Downsample.reduce(ContourVM.get_product(bin_data, contour_type), starts, method)
+        return ContourVM.get_contour_structure(contour_type, contour, ContourVM.reduce_ens_data(ens_data, starts, method), info, fmt)
+
+    def get_range(self, contour_type: str, start_time: int, end_time: int, width: int, method: str = Downsample.METHOD_MEAN):
+        """
+        Get the contour for the time range with about one column for each
+        pixel.  The coarsest pyramid level that still has at least width
+        columns in the range is used, so the time does not depend on
+        the number of ensembles in the range.
+        :param contour_type: Contour type.
+        :param start_time: Start time in microseconds since the epoch.
+        :param end_time: End time in microseconds since the epoch (inclusive).
+        :param width: Width of the plot in pixels.
+        :param method: mean or max of the ensembles combined in a column.
+        :return: Structure with the data and "level".  Level 0 is every ensemble, 1 every 2 ensembles and so on.
+        """
+        contour_type = ContourVM.check_type(contour_type)
+        if method != Downsample.METHOD_MAX:
+            method = Downsample.METHOD_MEAN
+
+        # Lock the object
+        with self.thread_lock:
+            # Number of ensembles in the range
+            times = self.ens_data.get()['time']
+            first = np.searchsorted(times, start_time, side='left')
+            last = np.searchsorted(times, end_time, side='right')
+            num_ens = last - first
+
+            # Coarsest level with at least width columns
+            level = 0
+            num_levels = ContourPyramid.get_num_levels(self.max_ens)
+            while level < num_levels and (num_ens >> (level + 1)) >= max(width, 1):
+                level += 1
+
+            if level == 0:
+                contour = ContourVM.get_product(self.bin_data.get(first, last), contour_type)
+                ens_data = self.ens_data.get(first, last)
+            else:
+                pyramid = self.get_pyramid(contour_type)
+                pyramid_level = pyramid.get_level(level)
+                level_times = pyramid_level.get_times()
+                level_first = np.searchsorted(level_times, start_time, side='left')
+                level_last = np.searchsorted(level_times, end_time, side='right')
+                if method == Downsample.METHOD_MAX:
+                    contour = pyramid_level.get_max(level_first, level_last)
+                else:
+                    contour = pyramid_level.get_mean(level_first, level_last)
+                contour = np.round(contour.astype(np.float64), ContourVM.DECIMALS)
+                ens_data = pyramid_level.get_ens(level_first, level_last)
+
+                # Combine the latest ensembles that are not in a complete column yet
+                tail_range = slice(max(first, len(times) - pyramid.get_tail_size(level)), last)
+                if tail_range.start < tail_range.stop:
+                    tail_starts = np.zeros(1, dtype=np.int64)
+                    tail_contour = Downsample.reduce(ContourVM.get_product(self.bin_data.get(tail_range.start, tail_range.stop), contour_type),
+                                                     tail_starts, method)
+                    tail_ens = ContourVM.reduce_ens_data(self.ens_data.get(tail_range.start, tail_range.stop), tail_starts, method)
+                    contour = np.concatenate([contour, tail_contour])
+                    ens_data = np.concatenate([ens_data, tail_ens])
+
+            contour_data = ContourVM.get_contour_structure(contour_type, contour, ens_data, self.get_info())
+            contour_data["level"] = level
+
+        logging.debug(contour_data)
+
+        return contour_data
+
+    @staticmethod
+    def reduce_ens_data(ens_data, starts, method: str):
+        """
+        Combine the values of the ensembles in each bucket.
+        The time of the first ensemble in the bucket is used.
+        :param ens_data: Numpy array of the DTYPE values of each ensemble.
+        :param starts: First ensemble of each bucket.
+        :param method: mean, min or max.
+        :return: Numpy array of the DTYPE values of each bucket.
+        """
+        reduced = np.empty(len(starts), dtype=ContourVM.DTYPE)
+        reduced['time'] = ens_data['time'][starts]
+        for name in ContourVM.DTYPE.names[1:]:
+            reduced[name] = Downsample.reduce(ens_data[name], starts, method)
+        return reduced
+
+    @staticmethod
+    def check_type(contour_type: str):
+        """
+        Check the contour type is known.
+        :param contour_type: Contour type.
+        :return: Contour type or the default type if not known.
+        """
+        if contour_type not in ContourVM.PRODUCTS:
+            logging.debug("Unknown contour type: " + str(contour_type))
+            return ContourVM.DEFAULT_TYPE
+        return contour_type
+
+    @staticmethod
+    def get_product(bin_data, contour_type: str):
+        """
+        Create the contour type values from the stored bin values.
+        Only the ensembles requested are calculated.
+        :param bin_data: Numpy array of ensembles x bins x NUM_COLUMNS.
+        :param contour_type: Contour type.
+        :return: Numpy array of ensembles x bins.
+        """
+        columns = ContourVM.PRODUCTS[contour_type]
+        if len(columns) == 1:
+            product = bin_data[:, :, columns[0]].astype(np.float64)
+        else:
+            # Average the good values of the beams
+            values = bin_data[:, :, columns[0]:columns[-1] + 1].astype(np.float64)
+            is_good = ~np.isnan(values)
+            count = is_good.sum(axis=2)
+            total = np.where(is_good, values, 0.0).sum(axis=2)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                product = np.where(count > 0, total / count, np.nan)
+
+        return np.round(product, ContourVM.DECIMALS)
+
+    def reset(self):
+        # Lock the object
+        with self.thread_lock:
+            self.bin_data = self.create_bin_data(0)
+            self.ens_data.clear()
+            self.NumBins = 0
+            self.pyramids = {}
+            self.sequence.reset()
+            self.publish_snapshot()
@@ -1,8 +1,7 @@
 import zerorpc
 import logging
 import math
-from threading import Thread, Event
-from collections import deque
+from threading import Thread
 from rti_python.Ensemble.EnsembleData import Ensemble
 from rti_python.Utilities.qa_qc import EnsembleQC
 from AmplitudeVM import AmplitudeVM
@@ -14,6 +13,9 @@ from AdcpTerminal import AdcpTerminalVM
 from rti_python.Utilities.config import RtiConfig
 from rti_python.Codecs.AdcpCodec import AdcpCodec
 from ZeroRpcManager import ZeroRpcManager
+from EnsembleCache import EnsembleCache
+from IngestQueue import IngestQueue
+from VMWorker import VMWorker
 
 
 class DataManager:
@@ -28,6 +30,9 @@ class DataManager:
         self.adcp_codec = AdcpCodec()
         self.adcp_codec.ensemble_event += self.handle_ensemble_data
 
+        # Decoded ensembles of the files played back
+        self.ens_cache = EnsembleCache()
+
         self.tabular_vm = TabularDataVM()
         self.amp_vm = AmplitudeVM()
         self.contour_vm = ContourVM()
@@ -48,11 +53,29 @@ class DataManager:
         self.zero_rpc_thread = Thread(name="ZeroRPC", target=self.zero_rpc.run_server, args=(4241,))
 
         # Ensemble processing thread
+        # Playback waits for the display so no data is lost
+        # Live data is dropped if the display can not keep up
         self.ens_thread_alive = True
-        self.ens_queue = deque(maxlen=1000)
-        self.ens_thread_event = Event()
+        self.ens_queue = IngestQueue(maxlen=1000)
+        self.playback_policy = IngestQueue.POLICY_BLOCK
+        self.live_policy = IngestQueue.POLICY_DROP_OLDEST
+        self.batch_size = 100                                   # Most ensembles passed to the VMs at once
+        self.batch_wait = 0.02                                  # Time to wait for a full batch in seconds
+
+        # Increased each time the queues are cleared.  Ensembles added
+        # before the queues were cleared are not displayed.
+        self.generation = 0
         self.ens_thread = Thread(name="DataManager", target=self.ens_thread_run)
 
+        # Each VM has its own queue and thread, so a slow VM does not stall the others
+        # Amplitude and Tabular get everything waiting at once
+        # Tabular adds every ensemble to the discharge, Amplitude only uses the ensembles it averages
+        self.vm_workers = [VMWorker("Tabular", self.tabular_vm, coalesce=True),
+                           VMWorker("Amplitude", self.amp_vm, coalesce=True),
+                           VMWorker("Contour", self.contour_vm),
+                           VMWorker("ShipTrack", self.shiptrack_vm),
+                           VMWorker("TimeSeries", self.timeseries_vm)]
+
         # Used to remove vessel speed
         self.prev_bt_east = Ensemble.BadVelocity
         self.prev_bt_north = Ensemble.BadVelocity
@@ -65,6 +88,10 @@ class DataManager:
         :param zerorpc_port: zerorpc port.
         :return:
         """
+        # Start the VM workers
+        for worker in self.vm_workers:
+            worker.start()
+
         # Start the ens thread
         self.ens_thread.start()
 
@@ -78,7 +105,9 @@ class DataManager:
         """
         # Shutdown the Ensemble thread
         self.ens_thread_alive = False
-        self.ens_thread_event.set()
+        self.ens_queue.close()
+        for worker in self.vm_workers:
+            worker.stop()
 
     def handle_adcp_serial_data(self, sender, data):
         """
@@ -99,20 +128,75 @@ class DataManager:
         :param ens: Ensemble from codec
         :return:
         """
-        self.incoming_ens(ens)
+        # QA QC the data
+        EnsembleQC.scan_ensemble(ens)
+
+        self.incoming_ens(ens, self.live_policy)
 
-    def incoming_ens(self, ens: Ensemble):
+    def incoming_ens(self, ens: Ensemble, policy: str = None, generation: int = None):
         """
         Handle all incoming data to be displayed.
         Put the data in a queue then wakeup the thread.
+        The ensemble should already be screened with EnsembleQC.
         :param ens: Ensemble to be displayed.
+        :param policy: IngestQueue policy if the queue is full.  DEFAULT: Playback policy.
+        :param generation: Generation when the playback started.  DEFAULT: Current generation.
+        :return:
+        """
+        if policy is None:
+            policy = self.playback_policy
+        if generation is None:
+            generation = self.generation
+
+        # Add the data to the queue and wakeup the thread
+        # The policy is also used when passing the ensemble to the VM workers
+        self.ens_queue.put((ens, policy, generation), policy)
+
+    def clear_queue(self):
+        """
+        Remove all the ensembles waiting to be displayed.
+        Used when the playback is cancelled or moved.
+
+        A batch already taken from a queue is dropped by the generation,
+        so no ensemble added before this call is displayed after it.
         :return:
         """
-        # Add the data to the queue
-        self.ens_queue.append(ens)
+        self.generation += 1
+        self.ens_queue.clear()
+        for worker in self.vm_workers:
+            worker.clear(self.generation)
 
-        # Wakeup the thread
-        self.ens_thread_event.set()
+    def set_ingest_policy(self, playback_policy: str, live_policy: str, max_len: int):
+        """
+        Set what to do when the display can not keep up with the incoming ensembles.
+        :param playback_policy: IngestQueue policy for playback.
+        :param live_policy: IngestQueue policy for live serial data.
+        :param max_len: Maximum number of ensembles waiting to be displayed.
+        :return:
+        """
+        if playback_policy in IngestQueue.POLICIES:
+            self.playback_policy = playback_policy
+        if live_policy in IngestQueue.POLICIES:
+            self.live_policy = live_policy
+        if max_len and max_len > 0:
+            self.ens_queue.set_maxlen(max_len)
+
+    def get_ingest_stats(self):
+        """
+        Get the ingest queue counters and policies.
+        :return: Dictionary with the counters and policies.
+        """
+        stats = self.ens_queue.get_stats()
+        stats["playbackPolicy"] = self.playback_policy
+        stats["livePolicy"] = self.live_policy
+        return stats
+
+    def get_vm_stats(self):
+        """
+        Get the lag and queue counters of each VM worker.
+        :return: Dictionary with the counters for each VM name.
+        """
+        return {worker.name: worker.get_stats() for worker in self.vm_workers}
 
     def ens_thread_run(self):
         """"
@@ -122,40 +206,42 @@ class DataManager:
 
         while self.ens_thread_alive:
 
-            # Wait until the thread is awoken
-            self.ens_thread_event.wait()
-
-            # Check if data is in the queue
-            while len(self.ens_queue) > 0:
-                # Get the data from the queue
-                ens = self.ens_queue.popleft()
-
-                # QA QC the data
-                EnsembleQC.scan_ensemble(ens)
-
-                # Screen the data
-
-                # Pass data
-                if ens:
-                    if ens.IsEnsembleData:
-                        logging.info("AdcpDataManager: Process Ensemble: " + str(ens.EnsembleData.EnsembleNumber))
-
-                        # Screen Data
-
-                        # Pass Data to Tabular data
-                        self.tabular_vm.set_ens(ens)
-
-                        # Pass data to Amplitude plot VM
-                        self.amp_vm.set_ens(ens)
-
-                        # Pass data to Contour plot VM
-                        self.contour_vm.set_ens(ens)
-
-                        # Pass data to Ship Track plot VM
-                        self.shiptrack_vm.set_ens(ens)
-
-                        # Pass data to Time Series plot VM
-                        self.timeseries_vm.set_ens(ens)
+            # Wait until data is in the queue
+            # Take a batch of ensembles so each VM queue is locked once per batch
+            batch = self.ens_queue.get_batch(self.batch_size, self.batch_wait)
+
+            # Group the ensembles with the same policy and generation
+            # Ensembles added before the queue was cleared are dropped
+            ens_list = []
+            policy = None
+            generation = None
+            for ens, ens_policy, ens_generation in batch:
+                if ens_generation != self.generation:
+                    continue
+                if (ens_policy != policy or ens_generation != generation) and ens_list:
+                    self.pass_ens_batch(ens_list, policy, generation)
+                    ens_list = []
+                policy = ens_policy
+                generation = ens_generation
+                if ens and ens.IsEnsembleData:
+                    ens_list.append(ens)
+
+            # Pass data
+            if ens_list:
+                self.pass_ens_batch(ens_list, policy, generation)
+
+    def pass_ens_batch(self, ens_list, policy: str, generation: int):
+        """
+        Pass the ensembles to each VM worker.  Each VM
+        will process the ensembles in its own thread.
+        :param ens_list: List of ensembles.
+        :param policy: IngestQueue policy if a VM queue is full.
+        :param generation: Generation of the ensembles.
+        :return:
+        """
+        logging.debug("AdcpDataManager: Process Ensembles: " + str(ens_list[0].EnsembleData.EnsembleNumber) +
+                      " - " + str(ens_list[-1].EnsembleData.EnsembleNumber))
 
-            # Reset the event
-            self.ens_thread_event.clear()
+        # Pass data to Tabular, Amplitude, Contour, Ship Track and Time Series VM
+        for worker in self.vm_workers:
+            worker.put_batch(ens_list, policy, generation)
@@ -0,0 +1,138 @@
+import datetime
+import logging
+import math
+import sys
+from types import SimpleNamespace
+import numpy as np
+from rti_python.Ensemble.Ensemble import Ensemble
+from DischargeEngine import DischargeEngine
+
+
+class DischargeCheck:
+    """
+    Check the DischargeEngine against values calculated by hand for
+    a synthetic transect.  Run this file to do the check:
+
+    python DischargeCheck.py
+
+    The transect has ensembles 1 second apart.  The water flows south
+    at 1 m/s in every bin.  The boat moves east at 1 m/s.  The
+    transducer is 0.5 m deep and Bottom Track is 5.0 m in each beam,
+    so the depth is 5.5 m.  The 4 bins are 1 m, starting at 1 m.  The
+    deepest bin is bad.
+
+    The exponent is 0, so the power law is a uniform profile and the
+    extrapolated discharge is easy to check:
+        Cross product:   0 x 0 - (-1) x 1 = 1 m^2/s^2 in each good bin
+        Measured:        bins 1 - 3 cover 1.0 m to 4.0 m, 3 m x 1 = 3 m^2/s
+        Top:             surface to 1.0 m, 1 m x 1 = 1 m^2/s
+        Bottom:          4.0 m to the bottom at 5.5 m, 1.5 m x 1 = 1.5 m^2/s
+    The first ensemble has no time before it, so only the next 2
+    ensembles add to the discharge:
+        Measured = 6, Top = 2, Bottom = 3 m^3/s
+        Left edge = 0.5 x 1 m/s x 2 m x 5.5 m = 5.5 m^3/s
+        Right edge = 0.5 x 1 m/s x 4 m x 5.5 m = 11 m^3/s
+        Total = 27.5 m^3/s
+
+    A last ensemble has bad Bottom Track.  It only adds to the GPS
+    track length and must not change the discharge.
+
+    The dropout transect is the same, except the second ensemble also
+    has bad Bottom Track.  Its time is added to the third ensemble, so
+    the expected values do not change.  The bad values of the dropout
+    transect were rounded to float32 like decoded values.
+    """
+
+    START_TIME = datetime.datetime(2020, 1, 1)
+
+    # Bad Velocity rounded to float32 like a decoded value
+    BAD_FLOAT32 = float(np.float32(Ensemble.BadVelocity))
+
+    # Name, if the Bottom Track is good in each ensemble and the bad value of each transect
+    TRANSECTS = [
+        ("Transect", [True, True, True, False], Ensemble.BadVelocity),
+        ("Dropout transect", [True, False, True, False], BAD_FLOAT32),
+    ]
+
+    # Expected values of the transect
+    EXPECTED = {
+        "q_measured": 6.0,
+        "q_top": 2.0,
+        "q_bottom": 3.0,
+        "q_left": 5.5,
+        "q_right": 11.0,
+        "q_total": 27.5,
+        "good_bins": 3,
+        "percent_bad_bins": 25.0,
+        "water_speed": 1.0,
+        "water_dir": 180.0,
+        "boat_speed": 1.0,
+        "boat_course": 90.0,
+        "calc_depth": 5.5,
+        "river_length": 2.0,
+        "distance_made_good": 2.0,
+        "course_made_good": 90.0,
+        "duration": 3.0,
+        "gps_length": 3.6,
+    }
+
+    @staticmethod
+    def create_ens(seconds: int, is_bt_good: bool = True, bad_value: float = Ensemble.BadVelocity):
+        """
+        Create an ensemble of the synthetic transect.  Only the values
+        used by the DischargeEngine are set.
+        :param seconds: Seconds since the start of the transect.
+        :param is_bt_good: False to set the Bottom Track velocity bad.
+        :param bad_value: Value of the bad bin and the bad Bottom Track.
+        :return: Ensemble.
+        """
+        bt_vel = -1.0 if is_bt_good else bad_value
+        bad_bin = [bad_value] * 4
+        return SimpleNamespace(
+            IsEnsembleData=True,
+            EnsembleData=SimpleNamespace(NumBins=4,
+                                         datetime=lambda: DischargeCheck.START_TIME + datetime.timedelta(seconds=seconds)),
+            IsNmeaData=True,
+            NmeaData=SimpleNamespace(speed_m_s=1.2),
+            IsEarthVelocity=True,
+            EarthVelocity=SimpleNamespace(Velocities=[[0.0, -1.0, 0.0, 0.0]] * 3 + [bad_bin]),
+            IsBottomTrack=True,
+            BottomTrack=SimpleNamespace(EarthVelocity=[bt_vel, 0.0, 0.0, 0.0], Range=[5.0] * 4),
+            IsAncillaryData=True,
+            AncillaryData=SimpleNamespace(TransducerDepth=0.5, BinSize=1.0, FirstBinRange=1.0))
+
+    @staticmethod
+    def check():
+        """
+        Run the synthetic transects through the DischargeEngine.
+        :return: List of the values that do not match.  Empty if all match.
+        """
+        errors = []
+        for transect, bt_good, bad_value in DischargeCheck.TRANSECTS:
+            engine = DischargeEngine(exponent=0.0, left_distance=2.0, right_distance=4.0, edge_coeff=0.5, is_start_left=True)
+
+            for seconds, is_bt_good in enumerate(bt_good):
+                is_added = engine.add_ens(DischargeCheck.create_ens(seconds, is_bt_good, bad_value))
+                if is_added and not is_bt_good:
+                    errors.append(transect + ": ensemble " + str(seconds) + " with bad Bottom Track was added")
+                elif not is_added and is_bt_good:
+                    errors.append(transect + ": ensemble " + str(seconds) + " was not added")
+
+            for name, expected in DischargeCheck.EXPECTED.items():
+                value = getattr(engine, name)
+                if not math.isclose(value, expected, rel_tol=1e-9, abs_tol=1e-9):
+                    errors.append(transect + ": " + name + ": " + str(value) + " expected " + str(expected))
+
+        return errors
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+
+    check_errors = DischargeCheck.check()
+    for error in check_errors:
+        logging.error(error)
+
+    if check_errors:
+        sys.exit(1)
+    logging.info("DischargeEngine matches the hand calculated values")
@@ -0,0 +1,269 @@
+import math
+from collections import deque
+import numpy as np
+from rti_python.Ensemble.Ensemble import Ensemble
+from EnsembleValues import EnsembleValues
+
+
+class DischargeEngine:
+    """
+    Calculate the moving boat discharge (Q) as the ensembles are received.
+
+    Each ensemble adds its part of the discharge, so the totals are
+    always up to date during the transect.  Nothing is calculated
+    again at the end of the transect.
+
+    Measured: Cross product of the water velocity and the boat velocity
+              in the good bins times the bin size and the time between ensembles.
+              The cross product is the same if the boat speed was removed
+              from the water velocity or not.
+    Top and Bottom: Power law fit to the measured cross product and extended to
+                    the surface and the bottom.
+    Left and Right: Edge coefficient x mean water speed x edge distance x mean depth
+                    of the first and last EDGE_ENS ensembles.
+
+    The boat velocity comes from Bottom Track.  Ensembles without good
+    Bottom Track or good bins do not add to the discharge.  Their time
+    is added to the next good ensemble, so a Bottom Track dropout does
+    not lose the discharge or the boat track of the gap.
+
+    The percent of bad bins and the GPS boat speed and track length
+    are also kept as running values.
+    """
+
+    BEAM_ANGLE = 20.0                   # Beam angle in degrees for the side lobe cutoff
+    DEFAULT_EXPONENT = 1.0 / 6.0        # Power law exponent
+    EDGE_ENS = 10                       # Number of ensembles used for each edge
+    EDGE_TRIANGLE = 0.3535              # Edge coefficient for a sloped bank
+    EDGE_RECTANGLE = 0.91               # Edge coefficient for a vertical bank
+
+    def __init__(self,
+                 exponent: float = DEFAULT_EXPONENT,
+                 left_distance: float = 0.0,
+                 right_distance: float = 0.0,
+                 edge_coeff: float = EDGE_TRIANGLE,
+                 is_start_left: bool = True):
+        """
+        Initialize the discharge.
+        :param exponent: Power law exponent for the top and bottom.
+        :param left_distance: Distance in meters from the left bank to the first or last ensemble.
+        :param right_distance: Distance in meters from the right bank to the first or last ensemble.
+        :param edge_coeff: Edge coefficient.
+        :param is_start_left: The transect starts on the left bank.
+        """
+        self.exponent = exponent
+        self.left_distance = left_distance
+        self.right_distance = right_distance
+        self.edge_coeff = edge_coeff
+        self.is_start_left = is_start_left
+        self.reset()
+
+    def reset(self):
+        """
+        Start a new transect.
+        :return:
+        """
+        self.q_top = 0.0
+        self.q_measured = 0.0
+        self.q_bottom = 0.0
+        self.q_left = 0.0
+        self.q_right = 0.0
+        self.q_total = 0.0
+        self.first_time = None
+        self.prev_time = None
+        self.q_time = None                                          # Time the discharge is added up to
+        self.delta_time = 0.0
+        self.duration = 0.0
+        self.num_good_ens = 0
+        self.good_bins = 0
+        self.total_bins = 0                                         # Bins in all the ensembles
+        self.bad_bins = 0                                           # Bad Earth Velocity bins in all the ensembles
+        self.percent_bad_bins = 0.0
+        self.boat_speed = 0.0
+        self.gps_speed = 0.0
+        self.gps_length = 0.0
+        self.boat_course = 0.0
+        self.water_speed = 0.0
+        self.water_dir = 0.0
+        self.calc_depth = 0.0
+        self.river_length = 0.0
+        self.dmg_east = 0.0
+        self.dmg_north = 0.0
+        self.distance_made_good = 0.0
+        self.course_made_good = 0.0
+        self.start_edge = []                                        # (water speed, depth) of the first ensembles
+        self.end_edge = deque(maxlen=DischargeEngine.EDGE_ENS)      # (water speed, depth) of the last ensembles
+
+    def add_ens(self, ens: Ensemble):
+        """
+        Add the discharge of the ensemble.
+        :param ens: Ensemble.
+        :return: True if the ensemble was good and added to the discharge.
+        """
+        if not ens.IsEnsembleData:
+            return False
+
+        # Time since the last ensemble
+        ens_time = ens.EnsembleData.datetime()
+        if self.first_time is None:
+            self.first_time = ens_time
+            self.q_time = ens_time
+        dt = 0.0
+        if self.prev_time is not None:
+            dt = max(0.0, (ens_time - self.prev_time).total_seconds())
+        self.prev_time = ens_time
+        self.delta_time = dt
+        self.duration = (ens_time - self.first_time).total_seconds()
+
+        # GPS boat speed
+        if ens.IsNmeaData:
+            gps_speed = EnsembleValues.to_float(ens.NmeaData.speed_m_s)
+            if not math.isnan(gps_speed):
+                self.gps_speed = gps_speed
+                self.gps_length += gps_speed * dt
+
+        if not ens.IsEarthVelocity:
+            return False
+
+        # Bad bins in the Earth Velocity
+        num_bins = ens.EnsembleData.NumBins
+        vel = np.full((num_bins, 2), np.nan)
+        EnsembleValues.copy_bins(vel, ens.EarthVelocity.Velocities)
+        vel[EnsembleValues.is_bad(vel)] = np.nan
+        is_bad = np.isnan(vel).any(axis=1)
+        self.total_bins += num_bins
+        self.bad_bins += int(is_bad.sum())
+        if self.total_bins > 0:
+            self.percent_bad_bins = 100.0 * self.bad_bins / self.total_bins
+
+        if not ens.IsBottomTrack or not ens.IsAncillaryData:
+            return False
+
+        # Boat velocity is the opposite of the Bottom Track velocity
+        bt_east = EnsembleValues.to_float(ens.BottomTrack.EarthVelocity[0])
+        bt_north = EnsembleValues.to_float(ens.BottomTrack.EarthVelocity[1])
+        if math.isnan(bt_east) or math.isnan(bt_north) or EnsembleValues.is_bad([bt_east, bt_north]).any():
+            return False
+        boat_east = -bt_east
+        boat_north = -bt_north
+
+        # Depth from the good Bottom Track ranges
+        bt_range = np.asarray([EnsembleValues.to_float(value) for value in ens.BottomTrack.Range])
+        bt_range = bt_range[(bt_range > 0) & ~EnsembleValues.is_bad(bt_range)]
+        if len(bt_range) == 0:
+            return False
+        draft = EnsembleValues.to_float(ens.AncillaryData.TransducerDepth)
+        if math.isnan(draft):
+            draft = 0.0
+        depth = draft + float(bt_range.mean())
+
+        # Good bins above the side lobe cutoff
+        bin_size = ens.AncillaryData.BinSize
+        bin_depth = ens.AncillaryData.FirstBinRange + bin_size * np.arange(num_bins)
+        cutoff = bt_range.mean() * math.cos(math.radians(DischargeEngine.BEAM_ANGLE))
+        is_good = ~is_bad & (bin_depth + bin_size / 2 <= cutoff)
+        good = np.flatnonzero(is_good)
+        self.good_bins = len(good)
+        if len(good) == 0:
+            return False
+
+        # Measured discharge per meter of the boat track
+        # Bad bins between the good bins use the mean of the good bins
+        xprod = vel[good, 0] * boat_north - vel[good, 1] * boat_east
+        top_meas = draft + bin_depth[good[0]] - bin_size / 2
+        bottom_meas = draft + bin_depth[good[-1]] + bin_size / 2
+        unit_meas = float(xprod.mean()) * (bottom_meas - top_meas)
+
+        # Power law extrapolation using the height above the bottom
+        power = self.exponent + 1
+        height_top = max(depth - top_meas, 0.0)
+        height_bottom = max(depth - bottom_meas, 0.0)
+        unit_top = unit_bottom = 0.0
+        span = height_top ** power - height_bottom ** power
+        if span > 0:
+            unit_top = unit_meas * (depth ** power - height_top ** power) / span
+            unit_bottom = unit_meas * height_bottom ** power / span
+
+        # Time since the last good ensemble, including the time of the bad ensembles
+        q_dt = max(0.0, (ens_time - self.q_time).total_seconds())
+        self.q_time = ens_time
+
+        self.q_measured += unit_meas * q_dt
+        self.q_top += unit_top * q_dt
+        self.q_bottom += unit_bottom * q_dt
+
+        # Latest values
+        water_east = float(vel[good, 0].mean())
+        water_north = float(vel[good, 1].mean())
+        self.water_speed = math.hypot(water_east, water_north)
+        self.water_dir = math.degrees(math.atan2(water_east, water_north)) % 360.0
+        self.boat_speed = math.hypot(boat_east, boat_north)
+        self.boat_course = math.degrees(math.atan2(boat_east, boat_north)) % 360.0
+        self.calc_depth = depth
+
+        # Boat track
+        self.river_length += self.boat_speed * q_dt
+        self.dmg_east += boat_east * q_dt
+        self.dmg_north += boat_north * q_dt
+        self.distance_made_good = math.hypot(self.dmg_east, self.dmg_north)
+        self.course_made_good = math.degrees(math.atan2(self.dmg_east, self.dmg_north)) % 360.0
+
+        # Edges
+        self.num_good_ens += 1
+        if len(self.start_edge) < DischargeEngine.EDGE_ENS:
+            self.start_edge.append((self.water_speed, depth))
+        self.end_edge.append((self.water_speed, depth))
+        self.update_edges()
+
+        return True
+
+    def update_edges(self):
+        """
+        Calculate the edge discharge and the total discharge.
+        The edges have the same direction as the measured discharge.
+        :return:
+        """
+        sign = -1.0 if self.q_measured < 0 else 1.0
+        q_start = DischargeEngine.edge_discharge(self.start_edge, self.edge_coeff, self.left_distance if self.is_start_left else self.right_distance)
+        q_end = DischargeEngine.edge_discharge(self.end_edge, self.edge_coeff, self.right_distance if self.is_start_left else self.left_distance)
+
+        if self.is_start_left:
+            self.q_left = sign * q_start
+            self.q_right = sign * q_end
+        else:
+            self.q_left = sign * q_end
+            self.q_right = sign * q_start
+
+        self.q_total = self.q_top + self.q_measured + self.q_bottom + self.q_left + self.q_right
+
+    @staticmethod
+    def edge_discharge(edge, edge_coeff: float, distance: float):
+        """
+        Calculate the discharge of the edge.
+        :param edge: List of (water speed, depth) of the ensembles next to the edge.
+        :param edge_coeff: Edge coefficient.
+        :param distance: Distance in meters to the bank.
+        :return: Discharge in m^3/s.
+        """
+        if not edge or distance <= 0:
+            return 0.0
+        speed, depth = np.asarray(edge, dtype=np.float64).mean(axis=0)
+        return edge_coeff * speed * distance * depth
+
+    def set_options(self, exponent: float, left_distance: float, right_distance: float, edge_coeff: float, is_start_left: bool):
+        """
+        Set the extrapolation and edge options.  The edges are updated now.
+        The exponent is used for the next ensembles.
+        :param exponent: Power law exponent for the top and bottom.
+        :param left_distance: Distance in meters from the left bank to the first or last ensemble.
+        :param right_distance: Distance in meters from the right bank to the first or last ensemble.
+        :param edge_coeff: Edge coefficient.
+        :param is_start_left: The transect starts on the left bank.
+        :return:
+        """
+        self.exponent = exponent
+        self.left_distance = left_distance
+        self.right_distance = right_distance
+        self.edge_coeff = edge_coeff
+        self.is_start_left = is_start_left
+        self.update_edges()
@@ -0,0 +1,137 @@
+import numpy as np
+
+
+class Downsample:
+    """
+    Reduce the number of points sent to the plots.  The plots are
+    only a few thousand pixels wide, so more points than that
+    can not be seen.
+
+    Line series use Largest-Triangle-Three-Buckets (LTTB), which keeps
+    the points that change the shape of the line the most.  Contour
+    columns are combined in buckets using the min, max or mean.
+    """
+
+    # Ways to combine the values in a bucket
+    METHOD_MEAN = "mean"
+    METHOD_MIN = "min"
+    METHOD_MAX = "max"
+    METHODS = [METHOD_MEAN, METHOD_MIN, METHOD_MAX]
+
+    @staticmethod
+    def lttb(x, y, max_points: int):
+        """
+        Select the points of the line using Largest-Triangle-Three-Buckets.
+        The first and last points are always selected.  NaN values are
+        only selected if a bucket has no good values.
+        :param x: Numpy array of the X values in increasing order.
+        :param y: Numpy array of the Y values.
+        :param max_points: Maximum number of points to select.
+        :return: Numpy array of the selected indexes in increasing order.
+        """
+        num_points = len(y)
+        if max_points >= num_points:
+            return np.arange(num_points)
+        if max_points < 3:
+            return np.array([0, num_points - 1][:max(max_points, 0)], dtype=np.int64)
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        # Every bucket except the first and last point
+        every = (num_points - 2) / (max_points - 2)
+        selected = np.empty(max_points, dtype=np.int64)
+        selected[0] = 0
+        prev = 0
+
+        for bucket in range(max_points - 2):
+            # Average of the next bucket
+            avg_start = int((bucket + 1) * every) + 1
+            avg_end = min(int((bucket + 2) * every) + 1, num_points)
+            avg_x = x[avg_start:avg_end].mean()
+            next_y = y[avg_start:avg_end]
+            next_y = next_y[~np.isnan(next_y)]
+            avg_y = next_y.mean() if len(next_y) > 0 else y[prev]
+
+            # Point in this bucket with the largest triangle with the
+            # previous selected point and the average of the next bucket
+            start = int(bucket * every) + 1
+            end = int((bucket + 1) * every) + 1
+            area = np.abs((x[prev] - avg_x) * (y[start:end] - y[prev]) -
+                          (x[prev] - x[start:end]) * (avg_y - y[prev]))
+
+            if np.isnan(y[prev]):
+                # Previous point is bad, so use the first good point
+                area = np.where(np.isnan(y[start:end]), np.nan, 0.0)
+
+            is_good = ~np.isnan(area)
+            if is_good.any():
+                prev = start + int(np.argmax(np.where(is_good, area, -1.0)))
+            else:
+                prev = start
+
+            selected[bucket + 1] = prev
+
+        selected[-1] = num_points - 1
+        return selected
+
+    @staticmethod
+    def lttb_union(x, ys, max_points: int):
+        """
+        Select the points of several lines that share the X values.
+        Each line gets an equal part of the points, so the total
+        is at most max_points.  If there are too many lines for each
+        to get 3 points, the points are split in to buckets instead.
+        :param x: Numpy array of the X values in increasing order.
+        :param ys: List of numpy arrays of the Y values.
+        :param max_points: Maximum number of points to select.
+        :return: Numpy array of the selected indexes in increasing order.
+        """
+        num_points = len(x)
+        if max_points >= num_points:
+            return np.arange(num_points)
+        if not ys:
+            return Downsample.bucket_starts(num_points, max_points)
+
+        line_points = max_points // len(ys)
+        if line_points < 3:
+            return Downsample.bucket_starts(num_points, max_points)
+
+        selected = [Downsample.lttb(x, y, line_points) for y in ys]
+        return np.unique(np.concatenate(selected))
+
+    @staticmethod
+    def bucket_starts(num_points: int, num_buckets: int):
+        """
+        Split the points in to buckets of the same size.
+        :param num_points: Number of points.
+        :param num_buckets: Number of buckets.
+        :return: Numpy array of the first index of each bucket.
+        """
+        num_buckets = max(1, min(num_buckets, num_points))
+        return np.unique((np.arange(num_buckets) * num_points) // num_buckets)
+
+    @staticmethod
+    def reduce(values, starts, method: str = METHOD_MEAN):
+        """
+        Combine the rows of each bucket.  NaN values are ignored.
+        If all the values of a bucket are NaN, the result is NaN.
+        :param values: Numpy array of rows to combine.  The first axis is combined.
+        :param starts: First row of each bucket from bucket_starts().
+        :param method: mean, min or max.
+        :return: Numpy array with a row for each bucket.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return values
+
+        if method == Downsample.METHOD_MIN:
+            return np.fmin.reduceat(values, starts, axis=0)
+        if method == Downsample.METHOD_MAX:
+            return np.fmax.reduceat(values, starts, axis=0)
+
+        is_good = ~np.isnan(values)
+        count = np.add.reduceat(is_good, starts, axis=0)
+        total = np.add.reduceat(np.where(is_good, values, 0.0), starts, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / count, np.nan)
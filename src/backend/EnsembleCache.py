@@ -0,0 +1,624 @@
+import datetime
+import hashlib
+import inspect
+import json
+import logging
+import mmap
+import os
+import shutil
+import time
+import numpy as np
+from threading import Lock
+from rti_python.Ensemble.Ensemble import Ensemble
+from rti_python.Codecs import BinaryCodec
+from rti_python.Utilities import qa_qc
+from EnsembleValues import EnsembleValues
+
+
+class EnsembleCache:
+    """
+    On-disk cache of the decoded and screened ensembles of a file.
+
+    The cache is written during the first playback of a file.  Later playbacks
+    read the memory mapped columns and create lightweight ensembles, so the
+    binary data does not need to be verified, decoded and screened again.
+
+    Each file is stored in its own directory named by the hash of the file
+    contents, the cache version and the decoder version.  The least recently
+    used files are removed when the cache grows larger than the maximum size.
+    """
+
+    # Change when the decoded values or the columns change
+    CACHE_VERSION = 2
+
+    # Hash of the rti_python decoder and screening code.  Set the first time it is used.
+    DECODER_VERSION = None
+
+    # Temporary directories not written for this many seconds were left by an aborted playback
+    TMP_MAX_AGE = 60 * 60
+
+    # Default location and size of the cache
+    DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".river_electron", "ens_cache")
+    DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+    # File with the hashes of the files already seen
+    HASH_MEMO = "hashes.json"
+
+    # Description of each cache directory
+    META_FILE = "meta.json"
+
+    # Values stored once per ensemble
+    ENS_DTYPE = np.dtype([('ens_num', '<i8'),
+                          ('timestamp', '<i8'),                # Microseconds since epoch
+                          ('num_bins', '<i4'),
+                          ('num_beams', '<i4'),
+                          ('bin_offset', '<i8'),               # First row in the bin columns
+                          ('is_ancillary', 'u1'),
+                          ('first_bin_range', '<f8'),
+                          ('bin_size', '<f8'),
+                          ('heading', '<f8'),
+                          ('pitch', '<f8'),
+                          ('roll', '<f8'),
+                          ('water_temp', '<f8'),
+                          ('transducer_depth', '<f8'),
+                          ('is_upward', 'u1'),
+                          ('is_earth', 'u1'),
+                          ('avg_mag', '<f8'),
+                          ('avg_dir', '<f8'),
+                          ('is_amp', 'u1'),
+                          ('is_beam', 'u1'),
+                          ('is_corr', 'u1'),
+                          ('is_bt', 'u1'),
+                          ('bt_avg_range', '<f8'),
+                          ('bt_range', '<f8', (4,)),
+                          ('bt_earth_vel', '<f8', (4,)),
+                          ('is_nmea', 'u1'),
+                          ('is_gga', 'u1'),
+                          ('latitude', '<f8'),
+                          ('longitude', '<f8'),
+                          ('num_sats', '<f8'),
+                          ('gps_qual', '<f8'),
+                          ('hdop', '<f8'),
+                          ('speed', '<f8')])
+
+    # Values stored for each bin.  Name and number of values in each bin
+    BIN_COLUMNS = [('earth_vel', 4),
+                   ('magnitude', 1),
+                   ('direction', 1),
+                   ('amplitude', 4),
+                   ('beam_vel', 4),
+                   ('correlation', 4)]
+
+    def __init__(self, cache_dir: str = DEFAULT_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Initialize the cache.
+        :param cache_dir: Folder to store the cache.
+        :param max_bytes: Maximum size of the cache in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.thread_lock = Lock()
+
+        # Temporary directories of the writers still running
+        self.tmp_dirs = set()
+
+    def file_key(self, file_path):
+        """
+        Get the cache key of the file.  The key is the hash of the file contents,
+        the cache version and the decoder version.  The hash is remembered by path,
+        size and modified time, so the file is only hashed again when it changes.
+        :param file_path: Ensemble file path.
+        :return: Cache key.
+        """
+        stat = os.stat(file_path)
+        memo_id = os.path.abspath(file_path) + "|" + str(stat.st_size) + "|" + str(stat.st_mtime_ns)
+
+        # Lock the object
+        self.thread_lock.acquire()
+        memo = self.read_hash_memo()
+        file_hash = memo.get(memo_id)
+        self.thread_lock.release()
+
+        if file_hash is None:
+            file_hash = EnsembleCache.hash_file(file_path)
+
+            # Lock the object
+            self.thread_lock.acquire()
+            memo = self.read_hash_memo()
+            memo[memo_id] = file_hash
+            self.write_hash_memo(memo)
+            self.thread_lock.release()
+
+        return file_hash + EnsembleCache.key_suffix()
+
+    @staticmethod
+    def key_suffix():
+        """
+        Get the end of the cache key added to the file hash.
+        :return: Cache version and decoder version.
+        """
+        return "_v" + str(EnsembleCache.CACHE_VERSION) + "_" + EnsembleCache.decoder_version()
+
+    @staticmethod
+    def decoder_version():
+        """
+        Get the version of the decoder and the screening.  rti_python does not
+        have a version number, so the version is the hash of the modules that
+        decode and screen the ensembles.  The files are cached again when
+        rti_python is updated.
+        :return: Decoder version.
+        """
+        if EnsembleCache.DECODER_VERSION is None:
+            ens_dir = os.path.dirname(inspect.getfile(Ensemble))
+            module_files = [BinaryCodec.__file__, qa_qc.__file__]
+            module_files += sorted(os.path.join(ens_dir, name) for name in os.listdir(ens_dir) if name.endswith(".py"))
+
+            decoder_hash = hashlib.blake2b(digest_size=6)
+            for module_file in module_files:
+                try:
+                    with open(module_file, "rb") as f:
+                        decoder_hash.update(f.read())
+                except OSError:
+                    decoder_hash.update(os.path.basename(module_file).encode())
+            EnsembleCache.DECODER_VERSION = decoder_hash.hexdigest()
+
+        return EnsembleCache.DECODER_VERSION
+
+    @staticmethod
+    def hash_file(file_path):
+        """
+        Hash the contents of the file.
+        :param file_path: File path.
+        :return: Hex digest of the file.
+        """
+        file_hash = hashlib.blake2b(digest_size=20)
+        if os.path.getsize(file_path) > 0:
+            with open(file_path, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    file_hash.update(mm)
+        return file_hash.hexdigest()
+
+    def read_hash_memo(self):
+        """
+        Read the remembered file hashes.
+        :return: Dictionary of file id to hash.
+        """
+        try:
+            with open(os.path.join(self.cache_dir, EnsembleCache.HASH_MEMO), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_hash_memo(self, memo):
+        """
+        Write the remembered file hashes.
+        :param memo: Dictionary of file id to hash.
+        :return:
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(os.path.join(self.cache_dir, EnsembleCache.HASH_MEMO), "w") as f:
+                json.dump(memo, f)
+        except OSError as e:
+            logging.error("Error writing ensemble cache hashes. " + str(e))
+
+    def open(self, file_path):
+        """
+        Open the cache of the file.
+        :param file_path: Ensemble file path.
+        :return: EnsembleCacheReader or None if the file is not cached.
+        """
+        key = self.file_key(file_path)
+        key_dir = os.path.join(self.cache_dir, key)
+        if not os.path.exists(os.path.join(key_dir, EnsembleCache.META_FILE)):
+            return None
+
+        try:
+            reader = EnsembleCacheReader(key_dir)
+        except (OSError, ValueError) as e:
+            logging.error("Error reading ensemble cache. " + str(e))
+            return None
+
+        # Mark as recently used
+        os.utime(key_dir)
+
+        return reader
+
+    def create_writer(self, file_path):
+        """
+        Create a writer to cache the ensembles of the file.
+        :param file_path: Ensemble file path.
+        :return: EnsembleCacheWriter.
+        """
+        return EnsembleCacheWriter(self, self.file_key(file_path))
+
+    def evict(self, keep_key=None):
+        """
+        Remove the least recently used files until the
+        cache is smaller than the maximum size.
+
+        The temporary directories of aborted playbacks and the
+        remembered hashes of removed or changed files are also removed.
+        :param keep_key: Key that should not be removed.
+        :return:
+        """
+        entries = []
+        total_size = 0
+        for key in os.listdir(self.cache_dir):
+            key_dir = os.path.join(self.cache_dir, key)
+            if not os.path.isdir(key_dir):
+                continue
+            if ".tmp" in key:
+                self.remove_aborted(key_dir)
+                continue
+
+            size = sum(entry.stat().st_size for entry in os.scandir(key_dir) if entry.is_file())
+            entries.append((os.stat(key_dir).st_mtime, key, size))
+            total_size += size
+
+        # Remove the oldest first
+        for mtime, key, size in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            if key == keep_key:
+                continue
+
+            logging.debug("Remove ensemble cache: " + key)
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total_size -= size
+
+        self.prune_hash_memo()
+
+    def remove_aborted(self, tmp_dir):
+        """
+        Remove the temporary directory if it was left by an aborted playback.
+        The directory is kept if its writer is still running in this process
+        or it was written recently by another process.
+        :param tmp_dir: Temporary cache directory.
+        :return:
+        """
+        # Lock the object
+        with self.thread_lock:
+            is_running = tmp_dir in self.tmp_dirs
+
+        if is_running:
+            return
+
+        try:
+            last_write = max([entry.stat().st_mtime for entry in os.scandir(tmp_dir)] + [os.stat(tmp_dir).st_mtime])
+        except OSError:
+            return
+
+        if time.time() - last_write > EnsembleCache.TMP_MAX_AGE:
+            logging.debug("Remove aborted ensemble cache: " + tmp_dir)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def prune_hash_memo(self):
+        """
+        Remove the remembered hashes of files that were deleted or changed,
+        or that are no longer cached.  A writer still running keeps the hash.
+        :return:
+        """
+        # Lock the object
+        with self.thread_lock:
+            memo = self.read_hash_memo()
+            writing = {os.path.basename(tmp_dir).split(".tmp")[0] for tmp_dir in self.tmp_dirs}
+
+            pruned = {}
+            for memo_id, file_hash in memo.items():
+                key = file_hash + EnsembleCache.key_suffix()
+                if key not in writing and not os.path.isdir(os.path.join(self.cache_dir, key)):
+                    continue
+
+                file_path, size, mtime_ns = memo_id.rsplit("|", 2)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                if str(stat.st_size) != size or str(stat.st_mtime_ns) != mtime_ns:
+                    continue
+
+                pruned[memo_id] = file_hash
+
+            if len(pruned) != len(memo):
+                self.write_hash_memo(pruned)
+
+
+class EnsembleCacheWriter:
+    """
+    Write the ensembles of a file to the cache.  The bin values are appended
+    to the column files as the ensembles are added.  The cache is only used after
+    commit() is called, so a playback that is stopped does not leave a partial cache.
+    """
+
+    def __init__(self, cache: EnsembleCache, key: str):
+        """
+        Create the temporary cache directory and the column files.
+        :param cache: Ensemble cache.
+        :param key: Cache key of the file.
+        """
+        self.cache = cache
+        self.key = key
+        self.tmp_dir = os.path.join(cache.cache_dir, key + ".tmp" + str(os.getpid()) + "_" + str(id(self)))
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        # Lock the object
+        with cache.thread_lock:
+            cache.tmp_dirs.add(self.tmp_dir)
+
+        self.ens_data = np.zeros(1024, dtype=EnsembleCache.ENS_DTYPE)
+        self.num_ens = 0
+        self.num_rows = 0
+        self.bin_files = {name: open(os.path.join(self.tmp_dir, name + ".bin"), "wb")
+                          for name, width in EnsembleCache.BIN_COLUMNS}
+
+    def append(self, ens: Ensemble):
+        """
+        Add the ensemble to the cache.
+        :param ens: Decoded and screened ensemble.
+        :return:
+        """
+        if not ens.IsEnsembleData:
+            return
+
+        # Grow the ensemble values
+        if self.num_ens == len(self.ens_data):
+            ens_data = np.zeros(len(self.ens_data) * 2, dtype=EnsembleCache.ENS_DTYPE)
+            ens_data[:self.num_ens] = self.ens_data
+            self.ens_data = ens_data
+
+        row = self.ens_data[self.num_ens]
+        num_bins = ens.EnsembleData.NumBins
+        row['ens_num'] = ens.EnsembleData.EnsembleNumber
+        row['timestamp'] = EnsembleValues.to_microseconds(ens.EnsembleData.datetime())
+        row['num_bins'] = num_bins
+        row['num_beams'] = ens.EnsembleData.NumBeams
+        row['bin_offset'] = self.num_rows
+
+        if ens.IsAncillaryData:
+            row['is_ancillary'] = 1
+            row['first_bin_range'] = ens.AncillaryData.FirstBinRange
+            row['bin_size'] = ens.AncillaryData.BinSize
+            row['heading'] = ens.AncillaryData.Heading
+            row['pitch'] = ens.AncillaryData.Pitch
+            row['roll'] = ens.AncillaryData.Roll
+            row['water_temp'] = ens.AncillaryData.WaterTemp
+            row['transducer_depth'] = ens.AncillaryData.TransducerDepth
+            row['is_upward'] = ens.AncillaryData.is_upward_facing()
+
+        # Bin values are always written, so all the bin columns share the bin offset
+        bin_values = {name: np.full((num_bins, width), Ensemble.BadVelocity)
+                      for name, width in EnsembleCache.BIN_COLUMNS}
+
+        if ens.IsEarthVelocity:
+            row['is_earth'] = 1
+            avg_mag, avg_dir = ens.EarthVelocity.average_mag_dir()
+            row['avg_mag'] = EnsembleValues.to_float(avg_mag)
+            row['avg_dir'] = EnsembleValues.to_float(avg_dir)
+            EnsembleValues.copy_bins(bin_values['earth_vel'], ens.EarthVelocity.Velocities)
+            EnsembleValues.copy_bins(bin_values['magnitude'], ens.EarthVelocity.Magnitude)
+            EnsembleValues.copy_bins(bin_values['direction'], ens.EarthVelocity.Direction)
+
+        if ens.IsAmplitude:
+            row['is_amp'] = 1
+            EnsembleValues.copy_bins(bin_values['amplitude'], ens.Amplitude.Amplitude)
+
+        if ens.IsBeamVelocity:
+            row['is_beam'] = 1
+            EnsembleValues.copy_bins(bin_values['beam_vel'], ens.BeamVelocity.Velocities)
+
+        if ens.IsCorrelation:
+            row['is_corr'] = 1
+            EnsembleValues.copy_bins(bin_values['correlation'], ens.Correlation.Correlation)
+
+        if ens.IsBottomTrack:
+            row['is_bt'] = 1
+            row['bt_avg_range'] = ens.BottomTrack.avg_range()
+            bt_values = np.full((2, 4), Ensemble.BadVelocity)
+            EnsembleValues.copy_bins(bt_values, [ens.BottomTrack.Range, ens.BottomTrack.EarthVelocity])
+            row['bt_range'] = bt_values[0]
+            row['bt_earth_vel'] = bt_values[1]
+
+        if ens.IsNmeaData:
+            row['is_nmea'] = 1
+            row['latitude'] = EnsembleValues.to_float(ens.NmeaData.latitude)
+            row['longitude'] = EnsembleValues.to_float(ens.NmeaData.longitude)
+            row['speed'] = EnsembleValues.to_float(ens.NmeaData.speed_m_s)
+            if ens.NmeaData.GPGGA is not None:
+                row['is_gga'] = 1
+                row['num_sats'] = EnsembleValues.to_float(ens.NmeaData.GPGGA.num_sats)
+                row['gps_qual'] = EnsembleValues.to_float(ens.NmeaData.GPGGA.gps_qual)
+                row['hdop'] = EnsembleValues.to_float(ens.NmeaData.GPGGA.horizontal_dil)
+
+        for name, width in EnsembleCache.BIN_COLUMNS:
+            self.bin_files[name].write(bin_values[name].astype('<f8').tobytes())
+
+        self.num_rows += num_bins
+        self.num_ens += 1
+
+    def commit(self):
+        """
+        Write the ensemble values and make the cache available.
+        Remove old files if the cache is too large.
+        :return:
+        """
+        for f in self.bin_files.values():
+            f.close()
+
+        ens_data = self.ens_data[:self.num_ens]
+        for name in EnsembleCache.ENS_DTYPE.names:
+            np.save(os.path.join(self.tmp_dir, name + ".npy"), np.ascontiguousarray(ens_data[name]))
+
+        meta = {
+            "version": EnsembleCache.CACHE_VERSION,
+            "decoderVersion": EnsembleCache.decoder_version(),
+            "numEns": self.num_ens,
+            "numRows": self.num_rows,
+        }
+        with open(os.path.join(self.tmp_dir, EnsembleCache.META_FILE), "w") as f:
+            json.dump(meta, f)
+
+        key_dir = os.path.join(self.cache.cache_dir, self.key)
+        try:
+            os.rename(self.tmp_dir, key_dir)
+        except OSError:
+            # Already cached by another playback
+            self.abort()
+            return
+
+        self.end_writer()
+        self.cache.evict(keep_key=self.key)
+
+    def abort(self):
+        """
+        Remove the partial cache.
+        :return:
+        """
+        for f in self.bin_files.values():
+            f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.end_writer()
+
+    def end_writer(self):
+        """
+        Let the cache remove the temporary directory if it is left behind.
+        :return:
+        """
+        # Lock the object
+        with self.cache.thread_lock:
+            self.cache.tmp_dirs.discard(self.tmp_dir)
+
+
+class EnsembleCacheReader:
+    """
+    Read the cached ensembles of a file.  The columns are memory mapped.
+    """
+
+    def __init__(self, key_dir: str):
+        """
+        Open the columns.
+        :param key_dir: Cache directory of the file.
+        """
+        with open(os.path.join(key_dir, EnsembleCache.META_FILE), "r") as f:
+            meta = json.load(f)
+
+        if meta["version"] != EnsembleCache.CACHE_VERSION:
+            raise ValueError("Ensemble cache version " + str(meta["version"]))
+
+        self.num_ens = meta["numEns"]
+        self.ens_data = {name: np.load(os.path.join(key_dir, name + ".npy"), mmap_mode='r')
+                         for name in EnsembleCache.ENS_DTYPE.names}
+
+        self.bin_data = {}
+        for name, width in EnsembleCache.BIN_COLUMNS:
+            if meta["numRows"] > 0:
+                self.bin_data[name] = np.memmap(os.path.join(key_dir, name + ".bin"), dtype='<f8', mode='r',
+                                                shape=(meta["numRows"], width))
+            else:
+                self.bin_data[name] = np.zeros((0, width))
+
+    def __len__(self):
+        return self.num_ens
+
+    def get_ens(self, index: int):
+        """
+        Create the ensemble from the cached values.
+        :param index: Ensemble index in the file.
+        :return: CachedEnsemble.
+        """
+        return CachedEnsemble(self, index)
+
+
+class CachedEnsemble:
+    """
+    Ensemble created from the cache.  It has the same datasets and values
+    as the decoded Ensemble that the ViewModels use.  The ensemble was
+    screened before it was cached.
+    """
+
+    def __init__(self, reader: EnsembleCacheReader, index: int):
+        """
+        Create the datasets from the cached values.
+        :param reader: Cache reader.
+        :param index: Ensemble index in the file.
+        """
+        ens_data = reader.ens_data
+        num_bins = int(ens_data['num_bins'][index])
+        num_beams = int(ens_data['num_beams'][index])
+        bin_offset = int(ens_data['bin_offset'][index])
+        bins = slice(bin_offset, bin_offset + num_bins)
+
+        self.IsEnsembleData = True
+        self.EnsembleData = CachedDataSet(EnsembleNumber=int(ens_data['ens_num'][index]),
+                                          NumBins=num_bins,
+                                          NumBeams=num_beams)
+        dt = EnsembleValues.EPOCH + datetime.timedelta(microseconds=int(ens_data['timestamp'][index]))
+        self.EnsembleData.datetime = lambda: dt
+
+        self.IsAncillaryData = bool(ens_data['is_ancillary'][index])
+        self.AncillaryData = None
+        if self.IsAncillaryData:
+            is_upward = bool(ens_data['is_upward'][index])
+            self.AncillaryData = CachedDataSet(FirstBinRange=float(ens_data['first_bin_range'][index]),
+                                               BinSize=float(ens_data['bin_size'][index]),
+                                               Heading=float(ens_data['heading'][index]),
+                                               Pitch=float(ens_data['pitch'][index]),
+                                               Roll=float(ens_data['roll'][index]),
+                                               WaterTemp=float(ens_data['water_temp'][index]),
+                                               TransducerDepth=float(ens_data['transducer_depth'][index]))
+            self.AncillaryData.is_upward_facing = lambda: is_upward
+
+        self.IsEarthVelocity = bool(ens_data['is_earth'][index])
+        self.EarthVelocity = None
+        if self.IsEarthVelocity:
+            avg_mag_dir = (float(ens_data['avg_mag'][index]), float(ens_data['avg_dir'][index]))
+            self.EarthVelocity = CachedDataSet(Velocities=reader.bin_data['earth_vel'][bins],
+                                               Magnitude=reader.bin_data['magnitude'][bins, 0],
+                                               Direction=reader.bin_data['direction'][bins, 0])
+            self.EarthVelocity.average_mag_dir = lambda: avg_mag_dir
+
+        self.IsAmplitude = bool(ens_data['is_amp'][index])
+        self.Amplitude = None
+        if self.IsAmplitude:
+            self.Amplitude = CachedDataSet(Amplitude=reader.bin_data['amplitude'][bins, :num_beams])
+
+        self.IsBeamVelocity = bool(ens_data['is_beam'][index])
+        self.BeamVelocity = None
+        if self.IsBeamVelocity:
+            self.BeamVelocity = CachedDataSet(Velocities=reader.bin_data['beam_vel'][bins, :num_beams])
+
+        self.IsCorrelation = bool(ens_data['is_corr'][index])
+        self.Correlation = None
+        if self.IsCorrelation:
+            self.Correlation = CachedDataSet(Correlation=reader.bin_data['correlation'][bins, :num_beams])
+
+        self.IsBottomTrack = bool(ens_data['is_bt'][index])
+        self.BottomTrack = None
+        if self.IsBottomTrack:
+            avg_range = float(ens_data['bt_avg_range'][index])
+            self.BottomTrack = CachedDataSet(Range=ens_data['bt_range'][index].tolist(),
+                                             EarthVelocity=ens_data['bt_earth_vel'][index].tolist())
+            self.BottomTrack.avg_range = lambda: avg_range
+
+        self.IsNmeaData = bool(ens_data['is_nmea'][index])
+        self.NmeaData = None
+        if self.IsNmeaData:
+            gga = None
+            if ens_data['is_gga'][index]:
+                gga = CachedDataSet(num_sats=float(ens_data['num_sats'][index]),
+                                    gps_qual=float(ens_data['gps_qual'][index]),
+                                    horizontal_dil=float(ens_data['hdop'][index]))
+            self.NmeaData = CachedDataSet(latitude=float(ens_data['latitude'][index]),
+                                          longitude=float(ens_data['longitude'][index]),
+                                          speed_m_s=float(ens_data['speed'][index]),
+                                          GPGGA=gga)
+
+
+class CachedDataSet:
+    """
+    Dataset of a CachedEnsemble.  The values are given as keywords.
+    """
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
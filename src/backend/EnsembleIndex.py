@@ -0,0 +1,338 @@
+import logging
+import mmap
+import os
+import struct
+import datetime
+from threading import Thread
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from rti_python.Codecs.BinaryCodec import BinaryCodec
+from PlaybackManager import PlaybackManager
+
+
+class EnsembleIndex:
+    """
+    Index of all the ensembles in a recorded RTB file.
+    The index is stored in a sidecar file next to the RTB file,
+    so the file only has to be scanned once.  The sidecar is reused
+    as long as the size and modified time of the RTB file do not change.
+
+    Each record holds the byte offset, length, ensemble number,
+    timestamp (seconds since epoch, UTC) and if the checksum was good.
+    """
+
+    # Sidecar file extension
+    EXTENSION = ".idx"
+
+    # Sidecar header: magic, file size, file mtime in ns, number of records
+    MAGIC = b'RTBIDX01'
+    HEADER = struct.Struct('<8sQqQ')
+
+    # Location of the ensemble number in the RTB header
+    ENS_NUM_OFFSET = 16
+
+    # Data set header: type, number of elements, element multiplier, image, name length and name
+    DS_HEADER = struct.Struct('<5i')
+    DS_NAME_OFFSET = 20
+
+    # Ensemble Data data set and its values from the ensemble number to the hundredths of a second
+    ENS_DATA_NAME = b'E000008'
+    ENS_DATA_VALUES = struct.Struct('<13i')
+    ENS_DATA_YEAR = 6
+
+    # Data set types
+    DS_TYPE_BYTE = 50
+
+    # Record for each ensemble
+    DTYPE = np.dtype([('offset', '<u8'),
+                      ('length', '<u4'),
+                      ('ens_num', '<u4'),
+                      ('timestamp', '<f8'),
+                      ('ok', 'u1')])
+
+    def __init__(self, file_path, records):
+        """
+        Use load() or build() to create the index.
+        :param file_path: RTB file path.
+        :param records: Numpy array of DTYPE records.
+        """
+        self.file_path = file_path
+        self.records = records
+
+        # Ensemble numbers are normally increasing, so a binary search can be used
+        self.is_sorted = bool(np.all(np.diff(self.records['ens_num'].astype(np.int64)) >= 0))
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def sidecar_path(file_path):
+        """
+        Get the path of the sidecar index file.
+        :param file_path: RTB file path.
+        :return: Sidecar file path.
+        """
+        return file_path + EnsembleIndex.EXTENSION
+
+    @staticmethod
+    def load_or_build(file_path, num_workers: int = 1):
+        """
+        Load the sidecar index if it is still valid for the file.
+        If not, scan the file and write a new sidecar.
+        :param file_path: RTB file path.
+        :param num_workers: Number of processes used to scan the file.
+        :return: EnsembleIndex for the file.
+        """
+        index = EnsembleIndex.load(file_path)
+        if index is None:
+            index = EnsembleIndex.build(file_path, num_workers)
+        return index
+
+    @staticmethod
+    def load(file_path):
+        """
+        Load the sidecar index.  The records are memory mapped.
+        :param file_path: RTB file path.
+        :return: EnsembleIndex or None if the sidecar is missing or out of date.
+        """
+        idx_path = EnsembleIndex.sidecar_path(file_path)
+        if not os.path.exists(idx_path):
+            return None
+
+        stat = os.stat(file_path)
+        with open(idx_path, "rb") as f:
+            header = f.read(EnsembleIndex.HEADER.size)
+
+        if len(header) < EnsembleIndex.HEADER.size:
+            return None
+
+        magic, file_size, file_mtime, count = EnsembleIndex.HEADER.unpack(header)
+        if magic != EnsembleIndex.MAGIC or file_size != stat.st_size or file_mtime != stat.st_mtime_ns:
+            logging.debug("Ensemble index out of date: " + idx_path)
+            return None
+
+        if count == 0:
+            records = np.zeros(0, dtype=EnsembleIndex.DTYPE)
+        else:
+            records = np.memmap(idx_path, dtype=EnsembleIndex.DTYPE, mode='r',
+                                offset=EnsembleIndex.HEADER.size, shape=(count,))
+
+        return EnsembleIndex(file_path, records)
+
+    @staticmethod
+    def build(file_path, num_workers: int = 1):
+        """
+        Scan the file and create the index.  The sidecar file is written
+        next to the RTB file.  If the sidecar can not be written, the index
+        is still returned.
+        :param file_path: RTB file path.
+        :param num_workers: Number of processes used to scan the file.
+        :return: EnsembleIndex for the file.
+        """
+        logging.debug("Building ensemble index: " + str(file_path))
+
+        # Get the size and time before scanning, so a file changed while scanning is rescanned next time
+        stat = os.stat(file_path)
+
+        pieces = PlaybackManager.split_file(file_path, PlaybackManager.CHUNK_SIZE)
+        if num_workers > 1 and len(pieces) > 1:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                chunks = list(executor.map(index_file_chunk,
+                                           [file_path] * len(pieces),
+                                           [start for start, end in pieces],
+                                           [end for start, end in pieces]))
+        else:
+            chunks = [index_file_chunk(file_path, start, end) for start, end in pieces]
+
+        if chunks:
+            records = np.concatenate(chunks)
+        else:
+            records = np.zeros(0, dtype=EnsembleIndex.DTYPE)
+
+        # Write the sidecar
+        idx_path = EnsembleIndex.sidecar_path(file_path)
+        try:
+            with open(idx_path, "wb") as f:
+                f.write(EnsembleIndex.HEADER.pack(EnsembleIndex.MAGIC, stat.st_size, stat.st_mtime_ns, len(records)))
+                f.write(records.tobytes())
+        except OSError as e:
+            logging.error("Error writing ensemble index. " + str(e))
+
+        return EnsembleIndex(file_path, records)
+
+    @staticmethod
+    def to_timestamp(dt: datetime.datetime):
+        """
+        Convert the datetime to seconds since the epoch.
+        Ensemble times have no timezone, so they are treated as UTC.
+        :param dt: Datetime.
+        :return: Seconds since epoch.
+        """
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=datetime.timezone.utc)
+        return dt.timestamp()
+
+    @staticmethod
+    def read_ens_data(ens_bin):
+        """
+        Read the ensemble number and time from the Ensemble Data data set
+        without decoding the ensemble.  Only the data set headers are read
+        to find the Ensemble Data.
+        :param ens_bin: Ensemble including the header and checksum.
+        :return: (ensemble number, datetime) or None if the Ensemble Data is not found or bad.
+        """
+        payload_size = struct.unpack_from('<I', ens_bin, PlaybackManager.HEADER_SIZE - 8)[0]
+        end = min(len(ens_bin), PlaybackManager.HEADER_SIZE + payload_size)
+        pos = PlaybackManager.HEADER_SIZE
+        while pos + EnsembleIndex.DS_HEADER.size <= end:
+            ds_type, num_elements, element_multiplier, imag, name_len = EnsembleIndex.DS_HEADER.unpack_from(ens_bin, pos)
+            if name_len <= 0 or num_elements < 0 or element_multiplier < 0:
+                return None
+            values_pos = pos + EnsembleIndex.DS_NAME_OFFSET + name_len
+            name = bytes(ens_bin[pos + EnsembleIndex.DS_NAME_OFFSET:values_pos]).rstrip(b'\0')
+
+            if name == EnsembleIndex.ENS_DATA_NAME:
+                if values_pos + EnsembleIndex.ENS_DATA_VALUES.size > end:
+                    return None
+                values = EnsembleIndex.ENS_DATA_VALUES.unpack_from(ens_bin, values_pos)
+                year, month, day, hour, minute, second, hsec = values[EnsembleIndex.ENS_DATA_YEAR:]
+                try:
+                    return values[0], datetime.datetime(year, month, day, hour, minute, second, hsec * 10000)
+                except ValueError:
+                    return None
+
+            # Move to the next data set
+            value_size = 1 if ds_type == EnsembleIndex.DS_TYPE_BYTE else 4
+            pos = values_pos + num_elements * element_multiplier * value_size
+
+        return None
+
+    def ens_range(self, first_ens: int, last_ens: int):
+        """
+        Get the good records for the ensemble number range.
+        :param first_ens: First ensemble number.
+        :param last_ens: Last ensemble number (inclusive).
+        :return: Numpy array of records.
+        """
+        ens_nums = self.records['ens_num']
+        if self.is_sorted:
+            start = np.searchsorted(ens_nums, first_ens, side='left')
+            end = np.searchsorted(ens_nums, last_ens, side='right')
+            selected = self.records[start:end]
+        else:
+            selected = self.records[(ens_nums >= first_ens) & (ens_nums <= last_ens)]
+
+        return selected[selected['ok'] == 1]
+
+    def time_range(self, start_time: float, end_time: float):
+        """
+        Get the good records for the time range.
+        :param start_time: Start time in seconds since epoch.
+        :param end_time: End time in seconds since epoch (inclusive).
+        :return: Numpy array of records.
+        """
+        timestamps = self.records['timestamp']
+        selected = self.records[(timestamps >= start_time) & (timestamps <= end_time)]
+        return selected[selected['ok'] == 1]
+
+    def get_summary(self):
+        """
+        Get the number of ensembles and the first and last ensemble number and time.
+        :return: Dictionary of the summary.
+        """
+        good = self.records[self.records['ok'] == 1]
+
+        if len(good) == 0:
+            return {"numEnsembles": 0}
+
+        return {
+            "numEnsembles": len(good),
+            "firstEnsembleNum": int(good['ens_num'][0]),
+            "lastEnsembleNum": int(good['ens_num'][-1]),
+            "firstDateTimeStr": datetime.datetime.fromtimestamp(good['timestamp'][0], datetime.timezone.utc).isoformat(),
+            "lastDateTimeStr": datetime.datetime.fromtimestamp(good['timestamp'][-1], datetime.timezone.utc).isoformat(),
+        }
+
+
+class IndexBuild:
+    """
+    Build the index of a file in a thread, so the RPC server is
+    not blocked while a large file is scanned.  Check the state
+    until the build is done.
+    """
+
+    # Build states
+    STATE_BUILDING = "building"
+    STATE_DONE = "done"
+    STATE_ERROR = "error"
+
+    def __init__(self, file_path, num_workers: int = 1):
+        """
+        Start building the index.
+        :param file_path: RTB file path.
+        :param num_workers: Number of processes used to scan the file.
+        """
+        self.file_path = file_path
+        self.num_workers = num_workers
+        self.state = IndexBuild.STATE_BUILDING
+        self.index = None
+        self.error = ""
+        self.thread = Thread(name="Ensemble Index Thread", target=self.run)
+        self.thread.start()
+
+    def run(self):
+        """
+        Index thread.
+        :return:
+        """
+        try:
+            self.index = EnsembleIndex.load_or_build(self.file_path, self.num_workers)
+            self.state = IndexBuild.STATE_DONE
+        except Exception as e:
+            logging.error("Error building ensemble index. " + str(e))
+            self.error = str(e)
+            self.state = IndexBuild.STATE_ERROR
+
+
+def index_file_chunk(file_path, start: int, end: int):
+    """
+    Create the index records for a piece of the file.
+    This can be run in a process, so it must be
+    a module level function.
+    :param file_path: RTB file path.
+    :param start: Start offset of the piece.
+    :param end: End offset of the piece.
+    :return: Numpy array of records in file order.
+    """
+    records = []
+    with open(file_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for ens_start, ens_end in PlaybackManager.find_ensembles(mm, start, end):
+                    with view[ens_start:ens_end] as ens_bin:
+                        timestamp = np.nan
+                        ok = 0
+
+                        # Get the ensemble number from the header, in case the ensemble is bad
+                        ens_num = 0
+                        if len(ens_bin) >= EnsembleIndex.ENS_NUM_OFFSET + 4:
+                            ens_num = struct.unpack_from('<I', ens_bin, EnsembleIndex.ENS_NUM_OFFSET)[0]
+
+                        if BinaryCodec.verify_ens_data(ens_bin):
+                            ens_data = EnsembleIndex.read_ens_data(ens_bin)
+                            if ens_data is None:
+                                # Use the full decode if the Ensemble Data is not found in the data sets
+                                ens = BinaryCodec.decode_data_sets(ens_bin)
+                                if ens and ens.IsEnsembleData:
+                                    ens_data = (ens.EnsembleData.EnsembleNumber, ens.EnsembleData.datetime())
+                            if ens_data is not None:
+                                ens_num = ens_data[0]
+                                timestamp = EnsembleIndex.to_timestamp(ens_data[1])
+                                ok = 1
+
+                        records.append((ens_start, ens_end - ens_start, ens_num, timestamp, ok))
+            finally:
+                view.release()
+
+    return np.array(records, dtype=EnsembleIndex.DTYPE)
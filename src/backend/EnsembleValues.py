@@ -0,0 +1,64 @@
+import datetime
+import math
+import numpy as np
+from rti_python.Ensemble.Ensemble import Ensemble
+
+
+class EnsembleValues:
+    """
+    Convert the values of a decoded ensemble to the numeric values
+    stored by the cache and the ViewModels.  Missing values are NaN.
+    """
+
+    # Ensemble times do not have a timezone
+    EPOCH = datetime.datetime(1970, 1, 1)
+
+    # Bad Velocity at the float32 precision of the decoded values
+    BAD_VELOCITY = np.float32(Ensemble.BadVelocity)
+
+    @staticmethod
+    def to_microseconds(dt: datetime.datetime):
+        """
+        Convert the ensemble time to microseconds since the epoch.
+        :param dt: Ensemble time without a timezone.
+        :return: Microseconds since epoch.
+        """
+        return (dt - EnsembleValues.EPOCH) // datetime.timedelta(microseconds=1)
+
+    @staticmethod
+    def to_float(value):
+        """
+        Convert the value to a float.  Missing values are NaN.
+        :param value: Value to convert.
+        :return: Float value.
+        """
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan
+
+    @staticmethod
+    def is_bad(values):
+        """
+        Check for the Bad Velocity value.  The ensemble values are float32,
+        so they may not equal the float64 Bad Velocity exactly.  The values
+        are compared at float32 precision.
+        :param values: Value or numpy array of values.
+        :return: True or a numpy array of bools where the value is Bad Velocity.
+        """
+        return np.asarray(values, dtype=np.float32) == EnsembleValues.BAD_VELOCITY
+
+    @staticmethod
+    def copy_bins(dest, values):
+        """
+        Copy the bin values in to the bin array.
+        :param dest: Array of bins x width.
+        :param values: List of values or list of lists with a value for each beam.
+        :return:
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values.reshape(-1, 1)
+        num_bins = min(dest.shape[0], values.shape[0])
+        width = min(dest.shape[1], values.shape[1])
+        dest[:num_bins, :width] = values[:num_bins, :width]
@@ -0,0 +1,93 @@
+import logging
+import os
+import re
+import time
+
+# inotify is optional and only available on Linux.
+# Without it, the folder is polled.
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+    flags = None
+
+
+class FileWatcher:
+    """
+    Wait for files in a folder to be written or created.
+    inotify is used when it is available, otherwise the
+    folder is polled.
+    """
+
+    # Time between checks when polling
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, folder: str):
+        """
+        Start watching the folder.
+        :param folder: Folder to watch.
+        """
+        self.folder = folder
+        self.inotify = None
+
+        if INotify is not None:
+            try:
+                self.inotify = INotify()
+                self.inotify.add_watch(folder, flags.MODIFY | flags.CREATE | flags.MOVED_TO | flags.CLOSE_WRITE)
+            except OSError as e:
+                logging.debug("inotify not available, polling " + folder + ". " + str(e))
+                self.close()
+
+    def wait(self, timeout: float):
+        """
+        Wait until a file in the folder changes or the timeout expires.
+        When polling, this will wait for the poll interval.
+        :param timeout: Maximum time to wait in seconds.
+        :return:
+        """
+        if self.inotify is not None:
+            self.inotify.read(timeout=int(timeout * 1000))
+        else:
+            time.sleep(min(timeout, FileWatcher.POLL_INTERVAL))
+
+    def close(self):
+        """
+        Stop watching the folder.
+        :return:
+        """
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    @staticmethod
+    def sort_key(name: str):
+        """
+        Key to sort the file names with the numbers in the name compared
+        by value, so file_2 sorts before file_10.
+        :param name: File name.
+        :return: Sort key.
+        """
+        return [(0, int(part), "") if part.isdigit() else (1, 0, part)
+                for part in re.split(r'(\d+)', name)]
+
+    @staticmethod
+    def next_file(file_path: str):
+        """
+        Find the file recorded after the given file.  The recorder
+        creates the next file in the same folder with the same
+        extension and a name that sorts after the current file.
+        The numbers in the names are compared by value.
+        :param file_path: Current file.
+        :return: Path of the next file or None if there is no newer file.
+        """
+        folder, name = os.path.split(os.path.abspath(file_path))
+        ext = os.path.splitext(name)[1]
+        name_key = FileWatcher.sort_key(name)
+
+        newer = sorted((entry for entry in os.listdir(folder)
+                        if os.path.splitext(entry)[1] == ext and FileWatcher.sort_key(entry) > name_key),
+                       key=FileWatcher.sort_key)
+        if newer:
+            return os.path.join(folder, newer[0])
+
+        return None
@@ -0,0 +1,111 @@
+import numpy as np
+
+
+class Geodesic:
+    """
+    Calculate the destination of many points at once.
+
+    The ship track quivers are only a few hundred meters long, so an
+    iterative ellipsoid solution like Vincenty is not needed.
+
+    enu: Local tangent plane (East, North, Up) on the WGS84 ellipsoid.
+         The distance is converted to degrees using the radius of
+         curvature at the start latitude.  Best for short lines.
+    spherical: Great circle on a sphere with the mean earth radius.
+    """
+
+    MODEL_ENU = "enu"
+    MODEL_SPHERICAL = "spherical"
+    MODELS = [MODEL_ENU, MODEL_SPHERICAL]
+
+    WGS84_A = 6378137.0                             # Semi-major axis in meters
+    WGS84_F = 1 / 298.257223563                     # Flattening
+    WGS84_E2 = WGS84_F * (2 - WGS84_F)              # Eccentricity squared
+    MEAN_RADIUS = 6371008.8                         # Mean earth radius in meters
+
+    @staticmethod
+    def destination(lat, lon, distance, bearing, model: str = MODEL_ENU):
+        """
+        Calculate the destination from the start points.
+        :param lat: Numpy array of the start latitudes in degrees.
+        :param lon: Numpy array of the start longitudes in degrees.
+        :param distance: Numpy array of the distances in meters.
+        :param bearing: Numpy array of the bearings in degrees from North.
+        :param model: enu or spherical.
+        :return: Numpy arrays of the destination latitudes and longitudes in degrees.
+        """
+        if model == Geodesic.MODEL_SPHERICAL:
+            return Geodesic.destination_spherical(lat, lon, distance, bearing)
+        return Geodesic.destination_enu(lat, lon, distance, bearing)
+
+    @staticmethod
+    def destination_enu(lat, lon, distance, bearing):
+        """
+        Calculate the destination using a local tangent plane at each start point.
+        :param lat: Numpy array of the start latitudes in degrees.
+        :param lon: Numpy array of the start longitudes in degrees.
+        :param distance: Numpy array of the distances in meters.
+        :param bearing: Numpy array of the bearings in degrees from North.
+        :return: Numpy arrays of the destination latitudes and longitudes in degrees.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        bearing_rad = np.radians(bearing)
+        north = distance * np.cos(bearing_rad)
+        east = distance * np.sin(bearing_rad)
+
+        # Radius of curvature in the meridian and the prime vertical
+        sin_lat = np.sin(np.radians(lat))
+        w = np.sqrt(1 - Geodesic.WGS84_E2 * sin_lat ** 2)
+        meridian = Geodesic.WGS84_A * (1 - Geodesic.WGS84_E2) / w ** 3
+        prime_vertical = Geodesic.WGS84_A / w
+
+        dest_lat = lat + np.degrees(north / meridian)
+        dest_lon = lon + np.degrees(east / (prime_vertical * np.cos(np.radians(lat))))
+        return dest_lat, Geodesic.wrap_lon(dest_lon)
+
+    @staticmethod
+    def destination_spherical(lat, lon, distance, bearing):
+        """
+        Calculate the destination on a great circle.
+        :param lat: Numpy array of the start latitudes in degrees.
+        :param lon: Numpy array of the start longitudes in degrees.
+        :param distance: Numpy array of the distances in meters.
+        :param bearing: Numpy array of the bearings in degrees from North.
+        :return: Numpy arrays of the destination latitudes and longitudes in degrees.
+        """
+        lat_rad = np.radians(lat)
+        lon_rad = np.radians(lon)
+        bearing_rad = np.radians(bearing)
+        angle = np.asarray(distance, dtype=np.float64) / Geodesic.MEAN_RADIUS
+
+        dest_lat = np.arcsin(np.sin(lat_rad) * np.cos(angle) +
+                             np.cos(lat_rad) * np.sin(angle) * np.cos(bearing_rad))
+        dest_lon = lon_rad + np.arctan2(np.sin(bearing_rad) * np.sin(angle) * np.cos(lat_rad),
+                                        np.cos(angle) - np.sin(lat_rad) * np.sin(dest_lat))
+        return np.degrees(dest_lat), Geodesic.wrap_lon(np.degrees(dest_lon))
+
+    @staticmethod
+    def to_local(lat, lon, origin_lat: float, origin_lon: float):
+        """
+        Convert to East and North meters from the origin on a local
+        flat plane.  Only accurate for short distances from the origin.
+        :param lat: Numpy array of latitudes in degrees.
+        :param lon: Numpy array of longitudes in degrees.
+        :param origin_lat: Latitude of the origin in degrees.
+        :param origin_lon: Longitude of the origin in degrees.
+        :return: Numpy arrays of the East and North meters.
+        """
+        meters_per_deg = np.radians(Geodesic.MEAN_RADIUS)
+        east = Geodesic.wrap_lon(np.asarray(lon, dtype=np.float64) - origin_lon) * meters_per_deg * np.cos(np.radians(origin_lat))
+        north = (np.asarray(lat, dtype=np.float64) - origin_lat) * meters_per_deg
+        return east, north
+
+    @staticmethod
+    def wrap_lon(lon):
+        """
+        Wrap the longitudes to -180 to 180 degrees.
+        :param lon: Numpy array of longitudes in degrees.
+        :return: Numpy array of longitudes in degrees.
+        """
+        return (lon + 180.0) % 360.0 - 180.0
@@ -0,0 +1,213 @@
+import time
+from threading import Condition
+from collections import deque
+
+
+class IngestQueue:
+    """
+    Bounded queue for the incoming ensembles.
+
+    When the queue is full, the policy decides what happens:
+    block: Wait for room in the queue.  Nothing is lost.  Used for playback.
+    drop_oldest: Remove the oldest ensemble to make room.
+    drop_newest: Discard the new ensemble.
+
+    The number of ensembles added, dropped and the most
+    ensembles waiting in the queue are counted.
+    """
+
+    POLICY_BLOCK = "block"
+    POLICY_DROP_OLDEST = "drop_oldest"
+    POLICY_DROP_NEWEST = "drop_newest"
+    POLICIES = [POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST]
+
+    # Time between checks if the queue is closed while waiting
+    WAIT_TIMEOUT = 0.1
+
+    def __init__(self, maxlen: int = 1000):
+        """
+        Initialize the queue.
+        :param maxlen: Maximum number of items in the queue.
+        """
+        self.maxlen = maxlen
+        self.queue = deque()
+        self.condition = Condition()
+        self.is_closed = False
+
+        # Counters
+        self.enqueued = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def put(self, item, policy: str = POLICY_BLOCK):
+        """
+        Add the item to the queue.
+        :param item: Item to add.
+        :param policy: What to do if the queue is full.
+        :return: True if the item was added.
+        """
+        with self.condition:
+            is_added = self.add_item(item, policy)
+
+            # Wakeup the consumer
+            self.condition.notify_all()
+
+        return is_added
+
+    def put_batch(self, items, policy: str = POLICY_BLOCK):
+        """
+        Add a list of items to the queue.  The lock is only
+        taken once for the list.
+        :param items: Items to add in order.
+        :param policy: What to do if the queue is full.
+        :return: Number of items added.
+        """
+        num_added = 0
+        with self.condition:
+            for item in items:
+                if self.add_item(item, policy):
+                    num_added += 1
+
+            # Wakeup the consumer
+            self.condition.notify_all()
+
+        return num_added
+
+    def add_item(self, item, policy: str):
+        """
+        Add the item to the queue using the policy if the
+        queue is full.  The condition must be held.
+        :param item: Item to add.
+        :param policy: What to do if the queue is full.
+        :return: True if the item was added.
+        """
+        if len(self.queue) >= self.maxlen:
+            if policy == IngestQueue.POLICY_DROP_NEWEST:
+                self.dropped += 1
+                return False
+            elif policy == IngestQueue.POLICY_DROP_OLDEST:
+                self.queue.popleft()
+                self.dropped += 1
+            else:
+                # Wait for the consumer to make room
+                # Wakeup the consumer first, in case it is waiting for the items already added
+                self.condition.notify_all()
+                while len(self.queue) >= self.maxlen and not self.is_closed:
+                    self.condition.wait(IngestQueue.WAIT_TIMEOUT)
+
+        if self.is_closed:
+            return False
+
+        self.queue.append(item)
+        self.enqueued += 1
+        self.high_water = max(self.high_water, len(self.queue))
+
+        return True
+
+    def get(self, timeout: float = None):
+        """
+        Remove the oldest item from the queue.  Wait
+        for an item if the queue is empty.
+        :param timeout: Maximum time to wait in seconds.  None to wait until an item is added or the queue is closed.
+        :return: Oldest item or None if no item was added.
+        """
+        with self.condition:
+            if not self.queue and not self.is_closed:
+                self.condition.wait(timeout)
+
+            if not self.queue:
+                return None
+
+            item = self.queue.popleft()
+
+            # Wakeup a blocked producer
+            self.condition.notify_all()
+
+        return item
+
+    def get_batch(self, max_items: int, max_wait: float, timeout: float = None):
+        """
+        Remove a batch of the oldest items from the queue.  Wait for the
+        first item, then wait until max_items are in the queue or max_wait
+        seconds have passed.
+        :param max_items: Maximum number of items in the batch.
+        :param max_wait: Maximum time to wait for more items after the first item in seconds.
+        :param timeout: Maximum time to wait for the first item in seconds.  None to wait until an item is added or the queue is closed.
+        :return: List of the oldest items.  Empty if no item was added.
+        """
+        with self.condition:
+            if not self.queue and not self.is_closed:
+                self.condition.wait(timeout)
+
+            if not self.queue:
+                return []
+
+            # Wait for more items to fill the batch
+            deadline = time.monotonic() + max_wait
+            while len(self.queue) < max_items and not self.is_closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch = [self.queue.popleft() for _ in range(min(max_items, len(self.queue)))]
+
+            # Wakeup a blocked producer
+            self.condition.notify_all()
+
+        return batch
+
+    def clear(self):
+        """
+        Remove all the items.  These are not counted as dropped.
+        :return:
+        """
+        with self.condition:
+            self.queue.clear()
+            self.condition.notify_all()
+
+    def close(self):
+        """
+        Close the queue.  Any waiting producer or consumer will return.
+        :return:
+        """
+        with self.condition:
+            self.is_closed = True
+            self.condition.notify_all()
+
+    def set_maxlen(self, maxlen: int):
+        """
+        Set the maximum number of items in the queue.
+        :param maxlen: Maximum number of items.
+        :return:
+        """
+        with self.condition:
+            self.maxlen = maxlen
+            self.condition.notify_all()
+
+    def reset_stats(self):
+        """
+        Reset the counters.
+        :return:
+        """
+        with self.condition:
+            self.enqueued = 0
+            self.dropped = 0
+            self.high_water = len(self.queue)
+
+    def get_stats(self):
+        """
+        Get the counters.
+        :return: Dictionary with the counters.
+        """
+        with self.condition:
+            return {
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "highWater": self.high_water,
+                "queueLen": len(self.queue),
+                "maxLen": self.maxlen,
+            }
+
+    def __len__(self):
+        return len(self.queue)
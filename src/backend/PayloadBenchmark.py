@@ -0,0 +1,143 @@
+import logging
+import sys
+import time
+import msgpack
+import numpy as np
+from rti_python.Utilities.config import RtiConfig
+from EnsembleCache import CachedEnsemble
+from VMBatchBenchmark import VMBatchBenchmark
+from PlotPayload import PlotPayload
+from Downsample import Downsample
+from AmplitudeVM import AmplitudeVM
+from ContourVM import ContourVM
+from ShipTrackVM import ShipTrackVM
+from TimeSeriesVM import TimeSeriesVM
+
+
+class PayloadBenchmark:
+    """
+    Compare the list and binary formats of the plot payloads.  Run this
+    file to do the benchmark:
+
+    python PayloadBenchmark.py
+
+    The ViewModels are filled with synthetic ensembles.  For each plot,
+    the payload is built and encoded with msgpack, then decoded, like a
+    plot RPC.  The time and the number of bytes are shown for each format.
+    The decoded binary arrays are also checked against the list values.
+    """
+
+    NUM_ENS = 4096                              # Ensembles in each plot
+    NUM_BINS = 30                               # Bins in each ensemble
+    NUM_RUNS = 20                               # Times each payload is built
+
+    @staticmethod
+    def create_plots():
+        """
+        Create the ViewModels with the synthetic ensembles.
+        :return: Dictionary of the plot name and a function to get the payload in a format.
+        """
+        reader = VMBatchBenchmark.create_reader(PayloadBenchmark.NUM_ENS, PayloadBenchmark.NUM_BINS)
+        ens_list = [CachedEnsemble(reader, index) for index in range(PayloadBenchmark.NUM_ENS)]
+
+        rti_config = RtiConfig()
+        rti_config.init_timeseries_plot_config()
+        timeseries_vm = TimeSeriesVM(rti_config=rti_config)
+        timeseries_vm.set_ens_batch(ens_list)
+        contour_vm = ContourVM(PayloadBenchmark.NUM_ENS)
+        contour_vm.set_ens_batch(ens_list)
+        amp_vm = AmplitudeVM()
+        amp_vm.set_ens_batch(ens_list[-10:])
+        shiptrack_vm = ShipTrackVM(tolerance=0.0, quiver_spacing=0.0)
+        shiptrack_vm.set_ens_batch(ens_list)
+
+        return {
+            "Contour mag": (contour_vm, lambda fmt: contour_vm.get_data("mag", 0, Downsample.METHOD_MEAN, fmt)),
+            "Time Series": (timeseries_vm, lambda fmt: timeseries_vm.get_data(0, fmt)),
+            "Amplitude": (amp_vm, lambda fmt: amp_vm.get_data(fmt)),
+            "Ship Track": (shiptrack_vm, lambda fmt: shiptrack_vm.get_data(False, fmt)),
+        }
+
+    @staticmethod
+    def from_binary(value):
+        """
+        Convert a binary array from PlotPayload.to_binary() back to a numpy array.
+        :param value: Decoded value.
+        :return: Numpy array, or the value if it is not a binary array.
+        """
+        if isinstance(value, dict) and set(value) == {"dtype", "shape", "data"}:
+            return np.frombuffer(value["data"], dtype=np.dtype(value["dtype"]).newbyteorder('<')).reshape(value["shape"])
+        return value
+
+    @staticmethod
+    def compare(list_value, binary_value, key: str):
+        """
+        Check the decoded binary value matches the decoded list value.
+        :param list_value: Value of the list format.
+        :param binary_value: Value of the binary format.
+        :param key: Key of the value in the payload.
+        :return: Error message or None if the values match.
+        """
+        binary_value = PayloadBenchmark.from_binary(binary_value)
+        if not isinstance(binary_value, np.ndarray):
+            return None if list_value == binary_value else key + " does not match"
+
+        if key == "X_dt":
+            is_same = PlotPayload.to_iso_list((binary_value * 1000).astype(np.int64)) == list_value
+        else:
+            values = np.array(list_value, dtype=object)
+            values = np.where(np.equal(values, None), np.nan, values).astype(np.float64)
+            is_same = values.shape == binary_value.shape and np.allclose(values, binary_value, rtol=1e-6, equal_nan=True)
+
+        return None if is_same else key + " does not match"
+
+    @staticmethod
+    def run():
+        """
+        Build, encode and decode each plot payload in each format.
+        :return: List of (plot, format, build and encode ms, decode ms, bytes) and the list of errors.
+        """
+        results = []
+        errors = []
+        for name, (vm, get_payload) in PayloadBenchmark.create_plots().items():
+            decoded = {}
+            for fmt in PlotPayload.FORMATS:
+                start = time.perf_counter()
+                for _ in range(PayloadBenchmark.NUM_RUNS):
+                    # Build the payload again each time
+                    vm.snapshot.payloads.clear()
+                    packed = msgpack.packb(get_payload(fmt), use_bin_type=True)
+                encode_ms = (time.perf_counter() - start) / PayloadBenchmark.NUM_RUNS * 1000.0
+
+                start = time.perf_counter()
+                for _ in range(PayloadBenchmark.NUM_RUNS):
+                    decoded[fmt] = msgpack.unpackb(packed)
+                decode_ms = (time.perf_counter() - start) / PayloadBenchmark.NUM_RUNS * 1000.0
+
+                results.append((name, fmt, encode_ms, decode_ms, len(packed)))
+
+            list_payload = decoded[PlotPayload.FORMAT_LIST]
+            binary_payload = decoded[PlotPayload.FORMAT_BINARY]
+            if set(list_payload) != set(binary_payload):
+                errors.append(name + ": the formats have different keys")
+                continue
+            for key in list_payload:
+                error = PayloadBenchmark.compare(list_payload[key], binary_payload[key], key)
+                if error:
+                    errors.append(name + ": " + error)
+
+        return results, errors
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+
+    bench_results, bench_errors = PayloadBenchmark.run()
+    for plot, bench_fmt, bench_encode_ms, bench_decode_ms, num_bytes in bench_results:
+        logging.info("%-12s %-7s build + encode %8.2f ms  decode %7.2f ms  %10d bytes",
+                     plot, bench_fmt, bench_encode_ms, bench_decode_ms, num_bytes)
+
+    for bench_error in bench_errors:
+        logging.error(bench_error)
+    if bench_errors:
+        sys.exit(1)
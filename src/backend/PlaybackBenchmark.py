@@ -0,0 +1,200 @@
+import logging
+import os
+import struct
+import sys
+import tempfile
+import time
+from PlaybackManager import PlaybackManager
+
+
+class PlaybackBenchmark:
+    """
+    Measure how fast the playback finds the ensembles in a file.
+    Run this file to do the benchmark:
+
+    python PlaybackBenchmark.py
+
+    A synthetic RTB file is written for each ensemble size.  The
+    ensembles are not decoded, so only the cost of reading the file
+    and finding the ensembles is measured.  The memory mapped scanner
+    used by PlaybackManager.playback() is compared with the 4 KB
+    read and split used before it.
+
+    Give RTB files to also measure the decoding with each number of
+    playback processes:
+
+    python PlaybackBenchmark.py file1.ens file2.ens
+
+    Real files are needed, because the ensembles must pass the checksum
+    to be decoded.  The time to the first ensemble and the ensembles per
+    second passed to the data manager are shown.
+    """
+
+    FILE_SIZE = 96 * 1024 * 1024                # Size of each synthetic file
+    ENS_SIZES = [12 * 1024, 64 * 1024]          # Size of the ensembles in each file
+    READ_SIZE = 4096                            # Read size of the old playback
+
+    @staticmethod
+    def create_ens(ens_num: int, ens_size: int):
+        """
+        Create a binary ensemble with a good RTB header.  The payload
+        does not contain the delimiter.
+        :param ens_num: Ensemble number.
+        :param ens_size: Size of the ensemble in bytes.
+        :return: Binary ensemble.
+        """
+        payload_size = ens_size - PlaybackManager.HEADER_SIZE - PlaybackManager.CHECKSUM_SIZE
+        header = PlaybackManager.DELIMITER + struct.pack('<IIII',
+                                                         ens_num, ~ens_num & 0xFFFFFFFF,
+                                                         payload_size, ~payload_size & 0xFFFFFFFF)
+        payload = bytes(range(128)) * (payload_size // 128) + bytes(payload_size % 128)
+        return header + payload + bytes(PlaybackManager.CHECKSUM_SIZE)
+
+    @staticmethod
+    def create_file(file_path, ens_size: int, file_size: int = FILE_SIZE):
+        """
+        Write a synthetic RTB file.
+        :param file_path: File path.
+        :param ens_size: Size of each ensemble in bytes.
+        :param file_size: Size of the file in bytes.
+        :return: Number of ensembles written.
+        """
+        num_ens = max(1, file_size // ens_size)
+        with open(file_path, "wb") as f:
+            for ens_num in range(num_ens):
+                f.write(PlaybackBenchmark.create_ens(ens_num, ens_size))
+        return num_ens
+
+    @staticmethod
+    def read_split(file_path, process):
+        """
+        Find the ensembles the way the playback did before the memory map.
+        The file is read in 4 KB blocks added to a buffer and the buffer
+        is split on the delimiter.
+        :param file_path: File path.
+        :param process: Called with each binary ensemble.
+        :return:
+        """
+        delimiter = PlaybackManager.DELIMITER
+        buff = bytes()
+        with open(file_path, "rb") as f:
+            data = f.read(PlaybackBenchmark.READ_SIZE)
+            while data:
+                buff += data
+                if delimiter in buff:
+                    chunks = buff.split(delimiter)
+                    buff = chunks.pop()
+                    for chunk in chunks:
+                        if chunk:
+                            process(delimiter + chunk)
+                data = f.read(PlaybackBenchmark.READ_SIZE)
+        if buff:
+            process(delimiter + buff)
+
+    @staticmethod
+    def scan_mmap(file_path, process):
+        """
+        Find the ensembles with the PlaybackManager memory mapped scanner.
+        :param file_path: File path.
+        :param process: Called with each binary ensemble.
+        :return:
+        """
+        playback_mgr = PlaybackManager(None)
+
+        def count_ens(ens_bin):
+            process(ens_bin)
+            return True
+
+        playback_mgr.process_playback_ens = count_ens
+        playback_mgr.playback(file_path)
+
+    @staticmethod
+    def run():
+        """
+        Run the benchmark for each ensemble size.
+        :return: List of (ensemble size, method, MB/s, ensembles found).
+        """
+        results = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for ens_size in PlaybackBenchmark.ENS_SIZES:
+                file_path = os.path.join(tmp_dir, "bench_" + str(ens_size) + ".ens")
+                num_ens = PlaybackBenchmark.create_file(file_path, ens_size)
+                file_size = os.path.getsize(file_path)
+
+                for name, scan in [("read_split", PlaybackBenchmark.read_split),
+                                   ("mmap", PlaybackBenchmark.scan_mmap)]:
+                    found = [0]
+
+                    def process(ens_bin):
+                        found[0] += 1
+
+                    start = time.perf_counter()
+                    scan(file_path, process)
+                    elapsed = time.perf_counter() - start
+
+                    if found[0] != num_ens:
+                        logging.error(name + " found " + str(found[0]) + " ensembles, expected " + str(num_ens))
+                    results.append((ens_size, name, file_size / elapsed / 1e6, found[0]))
+
+        return results
+
+    @staticmethod
+    def run_decode(files, worker_counts=None):
+        """
+        Playback the files with each number of playback processes.
+        :param files: RTB files.
+        :param worker_counts: Number of processes to use.  DEFAULT: 1 and the number of CPU cores.
+        :return: List of (processes, seconds to the first ensemble, ensembles per second, ensembles passed).
+        """
+        if worker_counts is None:
+            worker_counts = sorted({1, os.cpu_count() or 1})
+
+        results = []
+        for num_workers in worker_counts:
+            data_mgr = BenchmarkDataManager()
+            playback_mgr = PlaybackManager(data_mgr, num_workers)
+
+            data_mgr.start = time.perf_counter()
+            playback_mgr.playback_thread(files)
+            elapsed = time.perf_counter() - data_mgr.start
+
+            results.append((num_workers, data_mgr.first_time, data_mgr.num_ens / elapsed, data_mgr.num_ens))
+
+        return results
+
+
+class BenchmarkDataManager:
+    """
+    Data manager that only counts the ensembles passed by the playback.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self.num_ens = 0
+        self.start = time.perf_counter()
+        self.first_time = None                  # Seconds from the start to the first ensemble
+
+    def incoming_ens(self, ens, policy: str = None, generation: int = None):
+        """
+        Count the ensemble.
+        :param ens: Ensemble.
+        :param policy: Not used.
+        :param generation: Not used.
+        :return:
+        """
+        if self.first_time is None:
+            self.first_time = time.perf_counter() - self.start
+        self.num_ens += 1
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+
+    for bench_ens_size, bench_name, mb_s, num_found in PlaybackBenchmark.run():
+        logging.info("%3d KB ensembles  %-10s %8.1f MB/s  %d ensembles",
+                     bench_ens_size // 1024, bench_name, mb_s, num_found)
+
+    if len(sys.argv) > 1:
+        for workers, first_time, ens_s, num_passed in PlaybackBenchmark.run_decode(sys.argv[1:]):
+            logging.info("%2d processes  first ensemble %6.3f s  %8.1f ens/s  %d ensembles",
+                         workers, first_time or 0.0, ens_s, num_passed)
@@ -1,83 +1,644 @@
 import logging
+import mmap
+import os
+import struct
+import time
+from collections import deque
+from threading import Event
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
 from rti_python.Codecs.BinaryCodec import BinaryCodec
 from rti_python.Codecs.AdcpCodec import AdcpCodec
+from rti_python.Utilities.qa_qc import EnsembleQC
+from FileWatcher import FileWatcher
 
 
 class PlaybackManager:
 
-    def __init__(self, data_mgr):
+    # RTB ensemble delimiter
+    DELIMITER = b'\x80' * 16
+
+    # RTB header (delimiter, ensemble number, payload size) and checksum size
+    HEADER_SIZE = 32
+    CHECKSUM_SIZE = 4
+
+    # Size of the file pieces given to each playback process
+    # The decoded ensembles of a piece are held in memory and sent back from the
+    # process at once, so small pieces keep the memory and the transfers small and
+    # the first ensembles are displayed as soon as the first piece is decoded
+    CHUNK_SIZE = 2 * 1024 * 1024
+
+    # Longest wait for a followed file to grow before checking again
+    FOLLOW_TIMEOUT = 0.1
+
+    # Most data read from a followed file at a time
+    FOLLOW_READ_SIZE = 1024 * 1024
+
+    # Longest wait for a decoded piece before checking if the playback was stopped
+    RESULT_TIMEOUT = 0.1
+
+    # Longest wait between ensembles when pacing.  Larger gaps
+    # in the recording, like between files, are skipped.
+    MAX_PACE_DELAY = 5.0
+
+    def __init__(self, data_mgr, num_workers: int = 1, ens_cache=None):
         """
         Playback manager will open the files given and playback all the
         ensemble data.
         :param data_mgr: Data Manager to handle the incoming ensemble.
+        :param num_workers: Number of processes to decode the ensembles.  1 will decode
+        in the playback thread.  0 will use a process for each CPU core.
+        :param ens_cache: EnsembleCache to store the decoded ensembles.  None to not cache.
         """
         self.data_mgr = data_mgr
         self.adcp_codec = AdcpCodec()
         self.logger = logging.getLogger('root')
 
+        self.num_workers = num_workers
+        if self.num_workers <= 0:
+            self.num_workers = os.cpu_count() or 1
+
+        # Playback control
+        self.stop_event = Event()                       # Set to stop the playback
+        self.resume_event = Event()                     # Cleared to pause the playback
+        self.resume_event.set()
+
+        # Playback rate.  0 is as fast as possible, 1.0 is real time
+        self.rate = 0.0
+        self.pace_wall_time = None
+        self.pace_ens_time = None
+
+        # Decoded ensemble cache
+        self.ens_cache = ens_cache
+        self.cache_writer = None
+
+        # Data manager generation when the playback started.  None for the current generation.
+        self.generation = None
+
     def playback_thread(self, files):
         """
         Process of the files to playback.
         :param files: Files to playback.
-        :return:
+        :return: True if all the files were played, False if the playback was stopped.
         """
+        # Decode the files in multiple processes
+        if self.num_workers > 1:
+            return self.playback_parallel(files)
+
         # Read the file
         for file in files:
-            self.playback(file)
+            if not self.playback(file):
+                return False
 
-    def playback(self, file_path):
+        return True
+
+    def is_playing(self):
+        """
+        Check if the playback should continue.
+        :return: False if the playback was stopped.
+        """
+        return not self.stop_event.is_set()
+
+    def stop(self):
+        """
+        Stop the playback.  This will also wake up a paused playback.
+        :return:
+        """
+        self.stop_event.set()
+        self.resume_event.set()
+
+    def pause(self):
+        """
+        Pause the playback.  The playback will wait before passing the next ensemble.
+        :return:
+        """
+        self.resume_event.clear()
+
+    def resume(self):
+        """
+        Resume the playback.
+        :return:
+        """
+        # Restart the pacing from the next ensemble
+        self.pace_ens_time = None
+        self.resume_event.set()
+
+    def set_rate(self, rate: float):
+        """
+        Set the playback rate.
+        :param rate: 0 is as fast as possible, 1.0 is real time and N is N times real time.
+        :return:
+        """
+        self.rate = rate
+        self.pace_ens_time = None
+
+    def pace(self, ens):
+        """
+        Wait until it is time to pass the ensemble based off the
+        ensemble time and the playback rate.
+        :param ens: Ensemble to pass.
+        :return:
+        """
+        if self.rate <= 0 or not ens.IsEnsembleData:
+            return
+
+        ens_time = ens.EnsembleData.datetime().timestamp()
+        now = time.monotonic()
+
+        # Start the pacing from the first ensemble or when time goes backwards
+        if self.pace_ens_time is None or ens_time < self.pace_ens_time:
+            self.pace_ens_time = ens_time
+            self.pace_wall_time = now
+            return
+
+        delay = self.pace_wall_time + (ens_time - self.pace_ens_time) / self.rate - now
+        if delay > PlaybackManager.MAX_PACE_DELAY:
+            # Skip gaps in the data
+            self.pace_ens_time = ens_time
+            self.pace_wall_time = now
+        elif delay > 0:
+            # Wait, but wakeup if stopped
+            self.stop_event.wait(delay)
+
+    def pass_ens(self, ens):
+        """
+        Pass the decoded ensemble to the data manager.
+        This will wait if the playback is paused or paced.
+        :param ens: Decoded ensemble.
+        :return: False if the playback was stopped.
+        """
+        # Wait while paused
+        self.resume_event.wait()
+
+        # Wait for the ensemble time
+        self.pace(ens)
+
+        # Paused while waiting for the ensemble time
+        if not self.resume_event.is_set():
+            self.resume_event.wait()
+            self.pace_ens_time = None
+
+        if not self.is_playing():
+            return False
+
+        self.data_mgr.incoming_ens(ens, generation=self.generation)
+        return True
+
+    def playback_parallel(self, files):
+        """
+        Playback the given files using a process pool.  The files are split
+        into pieces at ensemble boundaries.  Each process will verify and decode
+        a piece.  The pieces are passed to the data manager in the original order.
+        :param files: Files to playback.
+        :return: True if all the files were played, False if the playback was stopped.
+        """
+        # Split all the files in to pieces
+        # Cached files are not decoded
+        tasks = []
+        for file_path in files:
+            cache_reader = self.open_cache(file_path)
+            if cache_reader:
+                tasks.append((file_path, cache_reader, None))
+                continue
+
+            pieces = PlaybackManager.split_file(file_path, PlaybackManager.CHUNK_SIZE)
+            for piece_idx, (start, end) in enumerate(pieces):
+                tasks.append((file_path, None, (start, end, piece_idx == 0, piece_idx == len(pieces) - 1)))
+
+        # Limit the number of decoded pieces waiting in memory
+        max_pending = self.num_workers * 2
+
+        executor = ProcessPoolExecutor(max_workers=self.num_workers)
+        pending = deque()
+        is_done = True
+        try:
+            num_running = 0
+            for file_path, cache_reader, piece in tasks:
+                if piece:
+                    start, end, is_first, is_last = piece
+                    pending.append((file_path, None, executor.submit(decode_file_chunk, file_path, start, end), is_first, is_last))
+                    num_running += 1
+                else:
+                    pending.append((file_path, cache_reader, None, False, False))
+
+                # Pass the oldest pieces when the pool is full
+                while num_running >= max_pending and is_done:
+                    if pending[0][2]:
+                        num_running -= 1
+                    is_done = self.pass_parallel_task(*pending.popleft())
+
+                if not is_done:
+                    break
+
+            # Pass the remaining pieces in order
+            while pending and is_done:
+                is_done = self.pass_parallel_task(*pending.popleft())
+        finally:
+            # Do not wait for pieces that will not be used.  A stopped playback
+            # returns without waiting for the pieces still being decoded.
+            executor.shutdown(wait=is_done, cancel_futures=True)
+
+        # Remove a partial cache
+        self.end_cache(False)
+
+        return is_done
+
+    def pass_parallel_task(self, file_path, cache_reader, future, is_first, is_last):
+        """
+        Pass the ensembles of a cached file or a decoded piece to the data manager.
+        :param file_path: Ensemble file path.
+        :param cache_reader: Cache of the file or None if the piece was decoded.
+        :param future: Future with the decoded ensembles of the piece.
+        :param is_first: First piece of the file.
+        :param is_last: Last piece of the file.
+        :return: False if the playback was stopped.
+        """
+        if cache_reader:
+            self.logger.debug("Loading cached file: " + str(file_path))
+            return self.playback_cache(cache_reader)
+
+        if is_first:
+            self.logger.debug("Loading file: " + str(file_path))
+            self.start_cache(file_path)
+
+        # Check if the playback was stopped while waiting for the piece
+        ens_list = None
+        while ens_list is None:
+            if not self.is_playing():
+                return False
+            try:
+                ens_list = future.result(timeout=PlaybackManager.RESULT_TIMEOUT)
+            except TimeoutError:
+                pass
+
+        for ens in ens_list:
+            if not self.pass_decoded(ens):
+                return False
+
+        if is_last:
+            self.end_cache(True)
+
+        return True
+
+    def open_cache(self, file_path):
+        """
+        Open the decoded ensemble cache of the file.
+        :param file_path: Ensemble file path.
+        :return: EnsembleCacheReader or None if the file is not cached.
+        """
+        if self.ens_cache is None or os.path.getsize(file_path) == 0:
+            return None
+
+        return self.ens_cache.open(file_path)
+
+    def start_cache(self, file_path):
         """
-        Playback the given file.  This will read the file
-        then call ensemble_rcv to process the ensemble.
+        Start writing the decoded ensembles of the file to the cache.
         :param file_path: Ensemble file path.
         :return:
         """
-        # RTB ensemble delimiter
-        DELIMITER = b'\x80' * 16
+        if self.ens_cache is None:
+            return
 
-        BLOCK_SIZE = 4096
+        try:
+            self.cache_writer = self.ens_cache.create_writer(file_path)
+        except OSError as e:
+            self.logger.error("Error creating ensemble cache. " + str(e))
 
-        # Create a buffer
-        buff = bytes()
+    def end_cache(self, is_done: bool):
+        """
+        Finish writing the cache.  The cache is only kept if the whole file was played.
+        :param is_done: True if the whole file was played.
+        :return:
+        """
+        if self.cache_writer is None:
+            return
+
+        try:
+            if is_done:
+                self.cache_writer.commit()
+            else:
+                self.cache_writer.abort()
+        except OSError as e:
+            self.logger.error("Error writing ensemble cache. " + str(e))
+            self.cache_writer.abort()
+
+        self.cache_writer = None
+
+    def pass_decoded(self, ens):
+        """
+        Cache the decoded ensemble and pass it to the data manager.
+        :param ens: Decoded ensemble.
+        :return: False if the playback was stopped.
+        """
+        if self.cache_writer:
+            self.cache_writer.append(ens)
+
+        return self.pass_ens(ens)
+
+    def playback_cache(self, cache_reader):
+        """
+        Playback the cached ensembles of a file.
+        :param cache_reader: Cache of the file.
+        :return: False if the playback was stopped.
+        """
+        for index in range(len(cache_reader)):
+            if not self.pass_ens(cache_reader.get_ens(index)):
+                return False
+
+        return True
+
+    def playback(self, file_path):
+        """
+        Playback the given file.  This will memory map the file
+        then call process_playback_ens with a zero-copy view of
+        each ensemble.
+
+        If the file was played before, the cached ensembles are used.
+        :param file_path: Ensemble file path.
+        :return: False if the playback was stopped.
+        """
+        self.logger.debug("Loading file: " + str(file_path))
 
+        # mmap can not map an empty file
+        if os.path.getsize(file_path) == 0:
+            return True
+
+        # Use the decoded ensembles from the cache
+        cache_reader = self.open_cache(file_path)
+        if cache_reader:
+            return self.playback_cache(cache_reader)
+
+        self.start_cache(file_path)
+
+        is_done = True
         with open(file_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    for start, end in PlaybackManager.find_ensembles(mm):
+                        with view[start:end] as ens_bin:
+                            # Process the binary ensemble data
+                            # Check if we need to shutdown
+                            if not self.process_playback_ens(ens_bin):
+                                is_done = False
+                                break
+                finally:
+                    # All the views must be released before the map can be closed
+                    view.release()
 
-            self.logger.debug("Loading file: " + str(file_path))
+        self.end_cache(is_done)
+
+        return is_done
 
-            # Read in the file
-            # for chunk in iter(lambda: f.read(4096), b''):
-            #    self.adcp_codec.add(chunk)
+    def follow(self, file_path):
+        """
+        Playback the file while it is still being recorded.  The existing
+        data is played, then the file is watched for new data.  Only the
+        new data is decoded.  An ensemble that is not completely written
+        is kept until the rest of it is written.
 
-            data = f.read(BLOCK_SIZE)  # Read in data
+        The file is read in pieces, so following a large file does not read
+        the whole file in to memory.  Only the data after the last complete
+        ensemble is kept between reads.
 
-            while data:                                                 # Verify data was found
-                buff += data                                            # Accumulate the buffer
-                if DELIMITER in buff:                                   # Check for the delimiter
-                    chunks = buff.split(DELIMITER)                      # If delimiter found, split to get the remaining buffer data
-                    buff = chunks.pop()                                 # Put the remaining data back in the buffer
+        When the recorder starts the next file, the playback moves to
+        the next file.  This will continue until the playback is stopped.
+        :param file_path: Ensemble file path.
+        :return: False when the playback is stopped.
+        """
+        self.logger.debug("Following file: " + str(file_path))
 
-                    for chunk in chunks:                                # Take out the ens data
-                        self.process_playback_ens(DELIMITER + chunk)    # Process the binary ensemble data
+        watcher = FileWatcher(os.path.dirname(os.path.abspath(file_path)))
+        buff = bytearray()
+        next_file = None
+        f = open(file_path, "rb")
 
-                data = f.read(BLOCK_SIZE)  # Read the next batch of data
+        try:
+            while self.is_playing():
+                data = f.read(PlaybackManager.FOLLOW_READ_SIZE)
+                if data:
+                    # Decode the new data
+                    buff += data
+                    del buff[:self.process_follow_buffer(buff, False)]
+                    continue
 
-                # Check if we need to shutdown
-                #if not self.ens_thread_alive:
-                #    return
+                if next_file:
+                    # The file was read to the end after the recorder
+                    # started the new file, so anything left is the last ensemble
+                    self.process_follow_buffer(buff, True)
+                    buff.clear()
+                    f.close()
 
-        # Process whatever is remaining in the buffer
-        self.process_playback_ens(DELIMITER + buff)
+                    file_path = next_file
+                    next_file = None
+                    self.logger.debug("Following file: " + str(file_path))
+                    f = open(file_path, "rb")
+                    continue
 
-        # Close the file
-        f.close()
+                # Move to the next file when the recorder starts a new file
+                # Read to the end of the file again before moving
+                next_file = FileWatcher.next_file(file_path)
+                if next_file:
+                    continue
 
-    def process_playback_ens(self, ens_bin):
+                # Wait for the file to grow
+                watcher.wait(PlaybackManager.FOLLOW_TIMEOUT)
+        finally:
+            f.close()
+            watcher.close()
+
+        return False
+
+    def process_follow_buffer(self, buff: bytearray, is_final: bool):
+        """
+        Decode all the complete ensembles in the buffer.
+        :param buff: Data read from the followed file.
+        :param is_final: True if no more data will be added, so the last ensemble is complete.
+        :return: Number of bytes used from the start of the buffer.
+        """
+        used = 0
+        view = memoryview(buff)
+        try:
+            for start, end in PlaybackManager.find_ensembles(buff):
+                if end == len(buff) and not is_final:
+                    # Check if the last ensemble is completely written
+                    ens_size = PlaybackManager.ensemble_size(buff, start)
+                    if ens_size is None or start + ens_size > len(buff):
+                        return start
+                    end = start + ens_size
+
+                with view[start:end] as ens_bin:
+                    self.process_playback_ens(ens_bin)
+                used = end
+
+            # Keep the end of the buffer in case it is the start of a delimiter
+            return max(used, len(buff) - len(PlaybackManager.DELIMITER) + 1)
+        finally:
+            view.release()
+
+    @staticmethod
+    def ensemble_size(buff, start: int):
+        """
+        Get the size of the ensemble from the RTB header.
+        :param buff: Buffer with the ensemble.
+        :param start: Start of the ensemble in the buffer.
+        :return: Size of the ensemble including the header and checksum.  None if the header is not complete or bad.
+        """
+        if len(buff) < start + PlaybackManager.HEADER_SIZE:
+            return None
+
+        # Payload size and the inverse of the payload size
+        payload_size, inv_payload_size = struct.unpack_from('<II', buff, start + 24)
+        if payload_size ^ inv_payload_size != 0xFFFFFFFF:
+            return None
+
+        return PlaybackManager.HEADER_SIZE + payload_size + PlaybackManager.CHECKSUM_SIZE
+
+    def playback_records(self, file_path, records):
+        """
+        Playback only the given ensembles of the file.  The records
+        come from the EnsembleIndex, so only the selected ensembles
+        are read and decoded.
+        :param file_path: Ensemble file path.
+        :param records: EnsembleIndex records to playback.
+        :return: False if the playback was stopped.
+        """
+        if len(records) == 0:
+            return True
+
+        self.logger.debug("Loading " + str(len(records)) + " ensembles from file: " + str(file_path))
+
+        with open(file_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    for offset, length in zip(records['offset'].tolist(), records['length'].tolist()):
+                        with view[offset:offset + length] as ens_bin:
+                            if not self.process_playback_ens(ens_bin):
+                                return False
+                finally:
+                    view.release()
+
+        return True
+
+    @staticmethod
+    def find_ensembles(buff, start: int = 0, end: int = None):
+        """
+        Find all the ensembles in the buffer.  The buffer is searched
+        for the RTB delimiter without copying the data, so it can be
+        a bytes, bytearray or mmap object.
+
+        Any data before the first delimiter is skipped.  The last ensemble
+        runs to the end of the buffer.
+        :param buff: Buffer to search.
+        :param start: Start offset in the buffer.
+        :param end: End offset in the buffer.  DEFAULT: end of the buffer.
+        :return: Generator of (start, end) offsets for each ensemble.
+        """
+        if end is None:
+            end = len(buff)
+
+        ens_start = buff.find(PlaybackManager.DELIMITER, start, end)   # Find the first delimiter
+        while ens_start >= 0:
+            # Look for the next delimiter after this ensemble's delimiter
+            ens_end = buff.find(PlaybackManager.DELIMITER, ens_start + len(PlaybackManager.DELIMITER), end)
+            if ens_end < 0:
+                yield ens_start, end                                    # Remaining data in the buffer
+                return
+
+            yield ens_start, ens_end
+            ens_start = ens_end
+
+    @staticmethod
+    def split_file(file_path, chunk_size: int):
+        """
+        Split the file into pieces of about chunk_size bytes.  Each
+        piece will start on an ensemble delimiter, so the pieces
+        can be decoded independently.
+        :param file_path: Ensemble file path.
+        :param chunk_size: Size of each piece in bytes.
+        :return: List of (start, end) offsets for each piece.
+        """
+        file_size = os.path.getsize(file_path)
+
+        # mmap can not map an empty file
+        if file_size == 0:
+            return []
+
+        pieces = []
+        with open(file_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = 0
+                while start < file_size:
+                    # Move the end of the piece to the next delimiter
+                    end = mm.find(PlaybackManager.DELIMITER, start + chunk_size)
+                    if end < 0:
+                        end = file_size
+
+                    pieces.append((start, end))
+                    start = end
+
+        return pieces
+
+    @staticmethod
+    def decode_ens(ens_bin):
+        """
+        Verify, decode and screen the binary ensemble data.
+        :param ens_bin: Binary ensemble data.  This can be a memoryview.
+        :return: Decoded ensemble or None if the data is bad.
+        """
         # Verify the ENS data is good
         # This will check that all the data is there and the checksum is good
         if BinaryCodec.verify_ens_data(ens_bin):
             # Decode the ens binary data
             ens = BinaryCodec.decode_data_sets(ens_bin)
 
-            # Pass the ensemble to the data manager
+            # QA QC the data
             if ens:
-                self.data_mgr.incoming_ens(ens)
+                EnsembleQC.scan_ensemble(ens)
+                return ens
+
+        return None
+
+    def process_playback_ens(self, ens_bin):
+        """
+        Verify and decode the ensemble then pass it to the data manager.
+        :param ens_bin: Binary ensemble data.  This can be a memoryview.
+        :return: False if the playback was stopped.
+        """
+        if not self.is_playing():
+            return False
+
+        ens = PlaybackManager.decode_ens(ens_bin)
+
+        # Pass the ensemble to the data manager
+        if ens:
+            return self.pass_decoded(ens)
+
+        return True
+
+
+def decode_file_chunk(file_path, start: int, end: int):
+    """
+    Decode all the ensembles in a piece of the file.
+    This is run in a playback process, so it must be
+    a module level function.
+    :param file_path: Ensemble file path.
+    :param start: Start offset of the piece.
+    :param end: End offset of the piece.
+    :return: List of decoded ensembles in file order.
+    """
+    ens_list = []
+    with open(file_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for ens_start, ens_end in PlaybackManager.find_ensembles(mm, start, end):
+                    with view[ens_start:ens_end] as ens_bin:
+                        ens = PlaybackManager.decode_ens(ens_bin)
+                    if ens:
+                        ens_list.append(ens)
+            finally:
+                view.release()
+
+    return ens_list
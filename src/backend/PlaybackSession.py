@@ -0,0 +1,259 @@
+import logging
+from threading import Thread, Lock
+from typing import List
+from PlaybackManager import PlaybackManager
+from EnsembleIndex import EnsembleIndex
+
+
+class PlaybackSession:
+    """
+    A playback of a list of files that can be paused, resumed,
+    cancelled and moved to a different ensemble or time.
+
+    The playback is run in its own thread.  Only one session
+    should be playing at a time, so cancel the old session before
+    starting a new one.
+    """
+
+    # Session states
+    STATE_IDLE = "idle"
+    STATE_PLAYING = "playing"
+    STATE_PAUSED = "paused"
+    STATE_CANCELLED = "cancelled"
+    STATE_COMPLETE = "complete"
+
+    def __init__(self,
+                 data_mgr,
+                 files: List[str],
+                 rate: float = 0.0,
+                 num_workers: int = 1,
+                 records=None,
+                 select=None,
+                 on_seek=None,
+                 ens_cache=None,
+                 follow: bool = False):
+        """
+        Create the playback session.
+        :param data_mgr: Data Manager to handle the incoming ensemble.
+        :param files: Files to playback.
+        :param rate: 0 is as fast as possible, 1.0 is real time and N is N times real time.
+        :param num_workers: Number of processes to decode the files.
+        :param records: EnsembleIndex records of the first file.  If set, only these ensembles are played.
+        :param select: Function to select the records from the EnsembleIndex of the first file.  The index
+                       is built in the playback thread, so a large file does not block the caller.
+        :param on_seek: Called before playing from the new position after a seek.  Used to clear the plots.
+        :param ens_cache: EnsembleCache used to skip decoding files played before.
+        :param follow: Follow the first file while it is recorded.  Seek is not used when following.
+        """
+        self.data_mgr = data_mgr
+        self.files = files
+        self.num_workers = num_workers
+        self.records = records
+        self.select = select
+        self.on_seek = on_seek
+        self.is_follow = follow
+
+        self.playback_mgr = PlaybackManager(data_mgr, num_workers, ens_cache)
+        self.playback_mgr.set_rate(rate)
+
+        self.state = PlaybackSession.STATE_IDLE
+        self.seek_target = None                         # (is_time, value) of the next seek
+        self.thread = None
+        self.thread_lock = Lock()
+
+    def start(self):
+        """
+        Start the playback thread.
+        :return:
+        """
+        self.state = PlaybackSession.STATE_PLAYING
+        self.thread = Thread(name="AdcpDataManager Playback Thread", target=self.run)
+        self.thread.start()
+
+    def pause(self):
+        """
+        Pause the playback.
+        :return:
+        """
+        if self.state == PlaybackSession.STATE_PLAYING:
+            self.state = PlaybackSession.STATE_PAUSED
+            self.playback_mgr.pause()
+
+    def resume(self):
+        """
+        Resume a paused playback.
+        :return:
+        """
+        if self.state == PlaybackSession.STATE_PAUSED:
+            self.state = PlaybackSession.STATE_PLAYING
+            self.playback_mgr.resume()
+
+    def cancel(self, wait: bool = True):
+        """
+        Cancel the playback.
+        :param wait: Wait for the playback thread to stop.
+        :return:
+        """
+        # Lock the object
+        self.thread_lock.acquire()
+
+        if self.is_active():
+            self.state = PlaybackSession.STATE_CANCELLED
+        self.playback_mgr.stop()
+
+        # Release the lock
+        self.thread_lock.release()
+
+        if wait and self.thread:
+            self.thread.join()
+
+    def set_rate(self, rate: float):
+        """
+        Set the playback rate.
+        :param rate: 0 is as fast as possible, 1.0 is real time and N is N times real time.
+        :return:
+        """
+        self.playback_mgr.set_rate(rate)
+
+    def seek_ens(self, ens_num: int):
+        """
+        Move the playback to the ensemble number.
+        :param ens_num: Ensemble number to play next.
+        :return:
+        """
+        self.seek((False, ens_num))
+
+    def seek_time(self, timestamp: float):
+        """
+        Move the playback to the time.
+        :param timestamp: Time to play next in seconds since epoch (UTC).
+        :return:
+        """
+        self.seek((True, timestamp))
+
+    def seek(self, target):
+        """
+        Stop the current playback and let the thread
+        continue from the seek target.
+        :param target: (is_time, value) seek target.
+        :return:
+        """
+        if self.is_follow:
+            return
+
+        # Lock the object
+        self.thread_lock.acquire()
+
+        self.seek_target = target
+        self.playback_mgr.stop()
+
+        # Release the lock
+        self.thread_lock.release()
+
+    def is_active(self):
+        """
+        Check if the session is playing or paused.
+        :return: True if playing or paused.
+        """
+        return self.state in (PlaybackSession.STATE_PLAYING, PlaybackSession.STATE_PAUSED)
+
+    def get_status(self):
+        """
+        Get the session status.
+        :return: Dictionary with the status.
+        """
+        return {
+            "state": self.state,
+            "files": self.files,
+            "rate": self.playback_mgr.rate,
+            "isFollow": self.is_follow,
+        }
+
+    def run(self):
+        """
+        Playback thread.  Play the files until all the files are played or the
+        session is cancelled.  When a seek is requested, the playback continues
+        from the seek target.
+        :return:
+        """
+        if self.is_follow:
+            # Runs until the session is cancelled
+            self.playback_mgr.generation = self.data_mgr.generation
+            self.playback_mgr.follow(self.files[0])
+            return
+
+        if self.select is not None:
+            # Build the index of the first file to select the ensembles
+            self.records = self.select(EnsembleIndex.load_or_build(self.files[0], self.num_workers))
+
+        file_idx = 0
+        records = self.records
+
+        while True:
+            # Ensembles passed after the plots are cleared again are dropped
+            self.playback_mgr.generation = self.data_mgr.generation
+
+            if records is not None:
+                # Play the selected ensembles then the remaining files
+                is_done = self.playback_mgr.playback_records(self.files[file_idx], records)
+                if is_done and self.records is None:
+                    is_done = self.playback_mgr.playback_thread(self.files[file_idx + 1:])
+            else:
+                is_done = self.playback_mgr.playback_thread(self.files[file_idx:])
+
+            # Lock the object
+            self.thread_lock.acquire()
+            seek_target = self.seek_target
+            self.seek_target = None
+            if seek_target is not None and self.state != PlaybackSession.STATE_CANCELLED:
+                # Restart the playback for the seek
+                self.playback_mgr.stop_event.clear()
+                if self.state == PlaybackSession.STATE_PAUSED:
+                    self.playback_mgr.pause()
+            # Release the lock
+            self.thread_lock.release()
+
+            if seek_target is None or self.state == PlaybackSession.STATE_CANCELLED:
+                break
+
+            # Find the file and ensembles for the seek
+            found = self.find_seek(seek_target)
+            if found is None:
+                logging.info("Playback seek target not found: " + str(seek_target))
+                break
+            file_idx, records = found
+
+            if self.state == PlaybackSession.STATE_CANCELLED:
+                break
+
+            if self.on_seek:
+                self.on_seek()
+
+        if self.state != PlaybackSession.STATE_CANCELLED:
+            self.state = PlaybackSession.STATE_COMPLETE
+
+    def find_seek(self, seek_target):
+        """
+        Find the file and the ensembles to play after the seek target.
+        :param seek_target: (is_time, value) seek target.
+        :return: (file index, records) or None if not found.
+        """
+        is_time, value = seek_target
+        for file_idx, file_path in enumerate(self.files):
+            index = EnsembleIndex.load_or_build(file_path, self.num_workers)
+            good = index.records[index.records['ok'] == 1]
+            if len(good) == 0:
+                continue
+
+            if is_time:
+                records = good[good['timestamp'] >= value]
+            else:
+                records = good[good['ens_num'] >= value]
+
+            if len(records) > 0:
+                # Keep playing to the end of the selected range
+                if self.records is not None and len(self.records) > 0:
+                    records = records[records['offset'] <= self.records['offset'][-1]]
+                return file_idx, records
+
+        return None
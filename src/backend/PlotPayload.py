@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class PlotPayload:
+    """
+    Format of the numeric arrays sent to the plots.
+
+    list: Python lists.  Missing values are None and times are ISO strings.
+          msgpack encodes one object for each value.
+    binary: Each array is a structure that maps directly onto a JS typed array:
+            {"dtype": "float32" or "float64", "shape": [rows, columns], "data": bytes}
+            The bytes are little-endian and in row order.  Missing values are NaN.
+            Times are float64 milliseconds since the epoch and NaN if the
+            ensemble had no time, so they can be given to new Date() or
+            a plotly date axis.
+
+            In Node the bytes are a Buffer:
+            new Float32Array(data.buffer, data.byteOffset, data.byteLength / 4)
+            If the byteOffset is not a multiple of the element size, copy the Buffer first.
+    """
+
+    FORMAT_LIST = "list"
+    FORMAT_BINARY = "binary"
+    FORMATS = [FORMAT_LIST, FORMAT_BINARY]
+
+    FLOAT32 = np.dtype('<f4')
+    FLOAT64 = np.dtype('<f8')
+
+    # Time used when the ensemble has no time
+    NO_TIME = np.iinfo(np.int64).min
+
+    @staticmethod
+    def check_format(fmt: str):
+        """
+        Verify the format is known.  If not, use the list format.
+        :param fmt: Format.
+        :return: Format to use.
+        """
+        if fmt not in PlotPayload.FORMATS:
+            return PlotPayload.FORMAT_LIST
+        return fmt
+
+    @staticmethod
+    def to_values(values, fmt: str, dtype=FLOAT64):
+        """
+        Convert the values to the format.
+        :param values: Numpy array of floats.  NaN values are missing.
+        :param fmt: list or binary.
+        :param dtype: Type of the binary values, FLOAT32 or FLOAT64.
+        :return: List of values or binary array.
+        """
+        if fmt == PlotPayload.FORMAT_BINARY:
+            return PlotPayload.to_binary(values, dtype)
+        return PlotPayload.to_list(values)
+
+    @staticmethod
+    def to_times(times, fmt: str):
+        """
+        Convert the times to the format.
+        :param times: Numpy array of microseconds since the epoch.
+        :param fmt: list or binary.
+        :return: List of ISO strings or binary array of milliseconds since the epoch.
+        """
+        if fmt == PlotPayload.FORMAT_BINARY:
+            ms = np.asarray(times, dtype=np.float64) / 1000.0
+            ms[times == PlotPayload.NO_TIME] = np.nan
+            return PlotPayload.to_binary(ms, PlotPayload.FLOAT64)
+        return PlotPayload.to_iso_list(times)
+
+    @staticmethod
+    def to_binary(values, dtype=FLOAT64):
+        """
+        Convert the values to a binary array.
+        :param values: Numpy array of floats.  NaN values are missing.
+        :param dtype: Type of the values, FLOAT32 or FLOAT64.
+        :return: Structure with the dtype, the shape and the little-endian bytes.
+        """
+        values = np.ascontiguousarray(values, dtype=dtype)
+        return {
+            "dtype": values.dtype.name,
+            "shape": list(values.shape),
+            "data": values.tobytes(),
+        }
+
+    @staticmethod
+    def to_list(values):
+        """
+        Convert the values to a list.  NaN values are None,
+        so the plot shows a gap.
+        :param values: Numpy array of floats.
+        :return: List of values.
+        """
+        is_nan = np.isnan(values)
+        if not is_nan.any():
+            return values.tolist()
+
+        values = values.astype(object)
+        values[is_nan] = None
+        return values.tolist()
+
+    @staticmethod
+    def to_iso_list(times):
+        """
+        Convert the times to a list of ISO strings.
+        :param times: Numpy array of microseconds since the epoch.
+        :return: List of ISO strings.  None if the ensemble had no time.
+        """
+        iso = np.datetime_as_string(times.astype('datetime64[us]'), unit='auto').astype(object)
+        iso[times == PlotPayload.NO_TIME] = None
+        return iso.tolist()
@@ -0,0 +1,124 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed size buffer of the latest rows in a preallocated numpy array.
+
+    Every row is written twice, at its slot and at its slot plus the
+    capacity.  The latest rows are then always in one contiguous
+    piece of the array, so view() is a cheap numpy view in time
+    order and never a copy.
+
+    The rows can be a structured dtype with a column per value, or
+    a shape for each row like the bins of an ensemble.
+    """
+
+    def __init__(self, capacity: int, dtype, shape=()):
+        """
+        Create the buffer.
+        :param capacity: Maximum number of rows.
+        :param dtype: Numpy dtype of a row.
+        :param shape: Shape of each row.
+        """
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.capacity = max(1, int(capacity))
+        self.data = self.create(self.capacity)
+        self.head = 0                       # Next slot to write
+        self.count = 0                      # Number of rows in the buffer
+        self.total = 0                      # Number of rows ever written
+
+    def create(self, capacity: int):
+        """
+        Create the array for the rows.  The array holds each
+        row twice.  Only the rows written are ever read.
+        :param capacity: Maximum number of rows.
+        :return: Numpy array.
+        """
+        return np.empty((2 * capacity,) + self.shape, dtype=self.dtype)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, row):
+        """
+        Add a row.  The oldest row is removed if the buffer is full.
+        :param row: Row to add.
+        :return:
+        """
+        self.data[self.head] = row
+        self.data[self.head + self.capacity] = row
+
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total += 1
+
+    def extend(self, rows):
+        """
+        Add the rows in order.  The oldest rows are removed if the buffer is full.
+        :param rows: Numpy array of rows.
+        :return:
+        """
+        num_rows = len(rows)
+        if num_rows == 0:
+            return
+
+        # Only the latest rows will fit
+        skipped = max(0, num_rows - self.capacity)
+        rows = rows[skipped:]
+
+        slots = (self.head + skipped + np.arange(len(rows))) % self.capacity
+        self.data[slots] = rows
+        self.data[slots + self.capacity] = rows
+
+        self.head = (self.head + num_rows) % self.capacity
+        self.count = min(self.count + num_rows, self.capacity)
+        self.total += num_rows
+
+    def view(self):
+        """
+        Get the rows from the oldest to the latest.  This is a view
+        of the buffer, so copy it if it is kept after the buffer changes.
+        :return: Numpy array view of the rows.
+        """
+        end = self.head + self.capacity
+        return self.data[end - self.count:end]
+
+    def latest(self):
+        """
+        Get the latest row.
+        :return: Latest row or None if the buffer is empty.
+        """
+        if self.count == 0:
+            return None
+        return self.data[self.head + self.capacity - 1]
+
+    def resize(self, capacity: int):
+        """
+        Change the maximum number of rows.  The latest rows are kept.
+        :param capacity: Maximum number of rows.
+        :return:
+        """
+        capacity = max(1, int(capacity))
+        if capacity == self.capacity:
+            return
+
+        rows = self.view()[-capacity:]
+        total = self.total
+
+        self.capacity = capacity
+        self.data = self.create(capacity)
+        self.head = 0
+        self.count = 0
+        self.extend(rows)
+        self.total = total
+
+    def clear(self):
+        """
+        Remove all the rows.
+        :return:
+        """
+        self.head = 0
+        self.count = 0
+        self.total = 0
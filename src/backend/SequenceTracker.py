@@ -0,0 +1,52 @@
+class SequenceTracker:
+    """
+    Sequence number of the rows added to a ViewModel, so a view can
+    ask for only the rows added since its last request.  The view
+    adds the new rows to the data it already has and removes the
+    oldest rows past maxEns.
+
+    The sequence number always increases, even after a reset.  If the
+    data was reset or the view missed rows that are no longer in the
+    buffer, all the rows are returned and isReset is set.  The view
+    must then replace its data.
+    """
+
+    def __init__(self):
+        """
+        Initialize the sequence numbers.
+        """
+        # Sequence number of the latest row
+        self.seq = 0
+
+        # Sequence number when the data was last cleared.  A reset also increments the
+        # sequence number, so a view that requested before the reset gets all the data again
+        self.reset_seq = 0
+
+    def add(self, num_rows: int = 1):
+        """
+        Count the rows added.
+        :param num_rows: Number of rows added.
+        :return:
+        """
+        self.seq += num_rows
+
+    def reset(self):
+        """
+        Mark the data as cleared or changed, so the views get all the data again.
+        :return:
+        """
+        self.seq += 1
+        self.reset_seq = self.seq
+
+    def get_start(self, since_seq: int, num_rows: int):
+        """
+        Find the first row the view does not have.
+        :param since_seq: Sequence number from the last request.  0 for all the data.
+        :param num_rows: Number of rows in the buffer.
+        :return: Index of the first new row in the buffer and True if all the data must be sent.
+        """
+        first_seq = self.seq - num_rows
+        is_reset = since_seq < self.reset_seq or since_seq < first_seq or since_seq > self.seq
+        if is_reset:
+            return 0, True
+        return since_seq - first_seq, False
@@ -1,28 +1,71 @@
 from threading import Lock
 import logging
 import math
+import os
+import datetime
 import plotly.figure_factory as ff
 import plotly.graph_objs as go
-from pygeodesy.ellipsoidalVincenty import LatLon
+import numpy as np
 from rti_python.Ensemble.Ensemble import Ensemble
+from Geodesic import Geodesic
+from TrackSimplifier import TrackSimplifier
+from Snapshot import Snapshot
+from PlotPayload import PlotPayload
 
 
 class ShipTrackVM:
+    """
+    Ship track and the water velocity quivers along the track.
 
-    def __init__(self):
-        self.lat = []
-        self.lon = []
-        #elf.lat_lon_text = []
+    The track is simplified as it is received, so the points displayed
+    only grow with the shape of the track and not with time.  The
+    quivers are thinned to one quiver in each grid cell of quiver_spacing
+    meters.  The latest quiver in a cell replaces the older quiver.
+
+    The full resolution track can be written to a file in spill_dir.
+
+    The quivers and the track are published in a snapshot at the end of
+    each batch.  The plot lines and the text are created from the
+    snapshot when they are first requested.
+    """
+
+    DEFAULT_SPILL_DIR = os.path.join(os.path.expanduser("~"), ".river_electron", "ship_track")
+    SPILL_COLUMNS = 4                                   # Latitude, Longitude, Magnitude, Direction
+
+    def __init__(self,
+                 model: str = Geodesic.MODEL_ENU,
+                 tolerance: float = 2.0,
+                 quiver_spacing: float = 10.0,
+                 is_spill: bool = False,
+                 spill_dir: str = DEFAULT_SPILL_DIR):
+        """
+        Initialize the ship track.
+        :param model: Geodesic model used for the quiver end points: enu or spherical.
+        :param tolerance: Largest distance in meters a point can be from the simplified track.
+        :param quiver_spacing: Size in meters of the grid cell for each quiver.  0 to keep every quiver.
+        :param is_spill: Write the full resolution track to a file.
+        :param spill_dir: Folder for the full resolution track files.
+        """
+        self.track = TrackSimplifier(tolerance)         # Simplified Lat/Lon points
+        self.num_pts = 0                                # Number of points received
         self.last_lat = 0.0
         self.last_lon = 0.0
-        self.avg_mag = []
-        self.avg_dir = []
-        self.quiver_x = []                              # Longitude points
-        self.quiver_y = []                              # Latitude points
-        self.quiver_text = []                           # Text for the quiver
+        self.quivers = {}                               # Grid cell to (lat, lon, mag, dir, end lat, end lon)
+        self.quiver_origin = None                       # Lat/Lon of grid cell (0, 0)
+        self.quiver_spacing = quiver_spacing            # Size of the grid cell in meters
+        self.pending = []                               # Quivers waiting for the end points
         self.mag_scale = 20.0                            # Scale the magnitude line
+        self.model = model                              # Geodesic model
+        self.is_spill = is_spill
+        self.spill_dir = spill_dir
+        self.spill_file = None                          # Open full resolution track file
+        self.spill_path = ""
         self.thread_lock = Lock()
 
+        # Track and quivers for get_data(), published at the end of each batch
+        self.snapshot = Snapshot(0)
+        self.publish_snapshot()
+
     def set_ens(self, ens: Ensemble):
         """
         Get the data out of the ensemble and populate
@@ -35,15 +78,38 @@ class ShipTrackVM:
         :return:
         """
         # Lock the object
-        self.thread_lock.acquire()
+        with self.thread_lock:
+            self.process_ens(ens)
+            self.add_quiver_points()
+            self.publish_snapshot()
 
+    def set_ens_batch(self, ens_list):
+        """
+        Set a batch of ensembles.  The lock is only taken once
+        for the batch.
+        :param ens_list: List of ensembles.
+        :return:
+        """
+        # Lock the object
+        with self.thread_lock:
+            for ens in ens_list:
+                self.process_ens(ens)
+            self.add_quiver_points()
+            self.publish_snapshot()
+
+    def process_ens(self, ens: Ensemble):
+        """
+        Get the data out of the ensemble and populate
+        the structure.  The lock must be held.
+        :param ens: Latest ensemble.
+        :return:
+        """
         # Set Data
         if ens.IsNmeaData and ens.NmeaData.GPGGA is not None and ens.IsEarthVelocity:
 
-            # Lat and Lon to the arrays
-            self.lat.append(ens.NmeaData.latitude)
-            self.lon.append(ens.NmeaData.longitude)
-            #self.lat_lon_text.append("Lat: " + str(round(ens.NmeaData.latitude, 2)) + " Lon: " + str(round(ens.NmeaData.longitude, 2)))
+            # Lat and Lon to the simplified track
+            self.track.add(ens.NmeaData.latitude, ens.NmeaData.longitude)
+            self.num_pts += 1
 
             # Last Lat/Lon to place a marker for end of the path
             self.last_lat = ens.NmeaData.latitude
@@ -51,64 +117,227 @@ class ShipTrackVM:
 
             # Get the average velocity and direction for the ensemble
             avg_mag, avg_dir = ens.EarthVelocity.average_mag_dir()
-            self.avg_mag.append(avg_mag)
-            self.avg_dir.append(avg_dir)
 
             # Create the magnitude and direction line
             # Use the given Lat/Lon position as the start point
-            position = LatLon(ens.NmeaData.latitude,
-                              ens.NmeaData.longitude)
-
-            # Calculate the new position, based on the current lat/lon and the avg mag and dir
-            # These 2 points will create the quiver that represents the mag and dir for the given
-            # latitude point
+            # The end points are calculated for the batch in add_quiver_points()
+            quiver = (ens.NmeaData.latitude, ens.NmeaData.longitude, avg_mag, avg_dir)
             if not math.isnan(avg_mag) and not math.isnan(avg_dir):
-                avg_position = position.destination(avg_mag * self.mag_scale, avg_dir)
+                self.pending.append(quiver)
+
+            # Full resolution track
+            if self.is_spill:
+                self.spill(quiver)
+
+    def add_quiver_points(self):
+        """
+        Calculate the end points of the new quivers at once.  The end point
+        is the magnitude and direction from the start point on the ship track line.
+        Each quiver replaces the quiver in the same grid cell.
+        The lock must be held.
+        :return:
+        """
+        if not self.pending:
+            return
+
+        lat, lon, mag, direction = np.array(self.pending, dtype=np.float64).T
+        end_lat, end_lon = Geodesic.destination(lat, lon, mag * self.mag_scale, direction, self.model)
+
+        if self.quiver_origin is None:
+            self.quiver_origin = (lat[0], lon[0])
+
+        if self.quiver_spacing > 0:
+            east, north = Geodesic.to_local(lat, lon, self.quiver_origin[0], self.quiver_origin[1])
+            cells = zip(np.floor(east / self.quiver_spacing).astype(np.int64).tolist(),
+                        np.floor(north / self.quiver_spacing).astype(np.int64).tolist())
+        else:
+            cells = range(len(self.quivers), len(self.quivers) + len(self.pending))
+
+        for cell, quiver, quiver_end_lat, quiver_end_lon in zip(cells, self.pending, end_lat.tolist(), end_lon.tolist()):
+            # Move the cell to the end, so the quivers stay in time order
+            self.quivers.pop(cell, None)
+            self.quivers[cell] = quiver + (quiver_end_lat, quiver_end_lon)
+
+        self.pending.clear()
+
+    def publish_snapshot(self):
+        """
+        Publish the track and the quivers for get_data().  The lock must be held.
+        :return:
+        """
+        lat, lon = self.track.get_track()
+        self.snapshot = self.snapshot.next({
+            "quivers": tuple(self.quivers.values()),
+            "lat": lat,
+            "lon": lon,
+            "last_lat": self.last_lat,
+            "last_lon": self.last_lon,
+            "numPts": self.num_pts,
+            "spillFile": self.spill_path,
+        })
+
+        # Make the full resolution track available to read
+        if self.spill_file is not None:
+            self.spill_file.flush()
+
+    @staticmethod
+    def get_quiver_lines(quivers, fmt: str = PlotPayload.FORMAT_LIST):
+        """
+        Create the lines of the quivers for the plot.
+        :param quivers: Tuple of (lat, lon, mag, dir, end lat, end lon) for each quiver.
+        :param fmt: Format of the values, list or binary.
+        :return: Longitude points and latitude points.
+        """
+        # Start point, end point and a gap to breakup the lines for each quiver
+        quiver_x = np.full((len(quivers), 3), np.nan)
+        quiver_y = np.full((len(quivers), 3), np.nan)
+        if quivers:
+            lat, lon, mag, direction, end_lat, end_lon = np.array(quivers, dtype=np.float64).T
+            quiver_x[:, 0] = lon
+            quiver_x[:, 1] = end_lon
+            quiver_y[:, 0] = lat
+            quiver_y[:, 1] = end_lat
+        return PlotPayload.to_values(quiver_x.ravel(), fmt), PlotPayload.to_values(quiver_y.ravel(), fmt)
+
+    @staticmethod
+    def get_quiver_text(quivers):
+        """
+        Create the text for the quivers.
+        :param quivers: Tuple of (lat, lon, mag, dir, end lat, end lon) for each quiver.
+        :return: List of the text.
+        """
+        return ["Mag: " + str(round(quiver[2], 2)) + " Dir: " + str(round(quiver[3], 2))
+                for quiver in quivers]
+
+    @staticmethod
+    def get_track_data(data, is_quiver_text: bool, fmt: str = PlotPayload.FORMAT_LIST):
+        """
+        Populate the structure from the snapshot data.
+        :param data: Snapshot data.
+        :param is_quiver_text: Include the hover text of the quivers.
+        :param fmt: Format of the values, list or binary.  Latitude and longitude are always float64.
+        :return: Structure with the data.
+        """
+        quiver_x, quiver_y = ShipTrackVM.get_quiver_lines(data["quivers"], fmt)
+        lat = data["lat"]
+        lon = data["lon"]
+        if fmt == PlotPayload.FORMAT_BINARY:
+            lat = PlotPayload.to_binary(lat)
+            lon = PlotPayload.to_binary(lon)
+
+        return {
+            "quiver_x": quiver_x,
+            "quiver_y": quiver_y,
+            "quiver_text": ShipTrackVM.get_quiver_text(data["quivers"]) if is_quiver_text else [],
+            "lat": lat,
+            "lon": lon,
+            "last_lat": data["last_lat"],
+            "last_lon": data["last_lon"],
+            "numPts": data["numPts"],
+            "spillFile": data["spillFile"],
+        }
+
+    def set_model(self, model: str):
+        """
+        Set the geodesic model and calculate all the quivers again.
+        :param model: enu or spherical.
+        :return:
+        """
+        if model not in Geodesic.MODELS:
+            logging.error("Unknown geodesic model: " + str(model))
+            return
+
+        # Lock the object
+        with self.thread_lock:
+            self.model = model
+            if self.quivers:
+                lat, lon, mag, direction, end_lat, end_lon = np.array(list(self.quivers.values()), dtype=np.float64).T
+                end_lat, end_lon = Geodesic.destination(lat, lon, mag * self.mag_scale, direction, self.model)
+                for cell, quiver_end_lat, quiver_end_lon in zip(list(self.quivers), end_lat.tolist(), end_lon.tolist()):
+                    self.quivers[cell] = self.quivers[cell][:4] + (quiver_end_lat, quiver_end_lon)
+                self.publish_snapshot()
+
+    def set_options(self, tolerance: float, quiver_spacing: float, is_spill: bool):
+        """
+        Set the track options.  The tolerance and quiver spacing are
+        used for the new points.
+        :param tolerance: Largest distance in meters a point can be from the simplified track.
+        :param quiver_spacing: Size in meters of the grid cell for each quiver.  0 to keep every quiver.
+        :param is_spill: Write the full resolution track to a file.
+        :return:
+        """
+        # Lock the object
+        with self.thread_lock:
+            self.track.tolerance = tolerance
+            if quiver_spacing != self.quiver_spacing:
+                # The grid cells are different, so the older quivers can not be replaced
+                self.quivers = {(None, index): quiver for index, quiver in enumerate(self.quivers.values())}
+                self.quiver_spacing = quiver_spacing
+            self.is_spill = is_spill
+            if not is_spill:
+                self.close_spill()
+            self.publish_snapshot()
+
+    def spill(self, point):
+        """
+        Write the point to the full resolution track file.
+        The file is created with the first point.  The lock must be held.
+        :param point: Tuple of latitude, longitude, magnitude and direction.
+        :return:
+        """
+        if self.spill_file is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self.spill_path = os.path.join(self.spill_dir, "track_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f") + ".bin")
+            self.spill_file = open(self.spill_path, "ab")
+            logging.info("Ship track file: " + self.spill_path)
+
+        self.spill_file.write(np.array(point, dtype=np.float64).tobytes())
 
-                # Add the points to the arrays
-                # The start point is the ship track line
-                # The end point is the magnitude and angle from the start point on the ship track line
-                self.quiver_x.append(position.lon)
-                self.quiver_y.append(position.lat)
-                self.quiver_x.append(avg_position.lon)
-                self.quiver_y.append(avg_position.lat)
-                self.quiver_x.append(None)                  # Add a None to breakup the lines for each quiver
-                self.quiver_y.append(None)                  # Add a None to breakup the lines for each quiver
-                self.quiver_text.append("Mag: " + str(round(avg_mag, 2)) + " Dir: " + str(round(avg_dir, 2)))
+    def close_spill(self):
+        """
+        Close the full resolution track file.  The lock must be held.
+        :return:
+        """
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
 
-        # Release the lock
-        self.thread_lock.release()
+    @staticmethod
+    def read_spill(spill_path: str):
+        """
+        Read a full resolution track file.
+        :param spill_path: File path.
+        :return: Numpy array of points x (latitude, longitude, magnitude, direction).
+        """
+        return np.fromfile(spill_path, dtype=np.float64).reshape(-1, ShipTrackVM.SPILL_COLUMNS)
 
-    def get_data(self):
+    def get_version(self):
+        """
+        Get the version of the data.  The version increases at the
+        end of each batch and when the options change.
+        :return: Version number.
+        """
+        return self.snapshot.version
+
+    def get_data(self, is_quiver_text: bool = True, fmt: str = PlotPayload.FORMAT_LIST, is_packed: bool = False):
         """
         Populate the structure.
 
-        Lock and unlock when getting the data to ensure
-        when new data is received, it is not being used with
-        old data.
+        The structure is built from the latest snapshot, so the lock is
+        not needed and new data can be added while the structure is built.
+        The structure is reused until the next snapshot.
+        :param is_quiver_text: Include the hover text of the quivers.
+        :param fmt: Format of the values, list or binary.  See PlotPayload.
+        :param is_packed: Get the structure encoded with msgpack.
         :return: Structure with all the latest ensemble data
         """
+        snapshot = self.snapshot
+        fmt = PlotPayload.check_format(fmt)
 
-        # Lock the object
-        self.thread_lock.acquire()
-
-        if len(self.lat) > 0:
-            # Populate the structure
-            st_data = {
-                "quiver_x": self.quiver_x,
-                "quiver_y": self.quiver_y,
-                "quiver_text": self.quiver_text,
-                "lat": self.lat,
-                "lon": self.lon,
-                #"lat_lon_text": self.lat_lon_text,
-                "last_lat": self.last_lat,
-                "last_lon": self.last_lon,
-            }
+        if snapshot.data["numPts"] > 0:
+            st_data = snapshot.get_payload((is_quiver_text, fmt), lambda data: ShipTrackVM.get_track_data(data, is_quiver_text, fmt), is_packed)
         else:
-            st_data = {}
-
-        # Release the lock
-        self.thread_lock.release()
+            st_data = snapshot.get_payload(None, lambda data: {}, is_packed)
 
         logging.debug(st_data)
 
@@ -117,15 +346,18 @@ class ShipTrackVM:
     def reset(self):
         """
         Reset all the values to clear the plot.
+        A new full resolution track file is started.
         :return:
         """
-        self.lat.clear()
-        self.lon.clear()
-        #self.lat_lon_text.clear()
-        self.avg_dir.clear()
-        self.avg_mag.clear()
-        self.last_lat = 0.0
-        self.last_lon = 0.0
-        self.quiver_x.clear()
-        self.quiver_y.clear()
-        self.quiver_text.clear()
+        # Lock the object
+        with self.thread_lock:
+            self.track.clear()
+            self.num_pts = 0
+            self.last_lat = 0.0
+            self.last_lon = 0.0
+            self.quivers = {}
+            self.quiver_origin = None
+            self.pending.clear()
+            self.close_spill()
+            self.spill_path = ""
+            self.publish_snapshot()
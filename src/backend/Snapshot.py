@@ -0,0 +1,60 @@
+import msgpack
+
+
+class Snapshot:
+    """
+    Data of a ViewModel published by the writer at the end of each batch.
+
+    The writer never changes a published snapshot.  It creates a new
+    snapshot and replaces the reference, which is atomic.  A reader takes
+    the current snapshot without the lock, so a slow reader or a slow
+    serialization never makes the ingest wait, and the ingest never
+    changes the data a reader is using.
+
+    The payloads built from the snapshot are kept in the snapshot, so all
+    the readers of the same version share them.  The payloads encoded
+    with msgpack are also kept, so a client polling faster than the data
+    changes only gets the same bytes again.
+    """
+
+    def __init__(self, version: int, data=None):
+        """
+        Create the snapshot.
+        :param version: Version of the data.  Increases with each snapshot.
+        :param data: Data of the ViewModel.  Must not be changed after it is published.
+        """
+        self.version = version
+        self.data = data
+        self.payloads = {}
+        self.packed = {}
+
+    def get_payload(self, key, build, is_packed: bool = False):
+        """
+        Get the payload built from the data.  The payload is built
+        the first time it is requested.
+        :param key: Key of the request.
+        :param build: Function to build the payload from the data.
+        :param is_packed: Get the payload encoded with msgpack.  The payload is encoded the first time it is requested.
+        :return: Payload or msgpack bytes.
+        """
+        payload = self.payloads.get(key)
+        if payload is None:
+            payload = build(self.data)
+            self.payloads[key] = payload
+
+        if not is_packed:
+            return payload
+
+        packed = self.packed.get(key)
+        if packed is None:
+            packed = msgpack.packb(payload, use_bin_type=True)
+            self.packed[key] = packed
+        return packed
+
+    def next(self, data):
+        """
+        Create the next version of the snapshot.
+        :param data: Data of the ViewModel.
+        :return: Snapshot.
+        """
+        return Snapshot(self.version + 1, data)
@@ -0,0 +1,86 @@
+import time
+import gevent
+
+
+class Subscription:
+    """
+    Push the ViewModel updates to one subscriber instead of the
+    subscriber polling each plot.
+
+    The version of each subscribed ViewModel is checked every
+    POLL_INTERVAL.  When one or more versions advanced, a single update
+    with the data of only the changed views is sent.  The updates are
+    sent at most max_rate_hz times a second.
+
+    The data is built from the latest snapshot when the update is sent.
+    zerorpc waits for a slow subscriber before asking for the next
+    update, so the versions in between are dropped instead of queued.
+    The number of versions dropped is sent in each update.
+    """
+
+    POLL_INTERVAL = 0.02                # Seconds between checking the versions
+    MIN_RATE_HZ = 0.1
+    MAX_RATE_HZ = 1.0 / POLL_INTERVAL
+    DEFAULT_RATE_HZ = 10.0
+
+    def __init__(self, views: dict, max_rate_hz: float = DEFAULT_RATE_HZ):
+        """
+        Initialize the subscription.  The first update has all the views.
+        :param views: Dictionary of the view name and a (get_version, get_data) tuple of functions.
+        :param max_rate_hz: Most updates sent each second.
+        """
+        self.views = views
+        self.interval = 1.0 / min(max(max_rate_hz, Subscription.MIN_RATE_HZ), Subscription.MAX_RATE_HZ)
+        self.versions = {name: None for name in views}           # Version of each view in the last update
+        self.seq = 0                                            # Number of updates sent
+
+    def get_update(self):
+        """
+        Get the data of the views that changed since the last update.
+        :return: Update with "seq", "views", "versions" and "dropped".  None if no view changed.
+        """
+        changed = {}
+        dropped = 0
+        for name, (get_version, get_data) in self.views.items():
+            # Get the version first, so a change while the data is built is sent again
+            version = get_version()
+            if version == self.versions[name]:
+                continue
+
+            if self.versions[name] is not None and version > self.versions[name]:
+                dropped += version - self.versions[name] - 1
+            changed[name] = get_data()
+            self.versions[name] = version
+
+        if not changed:
+            return None
+
+        self.seq += 1
+        return {
+            "seq": self.seq,
+            "views": changed,
+            "versions": dict(self.versions),
+            "dropped": dropped,
+        }
+
+    def updates(self):
+        """
+        Generate the updates until the subscriber closes the stream.
+        gevent.sleep() is used to wait, so the server handles the
+        other requests in the meantime.
+        :return: Generator of the updates.
+        """
+        next_time = 0.0
+        while True:
+            # Rate limit
+            wait = next_time - time.monotonic()
+            if wait > 0:
+                gevent.sleep(wait)
+
+            update = self.get_update()
+            if update is None:
+                gevent.sleep(Subscription.POLL_INTERVAL)
+                continue
+
+            next_time = time.monotonic() + self.interval
+            yield update
@@ -2,6 +2,8 @@ import datetime
 from threading import Lock
 import logging
 from rti_python.Ensemble.Ensemble import Ensemble
+from DischargeEngine import DischargeEngine
+from Snapshot import Snapshot
 
 
 class TabularDataVM():
@@ -17,9 +19,16 @@ class TabularDataVM():
         """
         self.ens_num = 0
         self.latest_ens = None
+        self.ens_datetime_str = ""
+        self.pitch = 0.0
+        self.roll = 0.0
+        self.heading = 0.0
+        self.temperature = 0.0
+        self.pressure = 0.0
         self.num_ens = 0
+        self.prev_ens_num = None
         self.lost_ens = 0
-        self.bad_ens = 0.0
+        self.bad_ens = 0
         self.percent_bad_bins = 0.0
         self.delta_time = 0.0
         self.good_bins = 0
@@ -31,85 +40,210 @@ class TabularDataVM():
         self.q_total = 0.0
         self.boat_speed = 0.0
         self.boat_course = 0.0
+        self.gps_speed = 0.0
         self.water_speed = 0.0
         self.water_dir = 0.0
         self.calc_depth = 0.0
         self.river_length = 0.0
+        self.gps_river_length = 0.0
         self.distance_made_good = 0.0
         self.course_made_good = 0.0
         self.duration = 0.0
 
+        # Discharge of the transect
+        self.discharge = DischargeEngine()
+
         self.thread_lock = Lock()
 
+        # Latest structure for get_data(), published at the end of each batch
+        self.snapshot = Snapshot(0)
+
     def set_ens(self, ens: Ensemble):
 
         # Lock the object
-        self.thread_lock.acquire()
+        with self.thread_lock:
+            self.process_ens(ens)
+            self.set_latest(ens)
+            self.update_discharge()
+            self.publish_snapshot()
 
-        # Set the latest ensemble to get the data
-        self.latest_ens = ens
+    def set_ens_batch(self, ens_list):
+        """
+        Set a batch of ensembles.  The lock is only taken once
+        for the batch.  The last ensemble is the latest ensemble.
+        Every ensemble is added to the discharge.
+        :param ens_list: List of ensembles.
+        :return:
+        """
+        if not ens_list:
+            return
+
+        # Lock the object
+        with self.thread_lock:
+            for ens in ens_list:
+                self.process_ens(ens)
+            self.set_latest(ens_list[-1])
+            self.update_discharge()
+            self.publish_snapshot()
 
+    def process_ens(self, ens: Ensemble):
+        """
+        Update the running statistics and add the
+        ensemble to the discharge.  The lock must be held.
+        :param ens: Ensemble.
+        :return:
+        """
         # Increment the number of ensembles
         self.num_ens += 1
 
-        # Release the object
-        self.thread_lock.release()
+        # Count the ensembles missing between the ensemble numbers
+        if ens.IsEnsembleData:
+            ens_num = ens.EnsembleData.EnsembleNumber
+            if self.prev_ens_num is not None and ens_num > self.prev_ens_num + 1:
+                self.lost_ens += ens_num - self.prev_ens_num - 1
+            self.prev_ens_num = ens_num
+
+        # Add to the discharge
+        # Ensembles that can not be used for the discharge are bad
+        if not self.discharge.add_ens(ens):
+            self.bad_ens += 1
 
-    def get_data(self):
+    def set_latest(self, ens: Ensemble):
+        """
+        Keep the values of the latest ensemble to display, so
+        get_data() does not need the ensemble.  The lock must be held.
+        :param ens: Latest ensemble.
+        :return:
+        """
+        # Set the latest ensemble to get the data
+        self.latest_ens = ens
+
+        if ens.IsEnsembleData:
+            self.ens_num = ens.EnsembleData.EnsembleNumber
+            self.ens_datetime_str = ens.EnsembleData.datetime().isoformat()
+
+        if ens.IsAncillaryData:
+            self.pitch = ens.AncillaryData.Pitch
+            self.roll = ens.AncillaryData.Roll
+            self.heading = ens.AncillaryData.Heading
+            self.temperature = ens.AncillaryData.WaterTemp
+            self.pressure = ens.AncillaryData.TransducerDepth
+
+    def update_discharge(self):
+        """
+        Copy the latest discharge values.  The lock must be held.
+        :return:
+        """
+        self.delta_time = self.discharge.delta_time
+        self.good_bins = self.discharge.good_bins
+        self.percent_bad_bins = self.discharge.percent_bad_bins
+        self.q_top = self.discharge.q_top
+        self.q_measured = self.discharge.q_measured
+        self.q_bottom = self.discharge.q_bottom
+        self.q_left = self.discharge.q_left
+        self.q_right = self.discharge.q_right
+        self.q_total = self.discharge.q_total
+        self.boat_speed = self.discharge.boat_speed
+        self.boat_course = self.discharge.boat_course
+        self.gps_speed = self.discharge.gps_speed
+        self.water_speed = self.discharge.water_speed
+        self.water_dir = self.discharge.water_dir
+        self.calc_depth = self.discharge.calc_depth
+        self.river_length = self.discharge.river_length
+        self.gps_river_length = self.discharge.gps_length
+        self.distance_made_good = self.discharge.distance_made_good
+        self.course_made_good = self.discharge.course_made_good
+        self.duration = self.discharge.duration
+
+    def set_discharge_options(self, exponent: float, left_distance: float, right_distance: float, edge_coeff: float, is_start_left: bool):
+        """
+        Set the discharge extrapolation and edge options.
+        :param exponent: Power law exponent for the top and bottom.
+        :param left_distance: Distance in meters from the left bank to the first or last ensemble.
+        :param right_distance: Distance in meters from the right bank to the first or last ensemble.
+        :param edge_coeff: Edge coefficient.  0.3535 for a sloped bank and 0.91 for a vertical bank.
+        :param is_start_left: The transect starts on the left bank.
+        :return:
+        """
+        # Lock the object
+        with self.thread_lock:
+            self.discharge.set_options(exponent, left_distance, right_distance, edge_coeff, is_start_left)
+            self.update_discharge()
+            self.publish_snapshot()
+
+    def get_version(self):
+        """
+        Get the version of the data.  The version increases at the
+        end of each batch and when the options change.
+        :return: Version number.
+        """
+        return self.snapshot.version
+
+    def get_data(self, is_packed: bool = False):
         """
         Retrieve the ensemble data from the view.  The view
         will call the zerorpc to get the latest ensemble data.  The
         latest ensemble data will be passed as a dictionary to the nodejs code.
         The nodejs code will have an interface that describes the same data.
 
-        :param subsystem:  Currently not used, just use 0 for now.
+        The data is the latest snapshot, so the lock is not needed.
+
+        :param is_packed: Get the dictionary encoded with msgpack.
         :return: Ensemble data as a dictionary.
         """
-        if self.latest_ens:
+        ens_info = self.snapshot.get_payload(None, lambda data: data, is_packed)
+
+        logging.debug(ens_info)
+
+        return ens_info
 
-            # Lock the object
-            self.thread_lock.acquire()
-
-            # Create a dictonary with all the ensemble data
-            ens_info = {
-                "ensembleNum": self.latest_ens.EnsembleData.EnsembleNumber,
-                "ensembleDateTimeStr": self.latest_ens.EnsembleData.datetime().isoformat(),
-                "numEnsembles": self.num_ens,
-                "lostEnsemble": self.lost_ens,
-                "badEnsembles": self.bad_ens,
-                "percentBadBins": self.percent_bad_bins,
-                "deltaTime": self.delta_time,
-                "pitch": self.latest_ens.AncillaryData.Pitch,
-                "roll": self.latest_ens.AncillaryData.Roll,
-                "heading": self.latest_ens.AncillaryData.Heading,
-                "temperature": self.latest_ens.AncillaryData.WaterTemp,
-                "pressure": self.latest_ens.AncillaryData.TransducerDepth,
-                "goodBins": self.good_bins,
-                "topQ": self.q_top,
-                "measuredQ": self.q_measured,
-                "bottomQ": self.q_bottom,
-                "leftQ": self.q_left,
-                "rightQ": self.q_right,
-                "totalQ": self.q_total,
-                "boatSpeed": self.boat_speed,
-                "boatCourse": self.boat_course,
-                "waterSpeed": self.water_speed ,
-                "waterDir": self.water_dir,
-                "calcDepth": self.calc_depth,
-                "riverLength": self.river_length,
-                "distanceMadeGood": self.distance_made_good,
-                "courseMadeGood": self.course_made_good,
-                "duration": self.duration,
-            }
-
-            logging.info(ens_info)
-
-            # Release the object
-            self.thread_lock.release()
-
-            return ens_info
+    def publish_snapshot(self):
+        """
+        Publish the structure for get_data().  The lock must be held.
+        :return:
+        """
+        if self.latest_ens:
+            self.snapshot = self.snapshot.next(self.get_ens_info())
         else:
-            return None
+            self.snapshot = self.snapshot.next(None)
+
+    def get_ens_info(self):
+        """
+        Create a dictonary with all the ensemble data.  The lock must be held.
+        :return: Ensemble data as a dictionary.
+        """
+        return {
+            "ensembleNum": self.ens_num,
+            "ensembleDateTimeStr": self.ens_datetime_str,
+            "numEnsembles": self.num_ens,
+            "lostEnsemble": self.lost_ens,
+            "badEnsembles": self.bad_ens,
+            "percentBadBins": self.percent_bad_bins,
+            "deltaTime": self.delta_time,
+            "pitch": self.pitch,
+            "roll": self.roll,
+            "heading": self.heading,
+            "temperature": self.temperature,
+            "pressure": self.pressure,
+            "goodBins": self.good_bins,
+            "topQ": self.q_top,
+            "measuredQ": self.q_measured,
+            "bottomQ": self.q_bottom,
+            "leftQ": self.q_left,
+            "rightQ": self.q_right,
+            "totalQ": self.q_total,
+            "boatSpeed": self.boat_speed,
+            "boatCourse": self.boat_course,
+            "gpsBoatSpeed": self.gps_speed,
+            "waterSpeed": self.water_speed ,
+            "waterDir": self.water_dir,
+            "calcDepth": self.calc_depth,
+            "riverLength": self.river_length,
+            "gpsRiverLength": self.gps_river_length,
+            "distanceMadeGood": self.distance_made_good,
+            "courseMadeGood": self.course_made_good,
+            "duration": self.duration,
+        }
 
     def reset(self):
         """
@@ -117,29 +251,38 @@ class TabularDataVM():
         :return:
         """
         # Lock the object
-        self.thread_lock.acquire()
-
-        self.num_ens = 0
-        self.lost_ens = 0
-        self.bad_ens = 0
-        self.percent_bad_bins = 0.0
-        self.delta_time = 0.0
-        self.good_bins = 0
-        self.q_top = 0.0
-        self.q_measured = 0.0
-        self.q_bottom = 0.0
-        self.q_left = 0.0
-        self.q_right = 0.0
-        self.q_total = 0.0
-        self.boat_speed = 0.0
-        self.boat_course = 0.0
-        self.water_speed = 0.0
-        self.water_dir = 0.0
-        self.calc_depth = 0.0
-        self.river_length = 0.0
-        self.distance_made_good = 0.0
-        self.course_made_good = 0.0
-        self.duration = 0.0
-
-        # Release the object
-        self.thread_lock.release()
+        with self.thread_lock:
+            self.ens_num = 0
+            self.latest_ens = None
+            self.ens_datetime_str = ""
+            self.pitch = 0.0
+            self.roll = 0.0
+            self.heading = 0.0
+            self.temperature = 0.0
+            self.pressure = 0.0
+            self.num_ens = 0
+            self.prev_ens_num = None
+            self.lost_ens = 0
+            self.bad_ens = 0
+            self.percent_bad_bins = 0.0
+            self.delta_time = 0.0
+            self.good_bins = 0
+            self.q_top = 0.0
+            self.q_measured = 0.0
+            self.q_bottom = 0.0
+            self.q_left = 0.0
+            self.q_right = 0.0
+            self.q_total = 0.0
+            self.boat_speed = 0.0
+            self.boat_course = 0.0
+            self.gps_speed = 0.0
+            self.water_speed = 0.0
+            self.water_dir = 0.0
+            self.calc_depth = 0.0
+            self.river_length = 0.0
+            self.gps_river_length = 0.0
+            self.distance_made_good = 0.0
+            self.course_made_good = 0.0
+            self.duration = 0.0
+            self.discharge.reset()
+            self.publish_snapshot()
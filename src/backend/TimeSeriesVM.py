@@ -1,14 +1,40 @@
 from threading import Lock
 import logging
 import math
-from collections import deque
+import numpy as np
 from rti_python.Ensemble.Ensemble import Ensemble
 from rti_python.Ensemble.EarthVelocity import EarthVelocity
 from rti_python.Utilities.config import RtiConfig
+from EnsembleValues import EnsembleValues
+from ChunkBuffer import ChunkBuffer
+from SequenceTracker import SequenceTracker
+from Downsample import Downsample
+from Snapshot import Snapshot
+from PlotPayload import PlotPayload
 
 
 class TimeSeriesVM:
 
+    # Time Series columns
+    # Time is the ensemble time in microseconds since the epoch
+    # Missing values are NaN
+    DTYPE = np.dtype([('time', np.int64),
+                      ('boat_speed', np.float64),
+                      ('boat_dir', np.float64),
+                      ('heading', np.float64),
+                      ('pitch', np.float64),
+                      ('roll', np.float64),
+                      ('temperature', np.float64),
+                      ('gnss_qual', np.float64),
+                      ('gnss_hdop', np.float64),
+                      ('num_sats', np.float64),
+                      ('water_speed', np.float64),
+                      ('water_dir', np.float64),
+                      ('vtg_speed', np.float64)])
+
+    # Time used when the ensemble has no time
+    NO_TIME = PlotPayload.NO_TIME
+
     def __init__(self, rti_config: RtiConfig):
 
         # RTI Config
@@ -17,32 +43,31 @@ class TimeSeriesVM:
 
         self.max_ens = self.rti_config.config['TIMESERIES'].getint('MAX_ENS')
         self.is_boat_speed = self.rti_config.config['TIMESERIES'].getboolean('IS_BOAT_SPEED')
-        self.boat_speed = deque([], maxlen=self.max_ens)
         self.is_boat_dir = self.rti_config.config['TIMESERIES'].getboolean('IS_BOAT_DIR')
-        self.boat_dir = deque([], maxlen=self.max_ens)
         self.is_heading = self.rti_config.config['TIMESERIES'].getboolean('IS_HEADING')
-        self.heading = deque([], maxlen=self.max_ens)
         self.is_pitch = self.rti_config.config['TIMESERIES'].getboolean('IS_PITCH')
-        self.pitch = deque([], maxlen=self.max_ens)
         self.is_roll = self.rti_config.config['TIMESERIES'].getboolean('IS_ROLL')
-        self.roll = deque([], maxlen=self.max_ens)
         self.is_temperature = self.rti_config.config['TIMESERIES'].getboolean('IS_TEMPERATURE')
-        self.temperature = deque([], maxlen=self.max_ens)
         self.is_gnss_qual = self.rti_config.config['TIMESERIES'].getboolean('IS_GNSS_QUAL')
-        self.gnss_qual = deque([], maxlen=self.max_ens)
         self.is_gnss_hdop = self.rti_config.config['TIMESERIES'].getboolean('IS_GNSS_HDOP')
-        self.gnss_hdop = deque([], maxlen=self.max_ens)
         self.is_num_sats = self.rti_config.config['TIMESERIES'].getboolean('IS_NUM_SATS')
-        self.num_sats = deque([], maxlen=self.max_ens)
         self.is_water_speed = self.rti_config.config['TIMESERIES'].getboolean('IS_WATER_SPEED')
-        self.water_speed = deque([], maxlen=self.max_ens)
         self.is_water_dir = self.rti_config.config['TIMESERIES'].getboolean('IS_WATER_DIR')
-        self.water_dir = deque([], maxlen=self.max_ens)
         self.is_vtg_speed = self.rti_config.config['TIMESERIES'].getboolean('IS_VTG_SPEED')
-        self.vtg_speed = deque([], maxlen=self.max_ens)
-        self.x_dt = deque([], maxlen=self.max_ens)
+
+        # All the series are stored in one buffer of the latest ensembles
+        self.series = ChunkBuffer(self.max_ens, TimeSeriesVM.DTYPE)
+
+        # Sequence number of the latest ensemble, so the view can ask
+        # for only the ensembles added since its last request
+        self.sequence = SequenceTracker()
+
         self.thread_lock = Lock()
 
+        # Data for get_data().  A new version is published at the end of each batch
+        self.snapshot = Snapshot(0)
+        self.publish_snapshot()
+
     def set_ens(self, ens: Ensemble):
         """
         Get the data out of the ensemble and populate
@@ -54,44 +79,63 @@ class TimeSeriesVM:
         :param ens: Latest ensemble.
         :return:
         """
+        row = self.get_row(ens)
+
         # Lock the object
-        self.thread_lock.acquire()
+        with self.thread_lock:
+            self.series.append(row)
+            self.sequence.add()
+            self.publish_snapshot()
 
+    def set_ens_batch(self, ens_list):
+        """
+        Set a batch of ensembles.  The lock is only taken once
+        for the batch.
+        :param ens_list: List of ensembles.
+        :return:
+        """
+        rows = np.array([self.get_row(ens) for ens in ens_list], dtype=TimeSeriesVM.DTYPE)
+
+        # Lock the object
+        with self.thread_lock:
+            self.series.extend(rows)
+            self.sequence.add(len(rows))
+            self.publish_snapshot()
+
+    def get_row(self, ens: Ensemble):
+        """
+        Get the time series values out of the ensemble.
+        The lock is not needed.
+        :param ens: Ensemble.
+        :return: Tuple of the values in the DTYPE order.
+        """
+        to_float = EnsembleValues.to_float
+
+        time = TimeSeriesVM.NO_TIME
         if ens.IsEnsembleData:
-            self.x_dt.append(ens.EnsembleData.datetime().isoformat())
-        else:
-            self.x_dt.append(None)
+            time = EnsembleValues.to_microseconds(ens.EnsembleData.datetime())
 
+        heading = pitch = roll = temperature = math.nan
         if ens.IsAncillaryData:
-            self.heading.append(ens.AncillaryData.Heading)
-            self.pitch.append(ens.AncillaryData.Pitch)
-            self.roll.append(ens.AncillaryData.Roll)
-            self.temperature.append(ens.AncillaryData.WaterTemp)
-        else:
-            self.heading.append(None)
-            self.pitch.append(None)
-            self.roll.append(None)
-            self.temperature.append(None)
+            heading = to_float(ens.AncillaryData.Heading)
+            pitch = to_float(ens.AncillaryData.Pitch)
+            roll = to_float(ens.AncillaryData.Roll)
+            temperature = to_float(ens.AncillaryData.WaterTemp)
 
+        water_speed = water_dir = math.nan
         if ens.IsEarthVelocity:
             avg_mag, avg_dir = ens.EarthVelocity.average_mag_dir()
-            self.water_speed.append(avg_mag)
-            self.water_dir.append(avg_dir)
-        else:
-            self.water_speed.append(None)
-            self.water_dir.append(None)
+            water_speed = to_float(avg_mag)
+            water_dir = to_float(avg_dir)
 
+        num_sats = gnss_qual = gnss_hdop = vtg_speed = math.nan
         if ens.IsNmeaData:
-            self.num_sats.append(ens.NmeaData.GPGGA.num_sats)
-            self.gnss_qual.append(ens.NmeaData.GPGGA.gps_qual)
-            self.gnss_hdop.append(ens.NmeaData.GPGGA.horizontal_dil)
-            self.vtg_speed.append(ens.NmeaData.speed_m_s)
-        else:
-            self.num_sats.append(None)
-            self.gnss_qual.append(None)
-            self.gnss_hdop.append(None)
-            self.vtg_speed.append(None)
+            num_sats = to_float(ens.NmeaData.GPGGA.num_sats)
+            gnss_qual = to_float(ens.NmeaData.GPGGA.gps_qual)
+            gnss_hdop = to_float(ens.NmeaData.GPGGA.horizontal_dil)
+            vtg_speed = to_float(ens.NmeaData.speed_m_s)
 
+        boat_speed = boat_dir = math.nan
         if ens.IsBottomTrack:
             # Get the EarthVelocity data
             bt_e0 = ens.BottomTrack.EarthVelocity[0]
@@ -102,19 +146,13 @@ class TimeSeriesVM:
             bt_mag = EarthVelocity.calculate_magnitude(bt_e0, bt_e1, bt_e2)
             bt_dir = EarthVelocity.calculate_direction(bt_e0, bt_e1)
 
+            # Bad Earth Velocity is left as NaN
             if not Ensemble.is_bad_velocity(bt_mag):
-                self.boat_speed.append(bt_mag)
-                self.boat_dir.append(bt_dir)
-            else:
-                # Bad Earth Velocity
-                self.boat_speed.append(None)
-                self.boat_dir.append(None)
-        else:
-            # No Bottom Track
-            self.boat_speed.append(None)
-            self.boat_dir.append(None)
+                boat_speed = to_float(bt_mag)
+                boat_dir = to_float(bt_dir)
 
-        self.thread_lock.release()
+        return (time, boat_speed, boat_dir, heading, pitch, roll, temperature,
+                gnss_qual, gnss_hdop, num_sats, water_speed, water_dir, vtg_speed)
 
     def set_options(self,
                     is_boat_speed: bool,
@@ -149,73 +187,48 @@ class TimeSeriesVM:
         """
 
         # Lock the object
-        self.thread_lock.acquire()
-
-        # Write settings to the config
-        self.rti_config.config['TIMESERIES']['IS_BOAT_SPEED'] = RtiConfig.bool_to_str(is_boat_speed)
-        self.rti_config.config['TIMESERIES']['IS_BOAT_DIR'] = RtiConfig.bool_to_str(is_boat_dir)
-        self.rti_config.config['TIMESERIES']['IS_HEADING'] = RtiConfig.bool_to_str(is_heading)
-        self.rti_config.config['TIMESERIES']['IS_PITCH'] = RtiConfig.bool_to_str(is_pitch)
-        self.rti_config.config['TIMESERIES']['IS_ROLL'] = RtiConfig.bool_to_str(is_roll)
-        self.rti_config.config['TIMESERIES']['IS_TEMPERATURE'] = RtiConfig.bool_to_str(is_temp)
-        self.rti_config.config['TIMESERIES']['IS_GNSS_QUAL'] = RtiConfig.bool_to_str(is_gnss_qual)
-        self.rti_config.config['TIMESERIES']['IS_GNSS_HDOP'] = RtiConfig.bool_to_str(is_gnss_hdop)
-        self.rti_config.config['TIMESERIES']['IS_NUM_SATS'] = RtiConfig.bool_to_str(is_num_sats)
-        self.rti_config.config['TIMESERIES']['IS_WATER_SPEED'] = RtiConfig.bool_to_str(is_water_speed)
-        self.rti_config.config['TIMESERIES']['IS_WATER_DIR'] = RtiConfig.bool_to_str(is_water_dir)
-        self.rti_config.config['TIMESERIES']['IS_VTG_SPEED'] = RtiConfig.bool_to_str(is_vtg_speed)
-        self.rti_config.config['TIMESERIES']['MAX_ENS'] = str(max_ens)
-        self.rti_config.write()
-
-        # Set the options
-        self.is_boat_speed = is_boat_speed
-        self.is_boat_dir = is_boat_dir
-        self.is_heading = is_heading
-        self.is_pitch = is_pitch
-        self.is_roll = is_roll
-        self.is_temperature = is_temp
-        self.is_gnss_qual = is_gnss_qual
-        self.is_gnss_hdop = is_gnss_hdop
-        self.is_num_sats = is_num_sats
-        self.is_water_speed = is_water_speed
-        self.is_water_dir = is_water_dir
-        self.is_vtg_speed = is_vtg_speed
-
-        # Check if Max Ensembles changed
-        # If it changed, then create new deque with new maxlen
-        if self.max_ens != max_ens and not math.isnan(max_ens):
-            self.max_ens = max_ens
-
-            # Create a temp of the values
-            boat_speed = list(self.boat_speed)
-            boat_dir = list(self.boat_dir)
-            heading = list(self.heading)
-            pitch = list(self.pitch)
-            roll = list(self.roll)
-            temperature = list(self.temperature)
-            gnss_qual = list(self.gnss_qual)
-            gnss_hdop = list(self.gnss_hdop)
-            num_sats = list(self.num_sats)
-            water_speed = list(self.water_speed)
-            water_dir = list(self.water_dir)
-            vtg_speed = list(self.vtg_speed)
-
-            # Recreate the deque with the new maxlen and original data
-            self.boat_speed = deque(boat_speed, maxlen=self.max_ens)
-            self.boat_dir = deque(boat_dir, maxlen=self.max_ens)
-            self.heading = deque(heading, maxlen=self.max_ens)
-            self.pitch = deque(pitch, maxlen=self.max_ens)
-            self.roll = deque(roll, maxlen=self.max_ens)
-            self.temperature = deque(temperature, maxlen=self.max_ens)
-            self.gnss_qual = deque(gnss_qual, maxlen=self.max_ens)
-            self.gnss_hdop = deque(gnss_hdop, maxlen=self.max_ens)
-            self.num_sats = deque(num_sats, maxlen=self.max_ens)
-            self.water_speed = deque(water_speed, maxlen=max_ens)
-            self.water_dir = deque(water_dir, maxlen=max_ens)
-            self.vtg_speed = deque(vtg_speed, maxlen=max_ens)
-
-        # Release the lock
-        self.thread_lock.release()
+        with self.thread_lock:
+            # Write settings to the config
+            self.rti_config.config['TIMESERIES']['IS_BOAT_SPEED'] = RtiConfig.bool_to_str(is_boat_speed)
+            self.rti_config.config['TIMESERIES']['IS_BOAT_DIR'] = RtiConfig.bool_to_str(is_boat_dir)
+            self.rti_config.config['TIMESERIES']['IS_HEADING'] = RtiConfig.bool_to_str(is_heading)
+            self.rti_config.config['TIMESERIES']['IS_PITCH'] = RtiConfig.bool_to_str(is_pitch)
+            self.rti_config.config['TIMESERIES']['IS_ROLL'] = RtiConfig.bool_to_str(is_roll)
+            self.rti_config.config['TIMESERIES']['IS_TEMPERATURE'] = RtiConfig.bool_to_str(is_temp)
+            self.rti_config.config['TIMESERIES']['IS_GNSS_QUAL'] = RtiConfig.bool_to_str(is_gnss_qual)
+            self.rti_config.config['TIMESERIES']['IS_GNSS_HDOP'] = RtiConfig.bool_to_str(is_gnss_hdop)
+            self.rti_config.config['TIMESERIES']['IS_NUM_SATS'] = RtiConfig.bool_to_str(is_num_sats)
+            self.rti_config.config['TIMESERIES']['IS_WATER_SPEED'] = RtiConfig.bool_to_str(is_water_speed)
+            self.rti_config.config['TIMESERIES']['IS_WATER_DIR'] = RtiConfig.bool_to_str(is_water_dir)
+            self.rti_config.config['TIMESERIES']['IS_VTG_SPEED'] = RtiConfig.bool_to_str(is_vtg_speed)
+            self.rti_config.config['TIMESERIES']['MAX_ENS'] = str(max_ens)
+            self.rti_config.write()
+
+            # Set the options
+            self.is_boat_speed = is_boat_speed
+            self.is_boat_dir = is_boat_dir
+            self.is_heading = is_heading
+            self.is_pitch = is_pitch
+            self.is_roll = is_roll
+            self.is_temperature = is_temp
+            self.is_gnss_qual = is_gnss_qual
+            self.is_gnss_hdop = is_gnss_hdop
+            self.is_num_sats = is_num_sats
+            self.is_water_speed = is_water_speed
+            self.is_water_dir = is_water_dir
+            self.is_vtg_speed = is_vtg_speed
+
+            # Check if Max Ensembles changed
+            # If it changed, then copy the latest values to a buffer of the new size
+            if self.max_ens != max_ens and not math.isnan(max_ens):
+                self.max_ens = max_ens
+                self.series.resize(max_ens)
+
+                # The views must get all the data again
+                self.sequence.reset()
+
+            # The series displayed changed
+            self.publish_snapshot()
 
     def get_options(self):
         """
@@ -228,10 +241,19 @@ class TimeSeriesVM:
         """
 
         # Lock the object
-        self.thread_lock.acquire()
+        with self.thread_lock:
+            st_data = self.get_options_data()
 
-        # Populate the structure
-        st_data = {
+        logging.info(st_data)
+
+        return st_data
+
+    def get_options_data(self):
+        """
+        Populate the structure with the options.  The lock must be held.
+        :return: Structure with the options.
+        """
+        return {
             "isBoatSpeed": self.is_boat_speed,
             "isBoatDir": self.is_boat_dir,
             "isHeading": self.is_heading,
@@ -247,80 +269,168 @@ class TimeSeriesVM:
             "maxEns": self.max_ens,
         }
 
-        # Release the lock
-        self.thread_lock.release()
-
-        logging.info(st_data)
+    def publish_snapshot(self):
+        """
+        Publish the series and the options for get_data().  The snapshot
+        shares the rows with the series buffer, so nothing is copied.
+        The lock must be held.
+        :return:
+        """
+        self.snapshot = self.snapshot.next((self.series.snapshot(), self.get_options_data()))
 
-        return st_data
+    def get_version(self):
+        """
+        Get the version of the data.  The version increases at the
+        end of each batch and when the options change.
+        :return: Version number.
+        """
+        return self.snapshot.version
 
-    def get_data(self):
+    def get_data(self, max_points: int = 0, fmt: str = PlotPayload.FORMAT_LIST, is_packed: bool = False):
         """
         Get the options and the data.  Populate the structure.
 
-        Lock and unlock when getting the data to ensure
-        when new data is received, it is not being used with
-        old data.
+        The structure is built from the latest snapshot, so the lock is
+        not needed and new data can be added while the structure is built.
+        The structure is reused until the next snapshot.
+        :param max_points: Maximum number of points for each series.  0 for all the points.
+        :param fmt: Format of the values, list or binary.  See PlotPayload.
+        :param is_packed: Get the structure encoded with msgpack.
         :return: Structure with all the latest data
         """
+        snapshot = self.snapshot
+        series, options = snapshot.data
+        fmt = PlotPayload.check_format(fmt)
+
+        if len(series) == 0:
+            st_data = snapshot.get_payload(None, lambda data: {}, is_packed)
+        elif max_points and 0 < max_points < len(series):
+            st_data = snapshot.get_payload((max_points, fmt), lambda data: TimeSeriesVM.get_downsampled_data(data, max_points, fmt), is_packed)
+        else:
+            st_data = snapshot.get_payload((0, fmt), lambda data: TimeSeriesVM.get_series_data(data[0].get(), data[1], fmt), is_packed)
+
+        logging.debug(st_data)
+
+        return st_data
+
+    def get_data_since(self, since_seq: int):
+        """
+        Get only the data added after the sequence number.
+        See SequenceTracker for how the view uses the sequence number.
+        :param since_seq: Sequence number from the last request.  0 for all the data.
+        :return: Structure with the new data, the latest sequence number "seq" and "isReset".
+        """
 
         # Lock the object
-        self.thread_lock.acquire()
-
-        if len(self.x_dt) > 0:
-            # Populate the structure
-            st_data = {
-                "isBoatSpeed": self.is_boat_speed,
-                "boatSpeedData": list(self.boat_speed),
-                "isBoatDir": self.is_boat_dir,
-                "boatDirData": list(self.boat_dir),
-                "isHeading": self.is_heading,
-                "headingData": list(self.heading),
-                "isPitch": self.is_pitch,
-                "pitchData": list(self.pitch),
-                "isRoll": self.is_roll,
-                "rollData": list(self.roll),
-                "isTemperature": self.is_temperature,
-                "temperatureData": list(self.temperature),
-                "isGnssQual": self.is_gnss_qual,
-                "gnssQualData": list(self.gnss_qual),
-                "isGnssHdop": self.is_gnss_hdop,
-                "gnssHdopData": list(self.gnss_hdop),
-                "isNumSat": self.is_num_sats,
-                "numSatData": list(self.num_sats),
-                "isWaterSpeed": self.is_water_speed,
-                "waterSpeedData": list(self.water_speed),
-                "isWaterDir": self.is_water_dir,
-                "waterDirData": list(self.water_dir),
-                "isVtgSpeed": self.is_vtg_speed,
-                "vtgSpeed": list(self.vtg_speed),
-                "X_dt": list(self.x_dt),
-                "maxEns": self.max_ens,
-            }
-        else:
-            st_data = {}
+        with self.thread_lock:
+            series = self.series.get()
+            start, is_reset = self.sequence.get_start(since_seq, len(series))
 
-        # Release the lock
-        self.thread_lock.release()
+            st_data = TimeSeriesVM.get_series_data(series[start:], self.get_options_data())
+            st_data["seq"] = self.sequence.seq
+            st_data["isReset"] = is_reset
 
-        logging.info(st_data)
+        logging.debug(st_data)
 
         return st_data
 
+    @staticmethod
+    def get_downsampled_data(data, max_points: int, fmt: str = PlotPayload.FORMAT_LIST):
+        """
+        Populate the structure with at most max_points points.  The
+        points are selected with LTTB from the series displayed.
+        :param data: Snapshot data of the series ChunkBuffer and the options.
+        :param max_points: Maximum number of points.
+        :param fmt: Format of the values, list or binary.
+        :return: Structure with the data.
+        """
+        series, options = data[0].get(), data[1]
+        lines = [series[column] for column in TimeSeriesVM.get_displayed_columns(options)]
+        selected = Downsample.lttb_union(series['time'], lines, max_points)
+        return TimeSeriesVM.get_series_data(series[selected], options, fmt)
+
+    @staticmethod
+    def get_displayed_columns(options):
+        """
+        Get the columns of the series displayed.
+        :param options: Structure of the options from get_options_data().
+        :return: List of column names.
+        """
+        displayed = [("isBoatSpeed", 'boat_speed'),
+                     ("isBoatDir", 'boat_dir'),
+                     ("isHeading", 'heading'),
+                     ("isPitch", 'pitch'),
+                     ("isRoll", 'roll'),
+                     ("isTemperature", 'temperature'),
+                     ("isGnssQual", 'gnss_qual'),
+                     ("isGnssHdop", 'gnss_hdop'),
+                     ("isNumSat", 'num_sats'),
+                     ("isWaterSpeed", 'water_speed'),
+                     ("isWaterDir", 'water_dir'),
+                     ("isVtgSpeed", 'vtg_speed')]
+        return [column for option, column in displayed if options[option]]
+
+    @staticmethod
+    def get_series_data(series, options, fmt: str = PlotPayload.FORMAT_LIST):
+        """
+        Populate the structure with the options and the time series values.
+        :param series: Numpy array of DTYPE rows.
+        :param options: Structure of the options from get_options_data().
+        :param fmt: Format of the values, list or binary.
+        :return: Structure with the data.
+        """
+        # Populate the structure
+        st_data = {
+            "isBoatSpeed": options["isBoatSpeed"],
+            "boatSpeedData": PlotPayload.to_values(series['boat_speed'], fmt),
+            "isBoatDir": options["isBoatDir"],
+            "boatDirData": PlotPayload.to_values(series['boat_dir'], fmt),
+            "isHeading": options["isHeading"],
+            "headingData": PlotPayload.to_values(series['heading'], fmt),
+            "isPitch": options["isPitch"],
+            "pitchData": PlotPayload.to_values(series['pitch'], fmt),
+            "isRoll": options["isRoll"],
+            "rollData": PlotPayload.to_values(series['roll'], fmt),
+            "isTemperature": options["isTemperature"],
+            "temperatureData": PlotPayload.to_values(series['temperature'], fmt),
+            "isGnssQual": options["isGnssQual"],
+            "gnssQualData": PlotPayload.to_values(series['gnss_qual'], fmt),
+            "isGnssHdop": options["isGnssHdop"],
+            "gnssHdopData": PlotPayload.to_values(series['gnss_hdop'], fmt),
+            "isNumSat": options["isNumSat"],
+            "numSatData": PlotPayload.to_values(series['num_sats'], fmt),
+            "isWaterSpeed": options["isWaterSpeed"],
+            "waterSpeedData": PlotPayload.to_values(series['water_speed'], fmt),
+            "isWaterDir": options["isWaterDir"],
+            "waterDirData": PlotPayload.to_values(series['water_dir'], fmt),
+            "isVtgSpeed": options["isVtgSpeed"],
+            "vtgSpeed": PlotPayload.to_values(series['vtg_speed'], fmt),
+            "X_dt": PlotPayload.to_times(series['time'], fmt),
+            "maxEns": options["maxEns"],
+        }
+
+        return st_data
+
+    def get_series(self):
+        """
+        Get the time series values from the oldest to the
+        latest ensemble.  The values do not change when
+        ensembles are added.
+        :return: Read only numpy array of DTYPE rows.
+        """
+        # Lock the object
+        with self.thread_lock:
+            series = self.series.get()
+
+        return series
+
     def reset(self):
         """
         Reset all the values to clear the plot.
         :return:
         """
-        self.boat_speed.clear()
-        self.boat_dir.clear()
-        self.heading.clear()
-        self.pitch.clear()
-        self.roll.clear()
-        self.temperature.clear()
-        self.gnss_qual.clear()
-        self.gnss_hdop.clear()
-        self.num_sats.clear()
-        self.water_speed.clear()
-        self.water_dir.clear()
-        self.vtg_speed.clear()
+        # Lock the object
+        with self.thread_lock:
+            self.series.clear()
+            self.sequence.reset()
+            self.publish_snapshot()
@@ -0,0 +1,97 @@
+import numpy as np
+from Geodesic import Geodesic
+
+
+class TrackSimplifier:
+    """
+    Simplify the ship track as the points are received.
+
+    This is a streaming version of Douglas-Peucker.  The last kept point
+    is the anchor.  The points received after the anchor are only kept
+    if the line from the anchor to the newest point moves more than the
+    tolerance away from one of them.  Then the point before the newest
+    point is kept and becomes the new anchor.
+
+    The points waiting after the anchor are limited to MAX_WINDOW.  If the
+    window is full, every other point is dropped from the window, so a
+    moored ADCP sitting in one place does not grow the track.
+    """
+
+    MAX_WINDOW = 256
+
+    def __init__(self, tolerance: float = 2.0):
+        """
+        Initialize the track.
+        :param tolerance: Largest distance in meters a dropped point can be from the track.
+        """
+        self.tolerance = tolerance
+        self.lat = []                       # Kept points
+        self.lon = []
+        self.window_lat = []                # Points received after the last kept point
+        self.window_lon = []
+
+    def add(self, lat: float, lon: float):
+        """
+        Add a point to the end of the track.
+        :param lat: Latitude in degrees.
+        :param lon: Longitude in degrees.
+        :return:
+        """
+        if not self.lat:
+            self.lat.append(lat)
+            self.lon.append(lon)
+            return
+
+        if self.window_lat and self.get_max_distance(lat, lon) > self.tolerance:
+            # The previous point is needed to stay within the tolerance
+            self.lat.append(self.window_lat[-1])
+            self.lon.append(self.window_lon[-1])
+            self.window_lat.clear()
+            self.window_lon.clear()
+
+        if len(self.window_lat) >= TrackSimplifier.MAX_WINDOW:
+            del self.window_lat[-2::-2]
+            del self.window_lon[-2::-2]
+
+        self.window_lat.append(lat)
+        self.window_lon.append(lon)
+
+    def get_max_distance(self, lat: float, lon: float):
+        """
+        Get the largest distance from the window points to the
+        line from the anchor to the new point.
+        :param lat: Latitude of the new point in degrees.
+        :param lon: Longitude of the new point in degrees.
+        :return: Distance in meters.
+        """
+        anchor_lat = self.lat[-1]
+        anchor_lon = self.lon[-1]
+        x, y = Geodesic.to_local(self.window_lat, self.window_lon, anchor_lat, anchor_lon)
+        end_x, end_y = Geodesic.to_local(lat, lon, anchor_lat, anchor_lon)
+
+        # Distance to the closest point on the line
+        length = end_x * end_x + end_y * end_y
+        if length > 0:
+            t = np.clip((x * end_x + y * end_y) / length, 0.0, 1.0)
+        else:
+            t = 0.0
+        return float(np.max(np.hypot(x - t * end_x, y - t * end_y)))
+
+    def get_track(self):
+        """
+        Get the simplified track.  The latest point is always included.
+        :return: List of latitudes and list of longitudes.
+        """
+        if self.window_lat:
+            return self.lat + self.window_lat[-1:], self.lon + self.window_lon[-1:]
+        return list(self.lat), list(self.lon)
+
+    def clear(self):
+        """
+        Remove all the points.
+        :return:
+        """
+        self.lat.clear()
+        self.lon.clear()
+        self.window_lat.clear()
+        self.window_lon.clear()
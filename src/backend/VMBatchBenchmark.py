@@ -0,0 +1,123 @@
+import logging
+import time
+from types import SimpleNamespace
+import numpy as np
+from rti_python.Utilities.config import RtiConfig
+from EnsembleCache import EnsembleCache, CachedEnsemble
+from EnsembleValues import EnsembleValues
+from AmplitudeVM import AmplitudeVM
+from ContourVM import ContourVM
+from ShipTrackVM import ShipTrackVM
+from TabularDataVM import TabularDataVM
+from TimeSeriesVM import TimeSeriesVM
+
+
+class VMBatchBenchmark:
+    """
+    Measure how many ensembles per second the ViewModels process for
+    each batch size given to set_ens_batch().  Run this file to do the
+    benchmark:
+
+    python VMBatchBenchmark.py
+
+    The synthetic ensembles are created from cache columns in memory,
+    so they have every dataset the ViewModels use.  New ViewModels are
+    created for each batch size.
+    """
+
+    NUM_ENS = 5000                              # Ensembles passed for each batch size
+    NUM_BINS = 30                               # Bins in each ensemble
+    BATCH_SIZES = [1, 10, 100, 1000]
+
+    @staticmethod
+    def create_reader(num_ens: int = NUM_ENS, num_bins: int = NUM_BINS):
+        """
+        Create cache columns in memory for the synthetic ensembles.
+        The boat moves east at 1 m/s with an ensemble each second.
+        :param num_ens: Number of ensembles.
+        :param num_bins: Number of bins in each ensemble.
+        :return: Object with the ens_data and bin_data of an EnsembleCacheReader.
+        """
+        ens_data = np.zeros(num_ens, dtype=EnsembleCache.ENS_DTYPE)
+        ens_nums = np.arange(num_ens)
+        ens_data['ens_num'] = ens_nums
+        ens_data['timestamp'] = EnsembleValues.to_microseconds(EnsembleValues.EPOCH) + ens_nums * 1000000
+        ens_data['num_bins'] = num_bins
+        ens_data['num_beams'] = 4
+        ens_data['bin_offset'] = ens_nums * num_bins
+        ens_data['first_bin_range'] = 1.0
+        ens_data['bin_size'] = 0.5
+        ens_data['heading'] = 90.0
+        ens_data['water_temp'] = 15.0
+        ens_data['transducer_depth'] = 0.5
+        ens_data['avg_mag'] = 1.0
+        ens_data['avg_dir'] = 180.0
+        ens_data['bt_avg_range'] = 20.0
+        ens_data['bt_range'] = 20.0
+        ens_data['bt_earth_vel'] = [-1.0, 0.0, 0.0, 0.0]
+        ens_data['latitude'] = 32.0
+        ens_data['longitude'] = -117.0 + ens_nums * 1e-5
+        ens_data['num_sats'] = 9
+        ens_data['gps_qual'] = 1
+        ens_data['hdop'] = 0.9
+        ens_data['speed'] = 1.0
+        for name in ['is_ancillary', 'is_earth', 'is_amp', 'is_beam', 'is_corr', 'is_bt', 'is_nmea', 'is_gga']:
+            ens_data[name] = 1
+
+        num_rows = num_ens * num_bins
+        rng = np.random.default_rng(0)
+        bin_data = {name: rng.uniform(0.0, 1.0, (num_rows, width)) for name, width in EnsembleCache.BIN_COLUMNS}
+        bin_data['earth_vel'][:, 1] -= 1.0
+        bin_data['amplitude'] *= 100.0
+
+        return SimpleNamespace(ens_data={name: ens_data[name] for name in EnsembleCache.ENS_DTYPE.names},
+                               bin_data=bin_data)
+
+    @staticmethod
+    def create_vms():
+        """
+        Create the ViewModels the DataManager feeds.
+        :return: Dictionary of the ViewModels by name.
+        """
+        rti_config = RtiConfig()
+        rti_config.init_timeseries_plot_config()
+
+        return {
+            "Tabular": TabularDataVM(),
+            "Amplitude": AmplitudeVM(),
+            "Contour": ContourVM(),
+            "ShipTrack": ShipTrackVM(),
+            "TimeSeries": TimeSeriesVM(rti_config=rti_config),
+        }
+
+    @staticmethod
+    def run():
+        """
+        Pass the synthetic ensembles to new ViewModels for each batch size.
+        :return: List of (batch size, ViewModel name, ensembles per second).  The name is "All" for the total.
+        """
+        reader = VMBatchBenchmark.create_reader()
+        ens_list = [CachedEnsemble(reader, index) for index in range(VMBatchBenchmark.NUM_ENS)]
+
+        results = []
+        for batch_size in VMBatchBenchmark.BATCH_SIZES:
+            total_time = 0.0
+            for name, vm in VMBatchBenchmark.create_vms().items():
+                start = time.perf_counter()
+                for index in range(0, len(ens_list), batch_size):
+                    vm.set_ens_batch(ens_list[index:index + batch_size])
+                elapsed = time.perf_counter() - start
+
+                total_time += elapsed
+                results.append((batch_size, name, len(ens_list) / elapsed))
+
+            results.append((batch_size, "All", len(ens_list) / total_time))
+
+        return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+
+    for bench_batch_size, bench_name, ens_s in VMBatchBenchmark.run():
+        logging.info("batch %4d  %-10s %10.1f ens/s", bench_batch_size, bench_name, ens_s)
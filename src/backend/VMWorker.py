@@ -0,0 +1,184 @@
+import logging
+import time
+from threading import Thread, Lock
+from IngestQueue import IngestQueue
+
+
+class VMWorker:
+    """
+    Feed a ViewModel from its own queue and thread, so a slow
+    ViewModel does not stall the other ViewModels.
+
+    The ViewModel must have a set_ens_batch(ens_list) method.
+
+    If the ViewModel only displays the latest ensemble, coalesce
+    can be set.  The worker will then pass everything waiting in the
+    queue as one batch, so the ViewModel can skip the older ensembles.
+
+    The lag is the difference between the latest ensemble number
+    added to the queue and the latest ensemble number processed.
+
+    Each ensemble has the generation of the data manager when it was
+    received.  clear() sets the new generation, and ensembles of an
+    older generation are not passed to the ViewModel.
+    """
+
+    # Time between checks if the worker is stopped while waiting
+    WAIT_TIMEOUT = 0.1
+
+    def __init__(self,
+                 name: str,
+                 vm,
+                 coalesce: bool = False,
+                 maxlen: int = 1000,
+                 batch_size: int = 100,
+                 batch_wait: float = 0.02):
+        """
+        Create the worker.  Call start() to start the thread.
+        :param name: Name of the ViewModel.
+        :param vm: ViewModel to feed.
+        :param coalesce: Pass all the waiting ensembles at once because only the latest is displayed.
+        :param maxlen: Maximum number of ensembles waiting in the queue.
+        :param batch_size: Most ensembles passed to the ViewModel at once if not coalescing.
+        :param batch_wait: Time to wait for a full batch in seconds.
+        """
+        self.name = name
+        self.vm = vm
+        self.coalesce = coalesce
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue = IngestQueue(maxlen=maxlen)
+
+        # Generation of the ensembles to process.  The lock is held while
+        # a batch is checked and processed, so clear() can wait for it.
+        self.generation = 0
+        self.process_lock = Lock()
+
+        # Lag counters
+        self.ingested_ens_num = 0
+        self.processed_ens_num = 0
+        self.processed = 0
+        self.batches = 0
+        self.busy_time = 0.0
+        self.stats_lock = Lock()
+
+        self.is_alive = True
+        self.thread = Thread(name=name + " VMWorker", target=self.run)
+
+    def start(self):
+        """
+        Start the worker thread.
+        :return:
+        """
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the worker thread.  Any ensembles waiting are not processed.
+        :return:
+        """
+        self.is_alive = False
+        self.queue.close()
+
+    def put_batch(self, ens_list, policy: str = IngestQueue.POLICY_BLOCK, generation: int = 0):
+        """
+        Add the ensembles to the worker queue.
+        :param ens_list: List of ensembles.
+        :param policy: IngestQueue policy if the queue is full.
+        :param generation: Generation when the ensembles were received.
+        :return:
+        """
+        if not ens_list:
+            return
+
+        # Set the latest ensemble number before it is processed
+        with self.stats_lock:
+            self.ingested_ens_num = ens_list[-1].EnsembleData.EnsembleNumber
+
+        self.queue.put_batch([(generation, ens) for ens in ens_list], policy)
+
+    def clear(self, generation: int = 0):
+        """
+        Remove all the ensembles waiting and reset the lag.
+        Used when the playback is cancelled or moved.
+
+        If a batch is being processed, wait for it, so no older
+        ensembles are passed to the ViewModel after this returns.
+        :param generation: New generation.  Ensembles of other generations are dropped.
+        :return:
+        """
+        self.generation = generation
+        self.queue.clear()
+
+        # Wait for the batch being processed
+        with self.process_lock:
+            pass
+
+        with self.stats_lock:
+            self.ingested_ens_num = 0
+            self.processed_ens_num = 0
+
+    def get_stats(self):
+        """
+        Get the lag and queue counters.
+        :return: Dictionary with the counters.
+        """
+        stats = self.queue.get_stats()
+
+        with self.stats_lock:
+            stats["ingestedEnsNum"] = self.ingested_ens_num
+            stats["processedEnsNum"] = self.processed_ens_num
+            stats["lag"] = max(0, self.ingested_ens_num - self.processed_ens_num)
+            stats["processed"] = self.processed
+            stats["batches"] = self.batches
+            stats["busyTime"] = self.busy_time
+            stats["isCoalesce"] = self.coalesce
+
+        return stats
+
+    def reset_stats(self):
+        """
+        Reset the counters.
+        :return:
+        """
+        self.queue.reset_stats()
+
+        with self.stats_lock:
+            self.processed = 0
+            self.batches = 0
+            self.busy_time = 0.0
+
+    def run(self):
+        """
+        Worker thread.  Pass the ensembles in the queue to the ViewModel.
+        :return:
+        """
+        while self.is_alive:
+            # Take everything waiting if only the latest ensemble is displayed
+            if self.coalesce:
+                max_items = self.queue.maxlen
+            else:
+                max_items = self.batch_size
+
+            batch = self.queue.get_batch(max_items, self.batch_wait, VMWorker.WAIT_TIMEOUT)
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            with self.process_lock:
+                # Drop the ensembles received before the queue was cleared
+                ens_list = [ens for generation, ens in batch if generation == self.generation]
+                if not ens_list:
+                    continue
+
+                try:
+                    self.vm.set_ens_batch(ens_list)
+                except Exception as e:
+                    logging.error(self.name + " error processing ensembles. " + str(e))
+            elapsed = time.perf_counter() - start
+
+            with self.stats_lock:
+                self.processed_ens_num = ens_list[-1].EnsembleData.EnsembleNumber
+                self.processed += len(ens_list)
+                self.batches += 1
+                self.busy_time += elapsed
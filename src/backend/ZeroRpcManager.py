@@ -1,8 +1,11 @@
 import zerorpc
 import logging
+import datetime
+from functools import partial
 from typing import List
-from threading import Thread
-from PlaybackManager import PlaybackManager
+from PlaybackSession import PlaybackSession
+from EnsembleIndex import EnsembleIndex, IndexBuild
+from EnsembleValues import EnsembleValues
 from rti_python.Utilities.config import RtiConfig
 from AmplitudeVM import AmplitudeVM
 from ContourVM import ContourVM
@@ -10,10 +13,20 @@ from TabularDataVM import TabularDataVM
 from ShipTrackVM import ShipTrackVM
 from TimeSeriesVM import TimeSeriesVM
 from AdcpTerminal import AdcpTerminalVM
+from Subscription import Subscription
 
 
 class ZeroRpcManager:
 
+    # Views that can be subscribed
+    VIEW_TABULAR = "tabular"
+    VIEW_AMP = "amp"
+    VIEW_CONTOUR = "contour"
+    VIEW_SHIPTRACK = "shiptrack"
+    VIEW_TIMESERIES = "timeseries"
+    VIEW_TERMINAL = "terminal"
+    VIEWS = [VIEW_TABULAR, VIEW_AMP, VIEW_CONTOUR, VIEW_SHIPTRACK, VIEW_TIMESERIES, VIEW_TERMINAL]
+
     def __init__(self,
                  rti_config: RtiConfig,
                  data_mgr,
@@ -36,6 +49,12 @@ class ZeroRpcManager:
         self.timeseries_vm = timeseries_vm
         self.adcp_terminal = adcp_terminal
 
+        # Current playback
+        self.playback_session = None
+
+        # Ensemble index builds running for each file
+        self.index_builds = {}
+
     def run_server(self, port: int = 4241):
         """
         Start a zerorpc server.  The server will share the data between
@@ -50,53 +69,320 @@ class ZeroRpcManager:
         s.bind(zerorpc_ip)
         s.run()
 
-    def zerorpc_playback_files(self, files: List[str]):
+    def zerorpc_playback_files(self, files: List[str], num_workers: int = 1, rate: float = 0.0):
         """
         Playback the given files.  This will add all the data
         from the files into the codec.
+
+        Any playback already running is cancelled.
         :param files: List of files.
+        :param num_workers: Number of processes to decode the files.  0 will use all the CPU cores.
+        :param rate: 0 is as fast as possible, 1.0 is real time and N is N times real time.
         :return:
         """
         if files:
             logging.info("Loading files: " + str(files))
 
-            # Reset VM plots
-            self.reset_vm()
-
             # Run a thread to playback the file
-            playback_mgr = PlaybackManager(self.data_mgr)
-            thread = Thread(name="AdcpDataManager Playback Thread", target=playback_mgr.playback_thread,
-                            args=(files,))
-            thread.start()
+            self.start_playback(PlaybackSession(self.data_mgr, files,
+                                                rate=rate,
+                                                num_workers=num_workers,
+                                                on_seek=self.clear_playback,
+                                                ens_cache=self.data_mgr.ens_cache))
+
+    def zerorpc_follow_file(self, file: str, rate: float = 0.0):
+        """
+        Playback the file while it is still being recorded.  The
+        new data is displayed as it is written to the file.  Cancel
+        the playback to stop following the file.
+        :param file: File being recorded.
+        :param rate: Rate to play the data already in the file.  0 is as fast as possible.
+        :return:
+        """
+        logging.info("Follow file: " + str(file))
+
+        self.start_playback(PlaybackSession(self.data_mgr, [file],
+                                            rate=rate,
+                                            follow=True))
+
+    def zerorpc_playback_pause(self):
+        """
+        Pause the playback.
+        :return:
+        """
+        logging.info("Pause Playback")
+        if self.playback_session:
+            self.playback_session.pause()
+
+    def zerorpc_playback_resume(self):
+        """
+        Resume the paused playback.
+        :return:
+        """
+        logging.info("Resume Playback")
+        if self.playback_session:
+            self.playback_session.resume()
+
+    def zerorpc_playback_cancel(self):
+        """
+        Cancel the playback.
+        :return:
+        """
+        logging.info("Cancel Playback")
+        if self.playback_session:
+            self.playback_session.cancel(wait=False)
+
+    def zerorpc_playback_rate(self, rate: float):
+        """
+        Set the playback rate.
+        :param rate: 0 is as fast as possible, 1.0 is real time and N is N times real time.
+        :return:
+        """
+        logging.info("Playback Rate: " + str(rate))
+        if self.playback_session:
+            self.playback_session.set_rate(rate)
+
+    def zerorpc_playback_seek_ens(self, ens_num: int):
+        """
+        Move the playback to the ensemble number.
+        The plots are cleared and the playback continues from the ensemble.
+        :param ens_num: Ensemble number.
+        :return:
+        """
+        logging.info("Playback Seek Ensemble: " + str(ens_num))
+        if self.playback_session:
+            self.playback_session.seek_ens(ens_num)
+
+    def zerorpc_playback_seek_time(self, seek_time: str):
+        """
+        Move the playback to the time.
+        The plots are cleared and the playback continues from the time.
+        :param seek_time: Time as an ISO format string.
+        :return:
+        """
+        logging.info("Playback Seek Time: " + seek_time)
+        if self.playback_session:
+            self.playback_session.seek_time(EnsembleIndex.to_timestamp(datetime.datetime.fromisoformat(seek_time)))
+
+    def zerorpc_playback_status(self):
+        """
+        Get the playback status.
+        :return: State, files and rate of the playback.
+        """
+        if self.playback_session:
+            return self.playback_session.get_status()
+
+        return {"state": PlaybackSession.STATE_IDLE}
+
+    def zerorpc_build_index(self, file: str):
+        """
+        Build the ensemble index for the file.  If the index
+        is already built and the file has not changed, the index
+        is reused.
+
+        A large file takes time to scan, so the index is built in a thread.
+        Call again until the state is done.
+        :param file: Ensemble file.
+        :return: State (building, done or error).  When done, the number of ensembles, first and last ensemble number, first and last time.
+        """
+        logging.info("Build Index: " + str(file))
+
+        # Reuse the sidecar if it is up to date
+        index = EnsembleIndex.load(file)
+        if index is not None:
+            self.index_builds.pop(file, None)
+            return dict(index.get_summary(), state=IndexBuild.STATE_DONE)
+
+        build = self.index_builds.get(file)
+        if build is None:
+            self.index_builds[file] = IndexBuild(file)
+            return {"state": IndexBuild.STATE_BUILDING}
+
+        if build.state == IndexBuild.STATE_BUILDING:
+            return {"state": IndexBuild.STATE_BUILDING}
+
+        # Done, but the sidecar could not be written, or the build failed
+        del self.index_builds[file]
+        if build.state == IndexBuild.STATE_ERROR:
+            return {"state": IndexBuild.STATE_ERROR, "error": build.error}
+        return dict(build.index.get_summary(), state=IndexBuild.STATE_DONE)
+
+    def zerorpc_playback_ens_range(self, file: str, first_ens: int, last_ens: int):
+        """
+        Playback only the ensembles within the ensemble number range.
+        The ensemble index is used to seek to the ensembles.  The index
+        is built in the playback thread if needed.
+        :param file: Ensemble file.
+        :param first_ens: First ensemble number.
+        :param last_ens: Last ensemble number.
+        :return:
+        """
+        logging.info("Loading file: " + str(file) + " Ensembles: " + str(first_ens) + " - " + str(last_ens))
+
+        self.playback_records(file, lambda index: index.ens_range(first_ens, last_ens))
+
+    def zerorpc_playback_time_range(self, file: str, start_time: str, end_time: str):
+        """
+        Playback only the ensembles within the time range.
+        The ensemble index is used to seek to the ensembles.  The index
+        is built in the playback thread if needed.
+        :param file: Ensemble file.
+        :param start_time: Start time as an ISO format string.
+        :param end_time: End time as an ISO format string.
+        :return:
+        """
+        logging.info("Loading file: " + str(file) + " Time: " + start_time + " - " + end_time)
+
+        start_timestamp = EnsembleIndex.to_timestamp(datetime.datetime.fromisoformat(start_time))
+        end_timestamp = EnsembleIndex.to_timestamp(datetime.datetime.fromisoformat(end_time))
+        self.playback_records(file, lambda index: index.time_range(start_timestamp, end_timestamp))
+
+    def playback_records(self, file: str, select):
+        """
+        Playback the selected records of the file.
+        :param file: Ensemble file.
+        :param select: Function to select the records from the EnsembleIndex of the file.
+        :return:
+        """
+        # Run a thread to playback the records
+        self.start_playback(PlaybackSession(self.data_mgr, [file],
+                                            select=select,
+                                            on_seek=self.clear_playback))
+
+    def start_playback(self, session: PlaybackSession):
+        """
+        Cancel the current playback, clear the plots and
+        start the new playback session.
+        :param session: Playback session to start.
+        :return:
+        """
+        # Stop the old playback without waiting for its thread.  Any
+        # ensemble it still passes is dropped when the queue is cleared.
+        if self.playback_session:
+            self.playback_session.cancel(wait=False)
+
+        # Reset VM plots
+        # Clearing the queue also lets a playback waiting for room in the queue stop
+        self.clear_playback()
+
+        self.playback_session = session
+        self.playback_session.start()
+
+    def clear_playback(self):
+        """
+        Remove the ensembles waiting to be displayed and
+        clear the plots.
+        :return:
+        """
+        self.data_mgr.clear_queue()
+        self.reset_vm()
+
+    def zerorpc_ingest_stats(self):
+        """
+        Get the number of ensembles added to the display queue,
+        the number dropped and the most ensembles waiting in the queue.
+        :return: Ingest queue counters and policies.
+        """
+        logging.info("Ingest Stats Request")
+        return self.data_mgr.get_ingest_stats()
+
+    def zerorpc_set_ingest_policy(self, playback_policy: str, live_policy: str, max_len: int):
+        """
+        Set what to do when the display can not keep up with the incoming ensembles.
+        Policies: block, drop_oldest, drop_newest
+        :param playback_policy: Policy for playback.
+        :param live_policy: Policy for live serial data.
+        :param max_len: Maximum number of ensembles waiting to be displayed.
+        :return:
+        """
+        logging.info("Set Ingest Policy: " + str(playback_policy) + " " + str(live_policy) + " " + str(max_len))
+        self.data_mgr.set_ingest_policy(playback_policy, live_policy, max_len)
 
-    def zerorpc_tabular_data(self, subsystem: int):
+    def zerorpc_vm_stats(self):
+        """
+        Get the lag of each ViewModel.  The lag is the latest ensemble
+        number received minus the latest ensemble number processed by the ViewModel.
+        :return: Lag and queue counters for each ViewModel name.
+        """
+        logging.info("VM Stats Request")
+        return self.data_mgr.get_vm_stats()
+
+    def zerorpc_tabular_data(self, subsystem: int, is_packed: bool = False):
         """
         Get the latest amplitude data.
         :param subsystem: Subsystem number.
+        :param is_packed: Get the response encoded with msgpack.  The encoded response is reused until the data changes.
         :return:
         """
         logging.info("Tabular Data Request")
-        return self.tabular_vm.get_data()
+        return self.tabular_vm.get_data(is_packed)
+
+    def zerorpc_set_discharge_options(self, exponent: float, left_distance: float, right_distance: float, edge_coeff: float, is_start_left: bool):
+        """
+        Set the discharge extrapolation and edge options.
+        :param exponent: Power law exponent for the top and bottom.  1/6 is typical.
+        :param left_distance: Distance in meters from the left bank to the first or last ensemble.
+        :param right_distance: Distance in meters from the right bank to the first or last ensemble.
+        :param edge_coeff: Edge coefficient.  0.3535 for a sloped bank and 0.91 for a vertical bank.
+        :param is_start_left: The transect starts on the left bank.
+        :return:
+        """
+        logging.info("Set Discharge Options")
+        self.tabular_vm.set_discharge_options(exponent, left_distance, right_distance, edge_coeff, is_start_left)
 
-    def zerorpc_amp_plot(self, subsystem: int):
+    def zerorpc_amp_plot(self, subsystem: int, fmt: str = "list", is_packed: bool = False):
         """
         Get the latest amplitude data.
         :param subsystem: Subsystem number.
+        :param fmt: list for lists of values or binary for little-endian typed array buffers.
+        :param is_packed: Get the response encoded with msgpack.  The encoded response is reused until the data changes.
         :return:
         """
         logging.info("Amp Data Request")
-        return self.amp_vm.get_data()
+        return self.amp_vm.get_data(fmt, is_packed)
+
+    def zerorpc_set_amp_avg_count(self, avg_count: int):
+        """
+        Set the number of ensembles averaged in the amplitude profile.
+        :param avg_count: Number of ensembles to average.  1 for the latest ensemble only.
+        :return:
+        """
+        logging.info("Set Amp Average Count: " + str(avg_count))
+        self.amp_vm.set_avg_count(avg_count)
 
-    def zerorpc_shiptrack_plot(self, subsystem: int):
+    def zerorpc_shiptrack_plot(self, subsystem: int, is_quiver_text: bool = True, fmt: str = "list", is_packed: bool = False):
         """
         Get the latest ship track data.
         :param subsystem: Subsystem number.
+        :param is_quiver_text: Include the hover text of the quivers.
+        :param fmt: list for lists of values or binary for little-endian typed array buffers.
+        :param is_packed: Get the response encoded with msgpack.  The encoded response is reused until the data changes.
         :return:
         """
         logging.info("Ship Track Data Request")
-        return self.shiptrack_vm.get_data()
+        return self.shiptrack_vm.get_data(is_quiver_text, fmt, is_packed)
 
-    def zerorpc_contour_plot(self, contour_type: str):
+    def zerorpc_set_shiptrack_options(self, tolerance: float, quiver_spacing: float, is_spill: bool):
+        """
+        Set the ship track options.
+        :param tolerance: Largest distance in meters a point can be from the simplified track.
+        :param quiver_spacing: Size in meters of the grid cell for each quiver.  0 to keep every quiver.
+        :param is_spill: Write the full resolution track to a file.
+        :return:
+        """
+        logging.info("Set Ship Track Options: Tolerance: " + str(tolerance) + " Quiver Spacing: " + str(quiver_spacing) + " Spill: " + str(is_spill))
+        self.shiptrack_vm.set_options(tolerance, quiver_spacing, is_spill)
+
+    def zerorpc_set_shiptrack_model(self, model: str):
+        """
+        Set the geodesic model used to calculate the quivers.
+        :param model: enu for a local tangent plane or spherical for a great circle.
+        :return:
+        """
+        logging.info("Set Ship Track Model: " + str(model))
+        self.shiptrack_vm.set_model(model)
+
+    def zerorpc_contour_plot(self, contour_type: str, max_points: int = 0, method: str = "mean", fmt: str = "list", is_packed: bool = False):
         """
         Get the latest amplitude data.
         Contour Types:
@@ -105,10 +391,54 @@ class ZeroRpcManager:
         amp, ampBeam0, ampBeam1, ampBeam2, ampBeam3, ampVert
         corr
         :param contour_type: Contour type.
+        :param max_points: Maximum number of ensembles to send.  The ensembles are combined in buckets.  0 for all the ensembles.
+        :param method: How to combine the ensembles in a bucket: mean, min or max.
+        :param fmt: list for lists of values or binary for little-endian typed array buffers.
+        :param is_packed: Get the response encoded with msgpack.  The encoded response is reused until the data changes.
         :return:
         """
         logging.info("Contour Data Request")
-        return self.contour_vm.get_data("mag")
+        return self.contour_vm.get_data(contour_type, max_points, method, fmt, is_packed)
+
+    def zerorpc_contour_plot_since(self, contour_type: str, since_seq: int):
+        """
+        Get only the contour data added since the last request.
+        Pass the "seq" value from the last response.  If "isReset" is
+        set in the response, replace the plot data instead of adding to it.
+        :param contour_type: Contour type.
+        :param since_seq: Sequence number from the last response.  0 for all the data.
+        :return:
+        """
+        logging.info("Contour Data Request Since: " + str(since_seq))
+        return self.contour_vm.get_data_since(contour_type, since_seq)
+
+    def zerorpc_contour_range(self, start_time: str, end_time: str, width: int, contour_type: str = "mag", method: str = "mean"):
+        """
+        Get the contour for the time range with about one column for each pixel.
+        Used to zoom and pan the contour plot.  Combined ensembles are used
+        when there are more ensembles than pixels.
+        :param start_time: Start time as an ISO format string.
+        :param end_time: End time as an ISO format string.
+        :param width: Width of the plot in pixels.
+        :param contour_type: Contour type.
+        :param method: mean or max of the ensembles combined in a column.
+        :return:
+        """
+        logging.info("Contour Range Request: " + str(start_time) + " - " + str(end_time) + " Width: " + str(width))
+        return self.contour_vm.get_range(contour_type,
+                                         EnsembleValues.to_microseconds(datetime.datetime.fromisoformat(start_time)),
+                                         EnsembleValues.to_microseconds(datetime.datetime.fromisoformat(end_time)),
+                                         width,
+                                         method)
+
+    def zerorpc_set_contour_max_ens(self, max_ens: int):
+        """
+        Set the number of the latest ensembles to display in the contour plot.
+        :param max_ens: Maximum ensembles to display.
+        :return:
+        """
+        logging.info("Set Contour Max Ensembles: " + str(max_ens))
+        self.contour_vm.set_max_ens(max_ens)
 
     def zerorpc_set_timeseries_options(self,
                                        is_boat_speed: bool,
@@ -165,13 +495,121 @@ class ZeroRpcManager:
         logging.info("Time Series Options Request")
         return self.timeseries_vm.get_options()
 
-    def zerorpc_timeseries_plot(self):
+    def zerorpc_timeseries_plot(self, max_points: int = 0, fmt: str = "list", is_packed: bool = False):
         """
         Get the latest TimeSeries data.
+        :param max_points: Maximum number of points to send.  The points are selected with LTTB.  0 for all the points.
+        :param fmt: list for lists of values or binary for little-endian typed array buffers.
+        :param is_packed: Get the response encoded with msgpack.  The encoded response is reused until the data changes.
         :return:
         """
         logging.info("Time Series Data Request")
-        return self.timeseries_vm.get_data()
+        return self.timeseries_vm.get_data(max_points, fmt, is_packed)
+
+    def zerorpc_timeseries_plot_since(self, since_seq: int):
+        """
+        Get only the TimeSeries data added since the last request.
+        Pass the "seq" value from the last response.  If "isReset" is
+        set in the response, replace the plot data instead of adding to it.
+        Remove the oldest data past "maxEns".
+        :param since_seq: Sequence number from the last response.  0 for all the data.
+        :return:
+        """
+        logging.info("Time Series Data Request Since: " + str(since_seq))
+        return self.timeseries_vm.get_data_since(since_seq)
+
+    @zerorpc.stream
+    def zerorpc_subscribe(self, views, max_rate_hz: float = Subscription.DEFAULT_RATE_HZ, fmt: str = "list", is_packed: bool = False):
+        """
+        Stream the updates of the views instead of polling the plot methods.
+        An update is only sent when the data of a view changed.  It has
+        "views" with the data of only the changed views, "seq", the "versions"
+        of the views and the number of versions "dropped" because the
+        subscriber was slower than the data.
+
+        Views: tabular, amp, contour, shiptrack, timeseries, terminal
+        The views can be a list of names, or a dictionary of names and options:
+        contour: contour_type, max_points, method
+        timeseries: max_points
+        shiptrack: is_quiver_text
+        :param views: List of view names or dictionary of view names and options.
+        :param max_rate_hz: Most updates sent each second.
+        :param fmt: list for lists of values or binary for little-endian typed array buffers.
+        :param is_packed: Send the data of each view encoded with msgpack.  The encoded data is shared by all the subscribers.
+        :return: Stream of the updates.
+        """
+        logging.info("Subscribe: " + str(views) + " Rate: " + str(max_rate_hz))
+        return Subscription(self.get_subscription_views(views, fmt, is_packed), max_rate_hz).updates()
+
+    def zerorpc_get_views(self, versions: dict, options: dict = None, fmt: str = "list", is_packed: bool = False):
+        """
+        Get all the views in one request.  Only the views whose version
+        changed since the last request are returned, so a refresh when
+        nothing changed only checks the versions.  Pass the "versions"
+        from the last response.
+
+        Views: tabular, amp, contour, shiptrack, timeseries, terminal
+        :param versions: Dictionary of the view names and the version from the last response.  None to get the view.
+        :param options: Dictionary of the view names and the plot options.  See zerorpc_subscribe().
+        :param fmt: list for lists of values or binary for little-endian typed array buffers.
+        :param is_packed: Get the data of each view encoded with msgpack.  The encoded data is reused until the view changes.
+        :return: "views" with the data of the changed views and "versions" of all the views.
+        """
+        logging.debug("Get Views: " + str(versions))
+        options = options or {}
+        views = self.get_subscription_views({name: options.get(name) for name in versions}, fmt, is_packed)
+
+        result = {"views": {}, "versions": {}}
+        for name, (get_version, get_data) in views.items():
+            # Get the version first, so a change while the data is built is sent again
+            version = get_version()
+            if version != versions[name]:
+                result["views"][name] = get_data()
+            result["versions"][name] = version
+
+        return result
+
+    def get_subscription_views(self, views, fmt: str, is_packed: bool = False):
+        """
+        Get the version and data functions of the subscribed views.
+        :param views: List of view names or dictionary of view names and options.
+        :param fmt: Format of the values, list or binary.
+        :param is_packed: Get the data encoded with msgpack.
+        :return: Dictionary of the view name and a (get_version, get_data) tuple of functions.
+        """
+        if not isinstance(views, dict):
+            views = {name: {} for name in views}
+
+        sub_views = {}
+        for name, options in views.items():
+            options = options or {}
+            if name == ZeroRpcManager.VIEW_TABULAR:
+                sub_views[name] = (self.tabular_vm.get_version, partial(self.tabular_vm.get_data, is_packed))
+            elif name == ZeroRpcManager.VIEW_AMP:
+                sub_views[name] = (self.amp_vm.get_version, partial(self.amp_vm.get_data, fmt, is_packed))
+            elif name == ZeroRpcManager.VIEW_CONTOUR:
+                sub_views[name] = (self.contour_vm.get_version, partial(self.contour_vm.get_data,
+                                                                        options.get("contour_type", "mag"),
+                                                                        options.get("max_points", 0),
+                                                                        options.get("method", "mean"),
+                                                                        fmt,
+                                                                        is_packed))
+            elif name == ZeroRpcManager.VIEW_SHIPTRACK:
+                sub_views[name] = (self.shiptrack_vm.get_version, partial(self.shiptrack_vm.get_data,
+                                                                          options.get("is_quiver_text", True),
+                                                                          fmt,
+                                                                          is_packed))
+            elif name == ZeroRpcManager.VIEW_TIMESERIES:
+                sub_views[name] = (self.timeseries_vm.get_version, partial(self.timeseries_vm.get_data,
+                                                                           options.get("max_points", 0),
+                                                                           fmt,
+                                                                           is_packed))
+            elif name == ZeroRpcManager.VIEW_TERMINAL:
+                sub_views[name] = (self.adcp_terminal.get_version, partial(self.adcp_terminal.get_data, is_packed))
+            else:
+                logging.error("Unknown view: " + str(name))
+
+        return sub_views
 
     def zerorpc_reset_plots(self, subsystem: int):
         """
@@ -198,13 +636,14 @@ class ZeroRpcManager:
         logging.info("ADCP Terminal Comm Port List Request")
         return self.adcp_terminal.comm_port_list()
 
-    def zerorpc_adcp_terminal(self):
+    def zerorpc_adcp_terminal(self, is_packed: bool = False):
         """
         Get the terminal data.
+        :param is_packed: Get the response encoded with msgpack.  The encoded response is reused until the data changes.
         :return: Baud rate list.
         """
         logging.info("ADCP Terminal Data Request")
-        return self.adcp_terminal.get_data()
+        return self.adcp_terminal.get_data(is_packed)
 
     def zerorpc_connect_adcp_serial_port(self, comm_port: str, baud: int):
         """